@@ -0,0 +1,47 @@
+"""daily tasks json column
+
+Revision ID: 0004_daily_tasks_json
+Revises: 0003_quests_tables
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_daily_tasks_json"
+down_revision: Union[str, None] = "0003_quests_tables"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("daily_progress", sa.Column("tasks", sa.JSON(), nullable=True))
+
+    # tasks_json всегда записывался через json.dumps, поэтому строку можно перенести как есть:
+    # в Postgres через приведение к json, в SQLite JSON и так хранится текстом.
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("UPDATE daily_progress SET tasks = tasks_json::json")
+    else:
+        op.execute("UPDATE daily_progress SET tasks = tasks_json")
+
+    with op.batch_alter_table("daily_progress") as batch_op:
+        batch_op.alter_column("tasks", existing_type=sa.JSON(), nullable=False)
+        batch_op.drop_column("tasks_json")
+
+
+def downgrade() -> None:
+    op.add_column("daily_progress", sa.Column("tasks_json", sa.String(length=4000), nullable=True))
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("UPDATE daily_progress SET tasks_json = tasks::text")
+    else:
+        op.execute("UPDATE daily_progress SET tasks_json = tasks")
+
+    with op.batch_alter_table("daily_progress") as batch_op:
+        batch_op.alter_column("tasks_json", existing_type=sa.String(length=4000), nullable=False)
+        batch_op.drop_column("tasks")
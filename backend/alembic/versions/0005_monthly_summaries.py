@@ -0,0 +1,46 @@
+"""monthly summaries
+
+Revision ID: 0005_monthly_summaries
+Revises: 0004_daily_tasks_json
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_monthly_summaries"
+down_revision: Union[str, None] = "0004_daily_tasks_json"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "monthly_summaries",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("month_key", sa.String(length=7), nullable=False),
+        sa.Column("days_recorded", sa.Integer(), nullable=False),
+        sa.Column("login_bonus_days", sa.Integer(), nullable=False),
+        sa.Column("chests_claimed", sa.Integer(), nullable=False),
+        sa.Column("tasks_completed", sa.Integer(), nullable=False),
+        sa.Column("rewards_count", sa.Integer(), nullable=False),
+        sa.Column("xp_gained", sa.Integer(), nullable=False),
+        sa.Column("coins_gained", sa.Integer(), nullable=False),
+        sa.Column("intelligence_gained", sa.Integer(), nullable=False),
+        sa.Column("crystals_gained", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "month_key", name="uq_monthly_summary_user_month"),
+    )
+    op.create_index("ix_monthly_summaries_user_id", "monthly_summaries", ["user_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_monthly_summaries_user_id", table_name="monthly_summaries")
+    op.drop_table("monthly_summaries")
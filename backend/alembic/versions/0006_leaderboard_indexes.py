@@ -0,0 +1,40 @@
+"""leaderboard indexes
+
+Revision ID: 0006_leaderboard_indexes
+Revises: 0005_monthly_summaries
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_leaderboard_indexes"
+down_revision: Union[str, None] = "0005_monthly_summaries"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Равные счета упорядочиваются как в Redis (ZREVRANGE): user_id по убыванию
+    op.create_index(
+        "ix_pet_states_leaderboard_wealth",
+        "pet_states",
+        [sa.text("coins DESC"), sa.text("user_id DESC"), "level", "name"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_pet_states_leaderboard_level",
+        "pet_states",
+        [sa.text("level DESC"), sa.text("xp DESC"), sa.text("user_id DESC"), "coins", "name"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pet_states_leaderboard_level", table_name="pet_states")
+    op.drop_index("ix_pet_states_leaderboard_wealth", table_name="pet_states")
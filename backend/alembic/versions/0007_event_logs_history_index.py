@@ -0,0 +1,34 @@
+"""event logs history index
+
+Revision ID: 0007_event_logs_history_index
+Revises: 0006_leaderboard_indexes
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_event_logs_history_index"
+down_revision: Union[str, None] = "0006_leaderboard_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_event_logs_user_created",
+        "event_logs",
+        ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        unique=False,
+    )
+    op.drop_index("ix_event_logs_user_id", table_name="event_logs")
+
+
+def downgrade() -> None:
+    op.create_index("ix_event_logs_user_id", "event_logs", ["user_id"], unique=False)
+    op.drop_index("ix_event_logs_user_created", table_name="event_logs")
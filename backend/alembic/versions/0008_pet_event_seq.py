@@ -0,0 +1,29 @@
+"""pet event sequence
+
+Revision ID: 0008_pet_event_seq
+Revises: 0007_event_logs_history_index
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_pet_event_seq"
+down_revision: Union[str, None] = "0007_event_logs_history_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Старые записи журнала содержат полный "stats", поэтому счёт можно начать с нуля
+    op.add_column("pet_states", sa.Column("event_seq", sa.Integer(), server_default="0", nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("pet_states") as batch_op:
+        batch_op.drop_column("event_seq")
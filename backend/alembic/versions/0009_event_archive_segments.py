@@ -0,0 +1,39 @@
+"""event archive segments
+
+Revision ID: 0009_event_archive_segments
+Revises: 0008_pet_event_seq
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_event_archive_segments"
+down_revision: Union[str, None] = "0008_pet_event_seq"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "event_archive_segments",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("month_key", sa.String(length=7), nullable=False),
+        sa.Column("segment", sa.String(length=128), nullable=False),
+        sa.Column("events", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "segment", name="uq_event_archive_user_segment"),
+    )
+    op.create_index("ix_event_archive_segments_user_id", "event_archive_segments", ["user_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_event_archive_segments_user_id", table_name="event_archive_segments")
+    op.drop_table("event_archive_segments")
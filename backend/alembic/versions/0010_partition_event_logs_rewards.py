@@ -0,0 +1,135 @@
+"""partition event_logs and rewards by month
+
+Строки старой таблицы копируются помесячно, каждый месяц в своей транзакции: нет одной
+многочасовой транзакции, которая держит WAL и мешает VACUUM. Если миграция прервалась,
+повторный запуск продолжит копирование (ON CONFLICT DO NOTHING). Секция DEFAULT
+принимает строки вне помесячных секций, а maintain_partitions сообщает, если она не пуста.
+
+Revision ID: 0010_partition_logs_rewards
+Revises: 0009_event_archive_segments
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from datetime import UTC, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010_partition_logs_rewards"
+down_revision: Union[str, None] = "0009_event_archive_segments"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Секций вперёд при миграции; дальше их создаёт maintain_partitions
+MONTHS_AHEAD = 3
+# Таблица -> индексы (имя, выражение), кроме первичного ключа
+TABLES = {
+    "event_logs": [("ix_event_logs_user_created", "user_id, created_at DESC, id DESC")],
+    "rewards": [("ix_rewards_user_id", "user_id")],
+}
+
+
+def _add_months(start: datetime, months: int) -> datetime:
+    index = start.year * 12 + start.month - 1 + months
+    return start.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _exists(name: str) -> bool:
+    return op.get_bind().execute(sa.text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+
+def _partition(table: str) -> None:
+    legacy = f"{table}_legacy"
+    if _exists(legacy):
+        # Прошлый запуск успел создать секции и упал на копировании
+        return
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    op.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey")
+    for name, _ in TABLES[table]:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_legacy")
+    # Отвязываем последовательность id, иначе DROP старой таблицы удалит и её
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+    # Ключ секционирования обязан входить в первичный ключ
+    op.execute(f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)")
+    for name, columns in TABLES[table]:
+        op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    oldest = op.get_bind().execute(sa.text(f"SELECT min(created_at) FROM {legacy}")).scalar()
+    now = datetime.now(UTC)
+    start = (oldest or now).astimezone(UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last = _add_months(now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), MONTHS_AHEAD)
+    while start <= last:
+        end = _add_months(start, 1)
+        op.execute(
+            f"CREATE TABLE {table}_p{start.year:04d}_{start.month:02d} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+
+
+def _copy_legacy(table: str) -> None:
+    """Перенести строки старой таблицы по месяцу за раз и удалить её; вызывается в autocommit_block."""
+    legacy = f"{table}_legacy"
+    if not _exists(legacy):
+        return
+    bind = op.get_bind()
+    bounds = bind.execute(sa.text(f"SELECT min(created_at), max(created_at) FROM {legacy}")).one()
+    if bounds[0] is not None:
+        start = bounds[0].astimezone(UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        while start <= bounds[1]:
+            end = _add_months(start, 1)
+            bind.execute(
+                sa.text(
+                    f"INSERT INTO {table} SELECT * FROM {legacy} WHERE created_at >= :start AND created_at < :end "
+                    "ON CONFLICT (id, created_at) DO NOTHING"
+                ),
+                {"start": start, "end": end},
+            )
+            start = end
+    op.execute(f"DROP TABLE {legacy}")
+
+
+def _unpartition(table: str) -> None:
+    partitioned = f"{table}_partitioned"
+    op.execute(f"ALTER TABLE {table} RENAME TO {partitioned}")
+    op.execute(f"ALTER TABLE {partitioned} RENAME CONSTRAINT {table}_pkey TO {partitioned}_pkey")
+    for name, _ in TABLES[table]:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_partitioned")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+    op.execute(f"CREATE TABLE {table} (LIKE {partitioned} INCLUDING DEFAULTS)")
+    op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+    for name, columns in TABLES[table]:
+        op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+    op.execute(f"INSERT INTO {table} SELECT * FROM {partitioned}")
+    # Секции удаляются вместе с секционированной таблицей
+    op.execute(f"DROP TABLE {partitioned}")
+
+
+def upgrade() -> None:
+    # На SQLite секций нет: таблицы остаются обычными, старые строки удаляются пачками
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for table in TABLES:
+        _partition(table)
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            _copy_legacy(table)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for table in TABLES:
+        _unpartition(table)
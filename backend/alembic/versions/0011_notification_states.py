@@ -0,0 +1,38 @@
+"""notification states
+
+Revision ID: 0011_notification_states
+Revises: 0010_partition_logs_rewards
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011_notification_states"
+down_revision: Union[str, None] = "0010_partition_logs_rewards"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "notification_states",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("condition", sa.String(length=32), nullable=False),
+        sa.Column("message", sa.String(length=128), nullable=False),
+        sa.Column("last_sent_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "condition", name="uq_notification_state_user_condition"),
+    )
+    op.create_index("ix_notification_states_user_id", "notification_states", ["user_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_notification_states_user_id", table_name="notification_states")
+    op.drop_table("notification_states")
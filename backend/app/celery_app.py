@@ -18,16 +18,40 @@ celery_app.conf.timezone = "UTC"
 celery_app.conf.beat_schedule = {
     "decay-tick-every-10-min": {
         "task": "app.tasks.decay_all_pets",
-        "schedule": 600.0,
+        "schedule": float(settings.decay_interval_seconds),
     },
     "soft-push-every-20-min": {
         "task": "app.tasks.soft_push_notifications",
         "schedule": 1200.0,
     },
+    "deliver-notifications-every-minute": {
+        "task": "app.tasks.deliver_notifications",
+        "schedule": 60.0,
+    },
     "daily-report-at-7-utc": {
         "task": "app.tasks.daily_report",
         "schedule": crontab(hour=7, minute=0),
     },
+    "provision-daily-progress-before-midnight-utc": {
+        "task": "app.tasks.provision_next_day_progress",
+        "schedule": crontab(hour=23, minute=40),
+    },
+    "refresh-leaderboard-snapshots": {
+        "task": "app.tasks.refresh_leaderboard_snapshots",
+        "schedule": float(settings.leaderboard_snapshot_interval_seconds),
+    },
+    "maintain-partitions-at-2-utc": {
+        "task": "app.tasks.maintain_table_partitions",
+        "schedule": crontab(hour=2, minute=45),
+    },
+    "rollup-old-history-at-3-utc": {
+        "task": "app.tasks.rollup_old_history",
+        "schedule": crontab(hour=3, minute=30),
+    },
+    "archive-old-events-at-4-utc": {
+        "task": "app.tasks.archive_old_events",
+        "schedule": crontab(hour=4, minute=0),
+    },
 }
 
 celery_app.autodiscover_tasks(["app"])
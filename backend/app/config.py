@@ -15,6 +15,10 @@ class Settings(BaseSettings):
     redis_url: str = "redis://redis:6379/0"
     celery_broker_url: str = "redis://redis:6379/0"
     celery_result_backend: str = "redis://redis:6379/1"
+    # redis — общие таблицы лидеров в REDIS_URL (прод); memory — в памяти процесса,
+    # только dev и тесты с одним процессом: воркеры и Celery не видят изменений друг друга
+    leaderboard_backend: str = "memory"
+    leaderboard_snapshot_interval_seconds: int = 15
 
     telegram_bot_token: str = ""
     telegram_auth_max_age_seconds: int = 86400
@@ -22,6 +26,44 @@ class Settings(BaseSettings):
     dev_auth_user_id: int = 10001
 
     decay_cap_seconds: int = 21600
+    # Период beat-задачи decay_all_pets; его же шагом распад повторяется при восстановлении
+    decay_interval_seconds: int = 600
+    decay_chunk_size: int = 500
+    # redis — аренда beat-обходов в REDIS_URL (с откатом на блокировку базы); database — только блокировка базы
+    sweep_lock_backend: str = "database"
+    sweep_lease_seconds: int = 300
+    sweep_maintenance_lease_seconds: int = 3600
+    daily_provision_active_days: int = 7
+    daily_provision_chunk_size: int = 1000
+    retention_daily_progress_days: int = 90
+    retention_rewards_days: int = 90
+    retention_batch_size: int = 1000
+    event_snapshot_interval: int = 20
+    # sync — журнал пишется в транзакции запроса; buffered — фоновой пачкой (только PostgreSQL)
+    event_writer_mode: str = "sync"
+    event_writer_flush_ms: int = 20
+    event_writer_batch_size: int = 500
+    event_writer_id_block: int = 1000
+    event_writer_spill_dir: str = "event_spill"
+    event_archive_dir: str = "event_archive"
+    event_archive_after_days: int = 180
+    event_archive_user_range: int = 10000
+    event_archive_batch_size: int = 1000
+    partition_months_ahead: int = 3
+    notification_chunk_size: int = 1000
+    notification_cooldown_hours: int = 12
+    daily_report_user_range: int = 50000
+    # Доставка уведомлений в Telegram через notification_outbox
+    notification_outbox_enabled: bool = False
+    notification_delivery_batch_size: int = 200
+    notification_delivery_concurrency: int = 4
+    # Лимит на бота; делится между NOTIFICATION_DELIVERY_WORKERS процессами доставки
+    notification_rate_per_second: float = 25.0
+    notification_delivery_workers: int = 1
+    notification_max_attempts: int = 5
+    notification_retry_base_seconds: int = 30
+    notification_lease_seconds: int = 120
+    notification_outbox_keep_days: int = 7
     cors_allow_origins: str = (
         "http://localhost,http://localhost:5173,http://127.0.0.1:5173,"
         "http://localhost:4173,http://127.0.0.1:4173,http://localhost:4280,http://127.0.0.1:4280,"
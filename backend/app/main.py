@@ -1,12 +1,26 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import get_settings
 from app.routers import auth, game
+from app.services.event_writer import shutdown_event_writer, start_event_writer
 
 
 settings = get_settings()
-app = FastAPI(title=settings.app_name)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    start_event_writer()
+    yield
+    # Дописать накопленные в буфере события до остановки процесса
+    shutdown_event_writer()
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
 allow_origins = [origin.strip() for origin in settings.cors_allow_origins.split(",") if origin.strip()]
 app.add_middleware(
@@ -18,7 +32,6 @@ app.add_middleware(
 )
 
 
-
 @app.get("/health")
 def health() -> dict[str, str]:
     return {"status": "ok"}
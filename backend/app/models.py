@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import JSON, Boolean, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy import JSON, Boolean, DateTime, Index, Integer, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database import Base
@@ -51,6 +51,8 @@ class PetState(Base):
     # Events System
     last_event_check: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
     event_history: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    # Число записей питомца в event_logs: по нему раз в K событий пишется полный снимок
+    event_seq: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
 
     last_active_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
     last_tick_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
@@ -60,16 +62,41 @@ class PetState(Base):
     )
 
 
+# Покрывающие индексы таблиц лидеров: top-N читается из индекса без сортировки и без обращения к таблице
+Index(
+    "ix_pet_states_leaderboard_wealth",
+    PetState.coins.desc(),
+    PetState.user_id.desc(),
+    PetState.level,
+    PetState.name,
+)
+Index(
+    "ix_pet_states_leaderboard_level",
+    PetState.level.desc(),
+    PetState.xp.desc(),
+    PetState.user_id.desc(),
+    PetState.coins,
+    PetState.name,
+)
+
+
 class EventLog(Base):
+    # На PostgreSQL таблица секционирована по месяцам created_at (миграция 0010,
+    # services/partitions), первичный ключ там (id, created_at)
     __tablename__ = "event_logs"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    # Индекс по user_id не нужен: его покрывает префикс ix_event_logs_user_created
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
     action: Mapped[str] = mapped_column(String(64), nullable=False)
     payload: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
 
 
+# История игрока читается страницами от новых к старым по ключу (created_at, id)
+Index("ix_event_logs_user_created", EventLog.user_id, EventLog.created_at.desc(), EventLog.id.desc())
+
+
 class Inventory(Base):
     __tablename__ = "inventories"
     __table_args__ = (UniqueConstraint("user_id", "item_key", name="uq_inventory_user_item"),)
@@ -84,6 +111,7 @@ class Inventory(Base):
 
 
 class Reward(Base):
+    # Секционирована по месяцам так же, как event_logs
     __tablename__ = "rewards"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -106,7 +134,7 @@ class DailyProgress(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
     date_key: Mapped[str] = mapped_column(String(16), nullable=False)
-    tasks_json: Mapped[str] = mapped_column(String(4000), nullable=False)
+    tasks: Mapped[list] = mapped_column(JSON, default=list, nullable=False)
     login_bonus_claimed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     chest_claimed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(
@@ -126,6 +154,56 @@ class NotificationSettings(Base):
     )
 
 
+class NotificationState(Base):
+    """Последнее мягкое уведомление игрока по условию (показателю ниже порога)."""
+
+    __tablename__ = "notification_states"
+    __table_args__ = (UniqueConstraint("user_id", "condition", name="uq_notification_state_user_condition"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    condition: Mapped[str] = mapped_column(String(32), nullable=False)
+    message: Mapped[str] = mapped_column(String(128), nullable=False)
+    last_sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class NotificationOutbox(Base):
+    """Уведомление, ожидающее доставки в Telegram."""
+
+    __tablename__ = "notification_outbox"
+    __table_args__ = (Index("ix_notification_outbox_due", "status", "next_attempt_at"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    # pending — ждёт отправки, sent — доставлено, failed — попытки исчерпаны или ошибка постоянная
+    status: Mapped[str] = mapped_column(String(16), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class SweepCheckpoint(Base):
+    """Докуда дошёл последний запуск beat-обхода (последний user_id завершённой пачки)."""
+
+    __tablename__ = "sweep_checkpoints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    # Запуски с другим ключом (например, другой день отчётов) не продолжают чужой обход
+    run_key: Mapped[str] = mapped_column(String(32), default="", nullable=False)
+    cursor: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
 class StreakState(Base):
     __tablename__ = "streak_states"
 
@@ -218,4 +296,45 @@ class QuestProgress(Base):
 
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False
-    )
\ No newline at end of file
+    )
+
+class MonthlySummary(Base):
+    __tablename__ = "monthly_summaries"
+    __table_args__ = (UniqueConstraint("user_id", "month_key", name="uq_monthly_summary_user_month"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    month_key: Mapped[str] = mapped_column(String(7), nullable=False)
+
+    # Свёртка daily_progress
+    days_recorded: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    login_bonus_days: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    chests_claimed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    tasks_completed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    # Свёртка rewards
+    rewards_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    xp_gained: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    coins_gained: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    intelligence_gained: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    crystals_gained: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False
+    )
+
+
+class EventArchiveSegment(Base):
+    """Какие архивные сегменты журнала содержат события игрока."""
+
+    __tablename__ = "event_archive_segments"
+    __table_args__ = (UniqueConstraint("user_id", "segment", name="uq_event_archive_user_segment"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    month_key: Mapped[str] = mapped_column(String(7), nullable=False)
+    segment: Mapped[str] = mapped_column(String(128), nullable=False)
+    events: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False
+    )
@@ -1,12 +1,13 @@
+from email.utils import format_datetime
 from typing import Annotated, Literal
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import desc, select
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
 
+from app.config import get_settings
 from app.database import get_db
 from app.deps import get_current_user_id
-from app.models import EventLog, PetState
 from app.schemas import (
     AchievementClaimRequest,
     AchievementStateOut,
@@ -15,6 +16,7 @@ from app.schemas import (
     DailyTaskOut,
     EventLogOut,
     InventoryOut,
+    ItemsBulkRequest,
     LiveEventStateOut,
     MinigameResultRequest,
     MinigameResultResponse,
@@ -22,15 +24,19 @@ from app.schemas import (
     RewardOut,
     ShopBuyRequest,
     ShopBuyResponse,
+    ShopBulkBuyResponse,
+    ShopPurchaseOut,
     ShopCatalogOut,
-    ShopItemOut,
     StreakStateOut,
     QuestClaimRequest,
     QuestOut,
     LeaderboardEntryOut,
+    LeaderboardMeOut,
+    LeaderboardPageOut,
 )
 from app.services.game import (
     buy_shop_item,
+    buy_shop_items,
     claim_active_event_for_pet,
     claim_achievement_for_pet,
     claim_quest_step_for_pet,
@@ -43,12 +49,22 @@ from app.services.game import (
     get_achievements_state,
     get_daily_state,
     get_inventory,
-    get_shop_catalog,
+    get_shop_catalog_json,
     get_quests_state,
     get_streak_state,
     run_decay,
     serialize_pet_state,
     use_item,
+    use_items,
+)
+from app.services.history import history_page, history_payload, stats_for_rows
+from app.services.leaderboard import (
+    SNAPSHOT_SIZE,
+    LeaderboardUnavailable,
+    get_snapshot,
+    neighbourhood,
+    page_entries,
+    parse_bracket,
 )
 
 
@@ -218,28 +234,17 @@ def daily_claim_chest(db: DbDep, user_id: UserDep) -> ActionResponse:
 
 
 @router.get("/shop/catalog", response_model=ShopCatalogOut)
-def shop_catalog(db: DbDep, user_id: UserDep) -> ShopCatalogOut:
+def shop_catalog(db: DbDep, user_id: UserDep) -> Response:
+    # Товары уровня закодированы заранее, в запросе дописывается только owned
     pet = ensure_pet_state(db, user_id)
-    items = [
-        ShopItemOut(
-            item_key=item["item_key"],
-            title=item["title"],
-            section=item["section"],
-            base_price=item["base_price"],
-            price=item["price"],
-            level_required=item["level_required"],
-            owned=item["owned"],
-        )
-        for item in get_shop_catalog(db, pet)
-    ]
-    return ShopCatalogOut(items=items)
+    return Response(content=get_shop_catalog_json(db, pet), media_type="application/json")
 
 
 @router.post("/shop/buy", response_model=ShopBuyResponse)
 def shop_buy(payload: ShopBuyRequest, db: DbDep, user_id: UserDep) -> ShopBuyResponse:
     pet = ensure_pet_state(db, user_id)
     try:
-        result = buy_shop_item(db, pet, payload.item_key)
+        result = buy_shop_item(db, pet, payload.item_key, payload.quantity)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     return ShopBuyResponse(
@@ -252,15 +257,48 @@ def shop_buy(payload: ShopBuyRequest, db: DbDep, user_id: UserDep) -> ShopBuyRes
         ),
         item_key=result.item_key,
         price=result.price,
+        quantity=result.quantity,
+        total_price=result.total_price,
+    )
+
+
+@router.post("/shop/buy-bulk", response_model=ShopBulkBuyResponse)
+def shop_buy_bulk(payload: ItemsBulkRequest, db: DbDep, user_id: UserDep) -> ShopBulkBuyResponse:
+    pet = ensure_pet_state(db, user_id)
+    try:
+        result = buy_shop_items(db, pet, [(row.item_key, row.quantity) for row in payload.items])
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return ShopBulkBuyResponse(
+        state=PetStateOut(**serialize_pet_state(result.pet)),
+        event=EventLogOut(
+            id=result.event.id,
+            action=result.event.action,
+            payload=result.event.payload,
+            created_at=result.event.created_at,
+        ),
+        items=[ShopPurchaseOut(**line) for line in result.items],
+        total_price=result.total_price,
     )
 
 
 @router.get("/history", response_model=list[EventLogOut])
-def history(db: DbDep, user_id: UserDep, limit: int = Query(default=30, ge=1, le=200)) -> list[EventLogOut]:
-    rows = db.execute(
-        select(EventLog).where(EventLog.user_id == user_id).order_by(desc(EventLog.created_at)).limit(limit)
-    ).scalars()
-    return [EventLogOut(id=row.id, action=row.action, payload=row.payload, created_at=row.created_at) for row in rows]
+def history(
+    response: Response,
+    db: DbDep,
+    user_id: UserDep,
+    limit: int = Query(default=30, ge=1, le=200),
+    before: str | None = Query(default=None, description="Курсор из заголовка X-Next-Before предыдущей страницы"),
+    with_stats: bool = Query(default=False, description="Восстановить полное состояние питомца после каждого события"),
+) -> list[EventLogOut]:
+    try:
+        rows, next_before = history_page(db, user_id, limit, before)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if next_before is not None:
+        response.headers["X-Next-Before"] = next_before
+    stats = stats_for_rows(db, user_id, rows) if with_stats else {}
+    return [EventLogOut(**history_payload(row, stats.get(row.id))) for row in rows]
 
 
 @router.get("/inventory", response_model=list[InventoryOut])
@@ -275,7 +313,7 @@ def use_item_endpoint(payload: ShopBuyRequest, db: DbDep, user_id: UserDep) -> A
     """Использовать предмет из инвентаря"""
     pet = ensure_pet_state(db, user_id)
     try:
-        result = use_item(db, pet, payload.item_key)
+        result = use_item(db, pet, payload.item_key, payload.quantity)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     
@@ -288,7 +326,30 @@ def use_item_endpoint(payload: ShopBuyRequest, db: DbDep, user_id: UserDep) -> A
             created_at=result.event.created_at,
         ),
         reward=_to_reward_out(result.reward),
-        daily=_to_daily_out(get_daily_state(db, user_id)),
+        daily=_to_daily_out(result.event.payload.get("daily", {})),
+        notifications=result.notifications,
+    )
+
+
+@router.post("/use-items", response_model=ActionResponse)
+def use_items_endpoint(payload: ItemsBulkRequest, db: DbDep, user_id: UserDep) -> ActionResponse:
+    """Использовать несколько предметов из инвентаря за один запрос"""
+    pet = ensure_pet_state(db, user_id)
+    try:
+        result = use_items(db, pet, [(row.item_key, row.quantity) for row in payload.items])
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    return ActionResponse(
+        state=PetStateOut(**serialize_pet_state(result.pet)),
+        event=EventLogOut(
+            id=result.event.id,
+            action=result.event.action,
+            payload=result.event.payload,
+            created_at=result.event.created_at,
+        ),
+        reward=_to_reward_out(result.reward),
+        daily=_to_daily_out(result.event.payload.get("daily", {})),
         notifications=result.notifications,
     )
 
@@ -386,20 +447,61 @@ def quests_claim(payload: QuestClaimRequest, db: DbDep, user_id: UserDep) -> Act
     )
 
 @router.get("/leaderboard", response_model=list[LeaderboardEntryOut])
-def leaderboard(db: DbDep, type: Literal["wealth", "level"] = "wealth", limit: int = Query(default=100, ge=1, le=100)) -> list[LeaderboardEntryOut]:
-    if type == "wealth":
-        rows = db.execute(select(PetState).order_by(desc(PetState.coins)).limit(limit)).scalars()
-    else:
-        rows = db.execute(select(PetState).order_by(desc(PetState.level), desc(PetState.xp)).limit(limit)).scalars()
-        
-    return [
-        LeaderboardEntryOut(
-            user_id=row.user_id,
-            name=row.name,
-            level=row.level,
-            coins=row.coins,
-            rank=idx + 1
-        )
-        for idx, row in enumerate(rows)
-    ]
+def leaderboard(db: DbDep, type: Literal["wealth", "level"] = "wealth", limit: int = Query(default=100, ge=1, le=100)) -> Response:
+    # Отдаём периодически обновляемый снимок: база в запросе не участвует
+    try:
+        snapshot = get_snapshot(db, type)
+    except LeaderboardUnavailable as exc:
+        raise HTTPException(status_code=503, detail="Рейтинг ещё собирается", headers={"Retry-After": "5"}) from exc
+    headers = {
+        "X-Leaderboard-Generated-At": snapshot.generated_at.isoformat(),
+        "Last-Modified": format_datetime(snapshot.generated_at, usegmt=True),
+        "Cache-Control": f"public, max-age={get_settings().leaderboard_snapshot_interval_seconds}",
+    }
+    if limit >= SNAPSHOT_SIZE:
+        return Response(content=snapshot.body, media_type="application/json", headers=headers)
+    return JSONResponse(content=snapshot.entries(limit), headers=headers)
+
+
+@router.get("/leaderboard/page", response_model=LeaderboardPageOut)
+def leaderboard_page(
+    db: DbDep,
+    type: Literal["wealth", "level"] = "wealth",
+    bracket: str | None = Query(default=None, description="stage:<стадия> или band:<диапазон уровней>"),
+    cursor: str | None = None,
+    limit: int = Query(default=50, ge=1, le=100),
+) -> LeaderboardPageOut:
+    try:
+        payload = page_entries(db, type, limit, bracket=parse_bracket(bracket), cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return LeaderboardPageOut(
+        type=payload["type"],
+        bracket=payload["bracket"],
+        entries=[LeaderboardEntryOut(**entry) for entry in payload["entries"]],
+        next_cursor=payload["next_cursor"],
+    )
 
+
+@router.get("/leaderboard/me", response_model=LeaderboardMeOut)
+def leaderboard_me(
+    db: DbDep,
+    user_id: UserDep,
+    type: Literal["wealth", "level"] = "wealth",
+    bracket: str | None = None,
+    k: int = Query(default=5, ge=0, le=50),
+) -> LeaderboardMeOut:
+    try:
+        bracket = parse_bracket(bracket)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    ensure_pet_state(db, user_id)
+    payload = neighbourhood(db, type, user_id, k, bracket=bracket)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Игрок не найден в таблице лидеров")
+    return LeaderboardMeOut(
+        type=payload["type"],
+        rank=payload["rank"],
+        total=payload["total"],
+        entries=[LeaderboardEntryOut(**entry) for entry in payload["entries"]],
+    )
@@ -170,6 +170,7 @@ class ShopCatalogOut(BaseModel):
 
 class ShopBuyRequest(BaseModel):
     item_key: str
+    quantity: int = Field(default=1, ge=1, le=99)
 
 
 class ShopBuyResponse(BaseModel):
@@ -177,6 +178,33 @@ class ShopBuyResponse(BaseModel):
     event: EventLogOut
     item_key: str
     price: int
+    quantity: int = 1
+    total_price: int = 0
+
+
+class ItemQuantityIn(BaseModel):
+    item_key: str
+    quantity: int = Field(default=1, ge=1, le=99)
+
+
+class ItemsBulkRequest(BaseModel):
+    items: list[ItemQuantityIn] = Field(min_length=1, max_length=20)
+
+
+class ShopPurchaseOut(BaseModel):
+    item_key: str
+    title: str
+    section: str
+    price: int
+    quantity: int
+    total_price: int
+
+
+class ShopBulkBuyResponse(BaseModel):
+    state: PetStateOut
+    event: EventLogOut
+    items: list[ShopPurchaseOut]
+    total_price: int
 
 
 class QuestStepOut(BaseModel):
@@ -209,5 +237,19 @@ class LeaderboardEntryOut(BaseModel):
     rank: int
 
 
+class LeaderboardPageOut(BaseModel):
+    type: str
+    bracket: str | None = None
+    entries: list[LeaderboardEntryOut]
+    next_cursor: str | None = None
+
+
+class LeaderboardMeOut(BaseModel):
+    type: str
+    rank: int
+    total: int
+    entries: list[LeaderboardEntryOut]
+
+
 class QuestClaimRequest(BaseModel):
     quest_key: str
@@ -0,0 +1,19 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import json
+from typing import Any
+
+
+def encode_cursor(values: list[Any]) -> str:
+    """Непрозрачный курсор keyset-пагинации: JSON-список значений ключа сортировки в base64url."""
+    raw = json.dumps(values, separators=(",", ":"), ensure_ascii=False).encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    try:
+        values = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Некорректный курсор") from None
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Некорректный курсор")
+    return values
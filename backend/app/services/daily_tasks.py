@@ -1,11 +1,12 @@
 from dataclasses import dataclass
 from datetime import UTC, datetime
-import json
+import threading
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.models import DailyProgress
+from app.database import dialect_insert
+from app.models import DailyProgress, PetState, utcnow
 
 
 @dataclass
@@ -51,30 +52,107 @@ TASK_POOL = [
     {"task_key": "sleep_count", "title": "Уложить спать 1 раз", "target": 1, "progress": 0, "completed": False},
 ]
 
-def default_tasks() -> list[dict]:
-    # Выбираем 3 случайных задания из пула на сегодняшний день
-    # Используем текущую дату в качестве seed для предсказуемости
-    date_seed = int(today_key().replace("-", ""))
-    random.seed(date_seed)
-    selected = random.sample(TASK_POOL, 3)
-    # Сбрасываем seed, чтобы не влиял на другие части программы
-    random.seed()
-    
-    return [dict(task) for task in selected]
+DAILY_TASK_COUNT = 3
+
+# Выбор заданий одинаков для всех игроков в пределах дня, поэтому он считается
+# один раз на date_key и раздаётся всем запросам только для чтения.
+_selection_lock = threading.Lock()
+_selection_cache: dict[str, tuple[dict, ...]] = {}
+_SELECTION_CACHE_DAYS = 2
+
+
+def tasks_for_day(date_key: str) -> tuple[dict, ...]:
+    selected = _selection_cache.get(date_key)
+    if selected is not None:
+        return selected
+
+    with _selection_lock:
+        selected = _selection_cache.get(date_key)
+        if selected is None:
+            # Собственный генератор с датой в качестве seed: результат предсказуем
+            # и не трогает глобальный random, которым пользуются случайные события.
+            rng = random.Random(int(date_key.replace("-", "")))
+            selected = tuple(dict(task) for task in rng.sample(TASK_POOL, DAILY_TASK_COUNT))
+            _selection_cache[date_key] = selected
+            # Держим только текущий и следующий день
+            for stale_key in sorted(_selection_cache)[:-_SELECTION_CACHE_DAYS]:
+                del _selection_cache[stale_key]
+    return selected
+
+
+def default_tasks(date_key: str | None = None) -> list[dict]:
+    return [dict(task) for task in tasks_for_day(date_key or today_key())]
+
+
+@dataclass
+class DailyTask:
+    task_key: str
+    title: str
+    target: int
+    progress: int = 0
+    completed: bool = False
+
+    @classmethod
+    def from_dict(cls, raw: dict) -> "DailyTask":
+        return cls(
+            task_key=str(raw.get("task_key", "")),
+            title=str(raw.get("title", "")),
+            target=int(raw.get("target", 1)),
+            progress=int(raw.get("progress", 0)),
+            completed=bool(raw.get("completed", False)),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "task_key": self.task_key,
+            "title": self.title,
+            "target": self.target,
+            "progress": self.progress,
+            "completed": self.completed,
+        }
 
 
-def _parse_tasks(raw: str) -> list[dict]:
-    try:
-        data = json.loads(raw)
-        if isinstance(data, list):
-            return data
-    except Exception:  # noqa: BLE001
-        pass
-    return default_tasks()
+class DailyTaskList:
+    """Разобранный список заданий дня; `dirty` показывает, что его нужно сохранить обратно в JSON-колонку `tasks`."""
 
+    def __init__(self, tasks: list[DailyTask]) -> None:
+        self.tasks = tasks
+        self.dirty = False
 
-def _dump_tasks(tasks: list[dict]) -> str:
-    return json.dumps(tasks, ensure_ascii=False)
+    @classmethod
+    def from_raw(cls, raw: object) -> "DailyTaskList":
+        if isinstance(raw, list):
+            return cls([DailyTask.from_dict(item) for item in raw if isinstance(item, dict)])
+        return cls([DailyTask.from_dict(item) for item in default_tasks()])
+
+    def find(self, task_key: str) -> DailyTask | None:
+        return next((task for task in self.tasks if task.task_key == task_key), None)
+
+    def increment(self, task_key: str, amount: int = 1) -> bool:
+        task = self.find(task_key)
+        if task is None:
+            # Если задача не найдена в текущем списке, ищем ее в общем пуле,
+            # так как пул динамический
+            template = next((item for item in TASK_POOL if item.get("task_key") == task_key), None)
+            if template is None:
+                return False
+            task = DailyTask.from_dict(template)
+            task.progress = max(0, amount)
+            self.tasks.append(task)
+        else:
+            task.progress += amount
+        task.completed = task.progress >= task.target
+        self.dirty = True
+        return True
+
+    def completed_keys(self) -> set[str]:
+        return {task.task_key for task in self.tasks if task.completed}
+
+    def all_completed(self) -> bool:
+        return all(task.completed for task in self.tasks)
+
+    def to_payload(self) -> list[dict]:
+        return [task.to_dict() for task in self.tasks]
 
 
 def ensure_today_progress(db: Session, user_id: int) -> DailyProgress:
@@ -88,7 +166,7 @@ def ensure_today_progress(db: Session, user_id: int) -> DailyProgress:
     row = DailyProgress(
         user_id=user_id,
         date_key=key,
-        tasks_json=_dump_tasks(default_tasks()),
+        tasks=default_tasks(key),
         login_bonus_claimed=False,
         chest_claimed=False,
     )
@@ -98,12 +176,75 @@ def ensure_today_progress(db: Session, user_id: int) -> DailyProgress:
     return row
 
 
-def read_tasks(progress: DailyProgress) -> list[dict]:
-    return _parse_tasks(progress.tasks_json)
+def provision_daily_progress(
+    db: Session, date_key: str, *, active_since: datetime, chunk_size: int = 1000
+) -> int:
+    """Заранее создаёт строки DailyProgress на date_key для недавно активных игроков.
 
+    Вставка идёт пачками по user_id через INSERT ... ON CONFLICT DO NOTHING, поэтому
+    повторный запуск и гонка с ensure_today_progress безопасны.
+    """
+    tasks = default_tasks(date_key)
+    created = 0
+    last_user_id = 0
+    while True:
+        user_ids = list(
+            db.execute(
+                select(PetState.user_id)
+                .where(PetState.last_active_at >= active_since, PetState.user_id > last_user_id)
+                .order_by(PetState.user_id)
+                .limit(chunk_size)
+            ).scalars()
+        )
+        if not user_ids:
+            break
+        now = utcnow()
+        stmt = (
+            dialect_insert(db, DailyProgress.__table__)
+            .values(
+                [
+                    {
+                        "user_id": user_id,
+                        "date_key": date_key,
+                        "tasks": tasks,
+                        "login_bonus_claimed": False,
+                        "chest_claimed": False,
+                        "updated_at": now,
+                    }
+                    for user_id in user_ids
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["user_id", "date_key"])
+        )
+        created += max(0, db.execute(stmt).rowcount or 0)
+        db.commit()
+        last_user_id = user_ids[-1]
+    return created
 
-def save_tasks(progress: DailyProgress, tasks: list[dict]) -> None:
-    progress.tasks_json = _dump_tasks(tasks)
+
+def load_tasks(progress: DailyProgress) -> DailyTaskList:
+    # Разобранный список кэшируется на самой строке и привязан к объекту колонки:
+    # после refresh() или внешнего присваивания `tasks` он будет построен заново.
+    raw = progress.tasks
+    cached = getattr(progress, "_task_list_cache", None)
+    if cached is not None and cached[0] is raw:
+        return cached[1]
+    task_list = DailyTaskList.from_raw(raw)
+    progress._task_list_cache = (raw, task_list)
+    return task_list
+
+
+def store_tasks(progress: DailyProgress, task_list: DailyTaskList) -> None:
+    if not task_list.dirty:
+        return
+    payload = task_list.to_payload()
+    progress.tasks = payload
+    progress._task_list_cache = (payload, task_list)
+    task_list.dirty = False
+
+
+def read_tasks(progress: DailyProgress) -> list[dict]:
+    return load_tasks(progress).to_payload()
 
 
 def all_tasks_completed(tasks: list[dict]) -> bool:
@@ -111,31 +252,9 @@ def all_tasks_completed(tasks: list[dict]) -> bool:
 
 
 def increment_task(progress: DailyProgress, task_key: str, amount: int = 1) -> bool:
-    tasks = read_tasks(progress)
-    changed = False
-    found = False
-    for task in tasks:
-        if task.get("task_key") != task_key:
-            continue
-        task["progress"] = int(task.get("progress", 0)) + amount
-        task["completed"] = task["progress"] >= int(task.get("target", 1))
-        changed = True
-        found = True
-
-    if not found:
-        # Если задача не найдена в текущем списке, ищем ее в общем пуле,
-        # так как пул динамический
-        template = next((task for task in TASK_POOL if task.get("task_key") == task_key), None)
-        if template is not None:
-            # Создаем копию
-            new_task = dict(template)
-            new_task["progress"] = max(0, amount)
-            new_task["completed"] = new_task["progress"] >= int(new_task.get("target", 1))
-            tasks.append(new_task)
-            changed = True
-
-    if changed:
-        save_tasks(progress, tasks)
+    task_list = load_tasks(progress)
+    changed = task_list.increment(task_key, amount)
+    store_tasks(progress, task_list)
     return changed
 
 
@@ -147,8 +266,7 @@ def claim_login_bonus(progress: DailyProgress) -> DailyReward | None:
 
 
 def claim_daily_chest(progress: DailyProgress) -> DailyReward | None:
-    tasks = read_tasks(progress)
-    if progress.chest_claimed or not all_tasks_completed(tasks):
+    if progress.chest_claimed or not load_tasks(progress).all_completed():
         return None
     progress.chest_claimed = True
     return DailyReward(coins=50, xp=30, message="Сундук заданий открыт")
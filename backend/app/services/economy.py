@@ -1,5 +1,7 @@
+from bisect import bisect_right
 from dataclasses import dataclass
 import math
+import threading
 
 
 @dataclass
@@ -18,6 +20,37 @@ def опыт_до_следующего_уровня(level: int) -> int:
     return int(math.ceil(50 * (level**1.4)))
 
 
+# _XP_TABLE[level] — суммарный опыт, нужный чтобы дойти с 1-го уровня до level.
+# Таблица общая для всех запросов и лениво достраивается под самые большие начисления.
+_XP_TABLE: list[int] = [0, 0]
+_xp_table_lock = threading.Lock()
+
+
+def _extend_xp_table(min_level: int, total_xp: int) -> None:
+    if len(_XP_TABLE) > min_level + 1 and _XP_TABLE[-1] > total_xp:
+        return
+    with _xp_table_lock:
+        while len(_XP_TABLE) <= min_level + 1 or _XP_TABLE[-1] <= total_xp:
+            level = len(_XP_TABLE) - 1
+            _XP_TABLE.append(_XP_TABLE[-1] + опыт_до_следующего_уровня(level))
+
+
+def cumulative_xp_table(max_level: int) -> list[int]:
+    """Копия таблицы суммарного опыта минимум до max_level включительно (для симуляций и отчётов)."""
+    _extend_xp_table(max_level, 0)
+    return _XP_TABLE[: max_level + 1]
+
+
+def level_after_xp(level: int, xp: int) -> tuple[int, int]:
+    """Уровень и остаток опыта после накопления xp на уровне level (бинарный поиск по таблице)."""
+    start = max(1, level)
+    _extend_xp_table(start, 0)
+    total = _XP_TABLE[start] + xp
+    _extend_xp_table(start, total)
+    next_level = bisect_right(_XP_TABLE, total, lo=start) - 1
+    return next_level, total - _XP_TABLE[next_level]
+
+
 def stage_by_level(level: int, current_stage: str = "baby", courage: int = 50, friendliness: int = 50, energy: int = 50, tidiness: int = 50) -> str:
     if level <= 5:
         return "baby"
@@ -44,19 +77,22 @@ def stage_by_level(level: int, current_stage: str = "baby", courage: int = 50, f
     return "adult"
 
 
+STAGE_TITLES = {
+    "egg": "Яйцо",
+    "baby": "Малыш",
+    "child": "Ребёнок",
+    "teen": "Подросток",
+    "adult": "Взрослый (Обычный)",
+    "gold_adult": "Взрослый (Благородный)",
+    "dark_adult": "Взрослый (Дикий)",
+    "fun_adult": "Взрослый (Веселый)",
+    "fire_adult": "Взрослый (Огненный)",
+}
+DEFAULT_STAGE_TITLE = STAGE_TITLES["baby"]
+
+
 def stage_title(stage: str) -> str:
-    mapping = {
-        "egg": "Яйцо",
-        "baby": "Малыш",
-        "child": "Ребёнок",
-        "teen": "Подросток",
-        "adult": "Взрослый (Обычный)",
-        "gold_adult": "Взрослый (Благородный)",
-        "dark_adult": "Взрослый (Дикий)",
-        "fun_adult": "Взрослый (Веселый)",
-        "fire_adult": "Взрослый (Огненный)",
-    }
-    return mapping.get(stage, "Малыш")
+    return STAGE_TITLES.get(stage, DEFAULT_STAGE_TITLE)
 
 
 def xp_multiplier(intelligence: int) -> float:
@@ -84,14 +120,8 @@ def apply_progress(
     gained_crystals = max(0, base_crystals)
 
     next_xp = max(0, xp + gained_xp)
-    next_level = max(1, level)
-    levels_gained: list[int] = []
-    carry = next_xp
-
-    while carry >= опыт_до_следующего_уровня(next_level):
-        carry -= опыт_до_следующего_уровня(next_level)
-        next_level += 1
-        levels_gained.append(next_level)
+    next_level, carry = level_after_xp(level, next_xp)
+    levels_gained = list(range(max(1, level) + 1, next_level + 1))
 
     previous_stage = stage
     new_stage = stage_by_level(
@@ -0,0 +1,427 @@
+"""Векторный симулятор игровой экономики для подбора баланса.
+
+Моделирует популяцию виртуальных игроков на N дней и выдаёт по каждому дню
+распределения уровней, монет и стадий. Все формулы берутся из боевого кода:
+таблицы наград, эффектов и цен импортируются напрямую, а деградация, прогресс
+и стадии повторены как NumPy-ядра (их совпадение с оригиналами проверяют тесты).
+Упрощение: награды за сессию суммируются и начисляются одним вызовом прогресса,
+поэтому множитель интеллекта округляется один раз на сессию, а не на действие.
+Популяция делится на шарды, которые считаются параллельно в пуле процессов.
+
+Запуск: python -m app.services.economy_simulator --players 100000 --days 90
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import argparse
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.config import get_settings
+from app.services.daily_tasks import claim_login_bonus
+from app.services.economy import cumulative_xp_table
+from app.services.game import ACTION_REWARDS, MINIGAME_REWARDS, _base_reward_for_item_category
+from app.services.gamification import _streak_bonus_for
+from app.services.shop import ITEM_EFFECTS, MAX_PRICED_LEVEL, PRICE_TABLE, find_item, get_item_category
+from app.services.simulation import ACTION_EFFECTS, CHARACTER_EFFECTS
+
+
+STATS = ("hunger", "hygiene", "happiness", "health", "energy")
+CHARACTER_STATS = (
+    "character_courage",
+    "character_friendliness",
+    "character_energy",
+    "character_curiosity",
+    "character_tidiness",
+)
+STAGES = ("baby", "child", "teen", "adult", "gold_adult", "dark_adult", "fun_adult", "fire_adult")
+_STAGE = {name: index for index, name in enumerate(STAGES)}
+_ADULT_MIN = _STAGE["adult"]
+
+# Уровни выше этого считаются одним «хвостом» распределения
+MAX_LEVEL = 400
+# Границы корзин гистограммы монет: 0, 1, 2, 4, ... 2**40
+COIN_BIN_EDGES = np.concatenate(([0], 2 ** np.arange(41, dtype=np.int64)))
+
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    players: int = 100_000
+    days: int = 90
+    seed: int = 0
+    workers: int = 0  # 0 — по числу CPU, 1 — без пула процессов
+    shard_size: int = 25_000
+
+    # Поведение игроков; вовлечённость каждого игрока — множитель из логнормального распределения
+    login_probability: float = 0.8
+    sessions_per_day: float = 3.0
+    max_sessions_per_day: int = 8
+    actions_per_session: int = 3
+    action_weights: dict[str, float] = field(
+        default_factory=lambda: {"feed": 3, "wash": 2, "play": 3, "heal": 1, "chat": 2, "sleep": 1}
+    )
+    minigame_probability: float = 0.5
+    minigame_success_rate: float = 0.7
+    purchase_probability: float = 0.3
+    purchase_item_key: str = "food_apple"
+
+    starting_coins: int = 1000
+
+
+@dataclass
+class SimulationResult:
+    days: int
+    players: int
+    level_counts: np.ndarray  # [days, MAX_LEVEL + 1]
+    coin_counts: np.ndarray  # [days, len(COIN_BIN_EDGES)]
+    coin_sums: np.ndarray  # [days]
+    stage_counts: np.ndarray  # [days, len(STAGES)]
+
+    def merge(self, other: "SimulationResult") -> "SimulationResult":
+        return SimulationResult(
+            days=self.days,
+            players=self.players + other.players,
+            level_counts=self.level_counts + other.level_counts,
+            coin_counts=self.coin_counts + other.coin_counts,
+            coin_sums=self.coin_sums + other.coin_sums,
+            stage_counts=self.stage_counts + other.stage_counts,
+        )
+
+    def summary(self) -> list[dict]:
+        levels = np.arange(MAX_LEVEL + 1)
+        rows: list[dict] = []
+        for day in range(self.days):
+            level_hist = self.level_counts[day]
+            coin_hist = self.coin_counts[day]
+            rows.append(
+                {
+                    "day": day + 1,
+                    "level": {
+                        "mean": round(float((level_hist * levels).sum() / self.players), 2),
+                        **{f"p{q}": int(_quantile(level_hist, levels, q)) for q in (10, 50, 90)},
+                    },
+                    "coins": {
+                        "mean": round(float(self.coin_sums[day] / self.players), 2),
+                        # Для монет квантиль — нижняя граница корзины (степени двойки)
+                        **{f"p{q}": int(_quantile(coin_hist, COIN_BIN_EDGES, q)) for q in (10, 50, 90)},
+                    },
+                    "stages": {name: int(count) for name, count in zip(STAGES, self.stage_counts[day]) if count},
+                }
+            )
+        return rows
+
+
+def _quantile(hist: np.ndarray, values: np.ndarray, q: int) -> int:
+    cumulative = np.cumsum(hist)
+    index = int(np.searchsorted(cumulative, cumulative[-1] * q / 100.0, side="left"))
+    return values[min(index, len(values) - 1)]
+
+
+# ---------------------------------------------------------------------------
+# Ядра: векторные версии функций из simulation.py и economy.py.
+# Показатели хранятся матрицей [игроки, STATS], остальное — отдельными столбцами.
+
+_HUNGER, _HYGIENE, _HAPPINESS, _HEALTH, _ENERGY = range(len(STATS))
+_COURAGE, _FRIENDLINESS, _CHARACTER_ENERGY, _CURIOSITY, _TIDINESS = range(len(CHARACTER_STATS))
+
+
+def clamp_kernel(values: np.ndarray) -> np.ndarray:
+    # round() в Python и np.rint одинаково округляют половины к чётному
+    return np.clip(np.rint(values), 0, 100).astype(np.int64)
+
+
+def decay_kernel(stats: np.ndarray, seconds: np.ndarray, cap_seconds: int, lonely: np.ndarray) -> None:
+    """Повторяет simulation.apply_time_decay для матрицы показателей (на месте)."""
+    effective = np.minimum(seconds, cap_seconds)
+    ticks = np.where(seconds >= 30, effective / 600.0, 0.0)
+
+    hunger = stats[:, _HUNGER] = clamp_kernel(stats[:, _HUNGER] - (1.0 * ticks))
+    energy = stats[:, _ENERGY] = clamp_kernel(stats[:, _ENERGY] - (0.95 * ticks))
+    hygiene = stats[:, _HYGIENE] = clamp_kernel(stats[:, _HYGIENE] - (0.9 * ticks))
+
+    happiness_drop = 0.3 * ticks
+    happiness_drop += np.where(hunger < 55, 0.35 * ticks, 0.0)
+    happiness_drop += np.where(energy < 45, 0.3 * ticks, 0.0)
+    happiness_drop += np.where(hygiene < 50, 0.4 * ticks, 0.0)
+    happiness_drop = np.where(lonely, happiness_drop * 1.4, happiness_drop)
+    stats[:, _HAPPINESS] = clamp_kernel(stats[:, _HAPPINESS] - happiness_drop)
+
+    health_drop = np.where(hunger < 45, 0.45 * ticks, 0.0)
+    health_drop += np.where(hygiene < 40, 0.55 * ticks, 0.0)
+    health_drop += np.where(energy < 25, 0.35 * ticks, 0.0)
+    stats[:, _HEALTH] = np.where(health_drop > 0, clamp_kernel(stats[:, _HEALTH] - health_drop), stats[:, _HEALTH])
+
+
+def stage_kernel(level: np.ndarray, stage: np.ndarray, character: np.ndarray) -> np.ndarray:
+    """Повторяет economy.stage_by_level; стадии закодированы индексами STAGES."""
+    adult_branch = np.select(
+        [
+            character[:, _FRIENDLINESS] >= 75,
+            character[:, _TIDINESS] <= 25,
+            character[:, _CHARACTER_ENERGY] >= 75,
+            character[:, _COURAGE] >= 75,
+        ],
+        [_STAGE["gold_adult"], _STAGE["dark_adult"], _STAGE["fun_adult"], _STAGE["fire_adult"]],
+        default=_STAGE["adult"],
+    )
+    adult_branch = np.where(stage >= _ADULT_MIN, stage, adult_branch)
+    return np.select(
+        [level <= 5, level <= 10, level <= 20],
+        [_STAGE["baby"], _STAGE["child"], _STAGE["teen"]],
+        default=adult_branch,
+    )
+
+
+class _Economy:
+    """Таблицы боевого кода, разложенные в массивы для ядер."""
+
+    def __init__(self, config: SimulationConfig) -> None:
+        self.xp_table = np.array(cumulative_xp_table(MAX_LEVEL + 1), dtype=np.int64)
+
+        self.actions = [name for name in config.action_weights if config.action_weights[name] > 0]
+        unknown = [name for name in self.actions if name not in ACTION_EFFECTS]
+        if unknown:
+            raise ValueError(f"Unknown actions: {unknown}")
+        weights = np.array([config.action_weights[name] for name in self.actions], dtype=np.float64)
+        self.action_cdf = np.cumsum(weights / weights.sum())
+        self.action_effects = np.array(
+            [[ACTION_EFFECTS[name].get(stat, 0) for stat in STATS] for name in self.actions], dtype=np.int64
+        )
+        self.character_effects = np.array(
+            [[CHARACTER_EFFECTS.get(name, {}).get(stat, 0) for stat in CHARACTER_STATS] for name in self.actions],
+            dtype=np.int64,
+        )
+        self.action_xp = np.array([ACTION_REWARDS[name]["xp"] for name in self.actions], dtype=np.int64)
+        self.action_coins = np.array([ACTION_REWARDS[name]["coins"] for name in self.actions], dtype=np.int64)
+        self.clean_index = self.actions.index("clean") if "clean" in self.actions else -1
+
+        login = claim_login_bonus(SimpleNamespace(login_bonus_claimed=False))
+        self.login_coins = login.coins
+        self.login_xp = login.xp
+        streak_bonus = [_streak_bonus_for(streak) for streak in range(config.days + 2)]
+        self.streak_coins = np.array([row[0] for row in streak_bonus], dtype=np.int64)
+        self.streak_xp = np.array([row[1] for row in streak_bonus], dtype=np.int64)
+
+        item = find_item(config.purchase_item_key)
+        if item is None:
+            raise ValueError(f"Unknown item: {config.purchase_item_key}")
+        self.item_level_required = item.level_required
+        self.item_prices = np.array(
+            [PRICE_TABLE[min(max(1, level), MAX_PRICED_LEVEL)][item.item_key] for level in range(MAX_LEVEL + 1)],
+            dtype=np.int64,
+        )
+        effects = ITEM_EFFECTS.get(item.item_key, {})
+        self.item_effects = np.array([effects.get(stat, 0) for stat in STATS], dtype=np.int64)
+        self.item_intelligence = effects.get("intelligence", 0)
+        self.item_xp, self.item_coins = _base_reward_for_item_category(get_item_category(item.item_key))
+
+
+class _Population:
+    def __init__(self, players: int, config: SimulationConfig) -> None:
+        self.stats = np.tile(np.array([80, 80, 80, 85, 85], dtype=np.int64), (players, 1))
+        self.character = np.full((players, len(CHARACTER_STATS)), 50, dtype=np.int64)
+        self.level = np.ones(players, dtype=np.int64)
+        self.xp = np.zeros(players, dtype=np.int64)
+        self.coins = np.full(players, config.starting_coins, dtype=np.int64)
+        self.intelligence = np.zeros(players, dtype=np.int64)
+        self.stage = np.full(players, _STAGE["baby"], dtype=np.int64)
+
+
+def progress_kernel(
+    population: _Population,
+    economy: _Economy,
+    idx: np.ndarray,
+    base_xp: np.ndarray | int,
+    base_coins: np.ndarray | int,
+    base_intelligence: np.ndarray | int = 0,
+) -> None:
+    """Повторяет economy.apply_progress и бонусы за уровни из game._apply_progress_for_pet для игроков idx."""
+    multiplier = 1.0 + np.maximum(0, population.intelligence[idx]) / 100.0
+    gained_xp = np.rint(base_xp * multiplier).astype(np.int64)
+
+    level = population.level[idx]
+    total = economy.xp_table[level] + np.maximum(0, population.xp[idx] + gained_xp)
+    next_level = np.minimum(np.searchsorted(economy.xp_table, total, side="right") - 1, MAX_LEVEL)
+    levels_gained = next_level - level
+
+    population.xp[idx] = total - economy.xp_table[next_level]
+    # Бонус 12 + 2 * L за каждый полученный уровень L — сумма арифметической прогрессии
+    level_bonus = 12 * levels_gained + (level + 1 + next_level) * levels_gained
+    population.coins[idx] += np.maximum(0, base_coins) + level_bonus
+    population.intelligence[idx] += np.maximum(0, base_intelligence)
+    population.level[idx] = next_level
+
+    # Стадия зависит от уровня, поэтому пересчитываем только тех, кто вырос
+    grown = idx[levels_gained > 0]
+    if grown.size:
+        population.stage[grown] = stage_kernel(
+            population.level[grown], population.stage[grown], population.character[grown]
+        )
+
+
+def minigame_rewards(played: np.ndarray, success: np.ndarray) -> dict[str, np.ndarray]:
+    """Награды мини-игры по игрокам, как в game.execute_minigame за математику."""
+    return {
+        name: np.where(played, np.where(success, MINIGAME_REWARDS["success"][name], MINIGAME_REWARDS["failure"][name]), 0)
+        for name in MINIGAME_REWARDS["success"]
+    }
+
+
+def _play_session(
+    population: _Population,
+    economy: _Economy,
+    config: SimulationConfig,
+    rng: np.random.Generator,
+    idx: np.ndarray,
+    gap_seconds: np.ndarray,
+    lonely: np.ndarray,
+    cap_seconds: int,
+) -> None:
+    """Одна игровая сессия для игроков idx; награды за сессию начисляются одним вызовом прогресса."""
+    count = idx.size
+    stats = population.stats[idx]
+    character = population.character[idx]
+    decay_kernel(stats, gap_seconds, cap_seconds, lonely)
+
+    base_xp = np.zeros(count, dtype=np.int64)
+    base_coins = np.zeros(count, dtype=np.int64)
+    base_intelligence = np.zeros(count, dtype=np.int64)
+
+    for _ in range(config.actions_per_session):
+        action = np.searchsorted(economy.action_cdf, rng.random(count), side="right")
+        action = np.minimum(action, len(economy.actions) - 1)
+        np.clip(stats + economy.action_effects[action], 0, 100, out=stats)
+        np.clip(character + economy.character_effects[action], 0, 100, out=character)
+        if economy.clean_index >= 0:
+            stats[action == economy.clean_index, _HUNGER] = 50
+        base_xp += economy.action_xp[action]
+        base_coins += economy.action_coins[action]
+
+    played = rng.random(count) < config.minigame_probability
+    success = rng.random(count) < config.minigame_success_rate
+    minigame = minigame_rewards(played, success)
+    base_xp += minigame["xp"]
+    base_coins += minigame["coins"]
+    base_intelligence += minigame["intelligence"]
+    stats[:, _ENERGY] = np.clip(stats[:, _ENERGY] + minigame["energy"], 0, 100)
+    stats[:, _HAPPINESS] = np.clip(stats[:, _HAPPINESS] + minigame["happiness"], 0, 100)
+
+    # Покупка и сразу использование предмета
+    level = population.level[idx]
+    price = economy.item_prices[level]
+    bought = (
+        (rng.random(count) < config.purchase_probability)
+        & (level >= economy.item_level_required)
+        & (population.coins[idx] >= price)
+    )
+    population.coins[idx] -= np.where(bought, price, 0)
+    np.clip(stats + np.outer(bought, economy.item_effects), 0, 100, out=stats)
+    base_xp += np.where(bought, economy.item_xp, 0)
+    base_coins += np.where(bought, economy.item_coins, 0)
+    base_intelligence += np.where(bought, economy.item_intelligence, 0)
+
+    population.stats[idx] = stats
+    population.character[idx] = character
+    progress_kernel(population, economy, idx, base_xp, base_coins, base_intelligence)
+
+
+def _simulate_shard(config: SimulationConfig, players: int, seed: np.random.SeedSequence) -> SimulationResult:
+    rng = np.random.default_rng(seed)
+    economy = _Economy(config)
+    cap_seconds = get_settings().decay_cap_seconds
+    population = _Population(players, config)
+
+    engagement = rng.lognormal(mean=0.0, sigma=0.5, size=players)
+    login_p = np.clip(config.login_probability * engagement, 0.0, 1.0)
+    streak = np.zeros(players, dtype=np.int64)
+    days_absent = np.zeros(players, dtype=np.int64)
+
+    level_counts = np.zeros((config.days, MAX_LEVEL + 1), dtype=np.int64)
+    coin_counts = np.zeros((config.days, len(COIN_BIN_EDGES)), dtype=np.int64)
+    coin_sums = np.zeros(config.days, dtype=np.float64)
+    stage_counts = np.zeros((config.days, len(STAGES)), dtype=np.int64)
+
+    for day in range(config.days):
+        logged_in = rng.random(players) < login_p
+        streak = np.where(logged_in, streak + 1, 0)
+        lonely = days_absent >= 1
+        days_absent = np.where(logged_in, 0, days_absent + 1)
+
+        # Бонус за вход вместе с бонусом серии
+        logged_idx = np.flatnonzero(logged_in)
+        progress_kernel(
+            population,
+            economy,
+            logged_idx,
+            economy.login_xp + economy.streak_xp[streak[logged_idx]],
+            economy.login_coins + economy.streak_coins[streak[logged_idx]],
+        )
+
+        sessions = np.minimum(rng.poisson(config.sessions_per_day * engagement), config.max_sessions_per_day)
+        sessions = np.where(logged_in, np.maximum(sessions, 1), 0)
+        gap_seconds = 86_400 // (sessions + 1)
+
+        for session in range(int(sessions.max(initial=0))):
+            idx = np.flatnonzero(sessions > session)
+            _play_session(population, economy, config, rng, idx, gap_seconds[idx], lonely[idx], cap_seconds)
+
+        # Остаток суток до следующего дня
+        decay_kernel(population.stats, gap_seconds, cap_seconds, lonely)
+
+        level_counts[day] = np.bincount(np.minimum(population.level, MAX_LEVEL), minlength=MAX_LEVEL + 1)
+        coin_bins = np.clip(np.searchsorted(COIN_BIN_EDGES, population.coins, side="right") - 1, 0, None)
+        coin_counts[day] = np.bincount(coin_bins, minlength=len(COIN_BIN_EDGES))[: len(COIN_BIN_EDGES)]
+        coin_sums[day] = float(population.coins.sum())
+        stage_counts[day] = np.bincount(population.stage, minlength=len(STAGES))
+
+    return SimulationResult(
+        days=config.days,
+        players=players,
+        level_counts=level_counts,
+        coin_counts=coin_counts,
+        coin_sums=coin_sums,
+        stage_counts=stage_counts,
+    )
+
+
+def run_simulation(config: SimulationConfig) -> SimulationResult:
+    shard_sizes = [
+        min(config.shard_size, config.players - start) for start in range(0, config.players, config.shard_size)
+    ]
+    seeds = np.random.SeedSequence(config.seed).spawn(len(shard_sizes))
+    workers = config.workers or os.cpu_count() or 1
+
+    if workers == 1 or len(shard_sizes) == 1:
+        results = [_simulate_shard(config, size, seed) for size, seed in zip(shard_sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(shard_sizes))) as pool:
+            results = list(pool.map(_simulate_shard, [config] * len(shard_sizes), shard_sizes, seeds))
+
+    merged = results[0]
+    for result in results[1:]:
+        merged = merged.merge(result)
+    return merged
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Симуляция экономики для подбора баланса")
+    parser.add_argument("--players", type=int, default=SimulationConfig.players)
+    parser.add_argument("--days", type=int, default=SimulationConfig.days)
+    parser.add_argument("--seed", type=int, default=SimulationConfig.seed)
+    parser.add_argument("--workers", type=int, default=SimulationConfig.workers)
+    parser.add_argument("--item", default=SimulationConfig.purchase_item_key)
+    args = parser.parse_args()
+
+    config = SimulationConfig(
+        players=args.players, days=args.days, seed=args.seed, workers=args.workers, purchase_item_key=args.item
+    )
+    for row in run_simulation(config).summary():
+        sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Архив журнала событий в сжатых JSONL-сегментах.
+
+События старше EVENT_ARCHIVE_AFTER_DAYS переносятся из event_logs в файлы
+EVENT_ARCHIVE_DIR/<YYYY-MM>/users-<from>-<to>.jsonl.gz — по месяцу события и
+диапазону user_id шириной EVENT_ARCHIVE_USER_RANGE. Файлы только дописываются: каждая
+пачка — отдельный gzip-member, gzip читает их подряд как один поток.
+
+Пачка сначала дописывается в файлы, затем в одной короткой транзакции обновляется
+индекс event_archive_segments и удаляются перенесённые строки. Строки журнала никто не
+изменяет, поэтому выборка их не блокирует, а удаление держит блокировки только на
+одну пачку. Если процесс упал между записью файла и коммитом, пачка попадёт в архив
+повторно — читатель отбрасывает дубли по id.
+
+На PostgreSQL с секциями (см. partitions) архивируются и удаляются целые месячные
+секции через archive_range.
+
+Если снимок состояния ушёл в архив, у самых старых оставшихся в таблице событий
+/history?with_stats восстанавливает состояние только частично.
+"""
+
+from collections import defaultdict
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+from typing import Any
+
+from sqlalchemy import Select, delete, select
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import SessionLocal, dialect_insert
+from app.models import EventArchiveSegment, EventLog, utcnow
+
+
+logger = logging.getLogger(__name__)
+
+
+def segment_name(month_key: str, user_id: int, user_range: int) -> str:
+    low = user_id // user_range * user_range
+    return f"{month_key}/users-{low:010d}-{low + user_range - 1:010d}.jsonl.gz"
+
+
+def _record_line(row: Any) -> str:
+    # Порядок ключей фиксирован: читатель отбирает строки игрока по префиксу без разбора JSON
+    record = {
+        "id": row.id,
+        "user_id": row.user_id,
+        "action": row.action,
+        "created_at": row.created_at.isoformat(),
+        "payload": row.payload,
+    }
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _append_segment(path: Path, lines: list[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as handle:
+        handle.write(gzip.compress("".join(lines).encode("utf-8")))
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+def upsert_segment_index(
+    db: Session, counts: dict[tuple[int, str], int], *, replace: bool = False, chunk_size: int = 1000
+) -> None:
+    """Прибавить к индексу архива число событий по парам (user_id, сегмент); коммит за вызывающим.
+
+    replace=True записывает счётчики вместо прибавления: так повторная выгрузка той же
+    месячной секции после падения не завышает их.
+    """
+    table = EventArchiveSegment.__table__
+    now = utcnow()
+    items = list(counts.items())
+    for start in range(0, len(items), chunk_size):
+        stmt = dialect_insert(db, table).values(
+            [
+                {"user_id": user_id, "month_key": segment[:7], "segment": segment, "events": events, "updated_at": now}
+                for (user_id, segment), events in items[start : start + chunk_size]
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "segment"],
+            set_={"events": stmt.excluded.events if replace else table.c.events + stmt.excluded.events, "updated_at": now},
+        )
+        db.execute(stmt)
+
+
+def _write_batch(rows: list[Any], archive_dir: Path, user_range: int, counts: dict[tuple[int, str], int]) -> None:
+    lines: dict[str, list[str]] = defaultdict(list)
+    for row in rows:
+        segment = segment_name(row.created_at.strftime("%Y-%m"), row.user_id, user_range)
+        lines[segment].append(_record_line(row))
+        counts[(row.user_id, segment)] += 1
+    for segment, segment_lines in lines.items():
+        _append_segment(archive_dir / segment, segment_lines)
+
+
+def _archive_columns() -> Select:
+    return select(EventLog.id, EventLog.user_id, EventLog.action, EventLog.created_at, EventLog.payload)
+
+
+def archive_events(
+    db: Session, before: datetime, *, archive_dir: Path, user_range: int, batch_size: int = 1000
+) -> int:
+    """Переносит события старше before в сегменты архива пачками; возвращает число перенесённых."""
+    archived = 0
+    while True:
+        rows = db.execute(
+            _archive_columns().where(EventLog.created_at < before).order_by(EventLog.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        counts: dict[tuple[int, str], int] = defaultdict(int)
+        _write_batch(rows, archive_dir, user_range, counts)
+        upsert_segment_index(db, counts)
+        db.execute(delete(EventLog).where(EventLog.id.in_([row.id for row in rows])))
+        db.commit()
+        archived += len(rows)
+    return archived
+
+
+def archive_range(
+    db: Session, start: datetime, end: datetime, *, archive_dir: Path, user_range: int, batch_size: int = 1000
+) -> dict[tuple[int, str], int]:
+    """Дописать в архив все события из [start, end), не удаляя их; возвращает счётчики для индекса.
+
+    Используется для целой секции event_logs: индекс обновляется и секция удаляется
+    одним коммитом уже после записи файлов.
+    """
+    counts: dict[tuple[int, str], int] = defaultdict(int)
+    last_id = 0
+    while True:
+        rows = db.execute(
+            _archive_columns()
+            .where(EventLog.created_at >= start, EventLog.created_at < end, EventLog.id > last_id)
+            .order_by(EventLog.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        _write_batch(rows, archive_dir, user_range, counts)
+        last_id = rows[-1].id
+    return counts
+
+
+def archived_segments(db: Session, user_id: int) -> list[str]:
+    return list(
+        db.execute(
+            select(EventArchiveSegment.segment)
+            .where(EventArchiveSegment.user_id == user_id)
+            .order_by(EventArchiveSegment.month_key, EventArchiveSegment.segment)
+        ).scalars()
+    )
+
+
+def iter_archived_events(db: Session, user_id: int, *, archive_dir: Path) -> Iterator[dict[str, Any]]:
+    """Архивные события игрока от старых к новым, сегмент за сегментом."""
+    prefix = f'"user_id":{user_id},'
+    seen: set[int] = set()
+    for segment in archived_segments(db, user_id):
+        path = archive_dir / segment
+        if not path.exists():
+            logger.warning("event archive segment missing path=%s user_id=%s", path, user_id)
+            continue
+        records = []
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            for line in handle:
+                if prefix not in line:
+                    continue
+                record = json.loads(line)
+                if record["user_id"] == user_id and record["id"] not in seen:
+                    seen.add(record["id"])
+                    records.append(record)
+        records.sort(key=lambda record: (record["created_at"], record["id"]))
+        yield from records
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Архив журнала событий")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("user_id", type=int)
+    args = parser.parse_args()
+
+    settings = get_settings()
+    with SessionLocal() as db:
+        for record in iter_archived_events(db, args.user_id, archive_dir=Path(settings.event_archive_dir)):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Компактный формат payload в event_logs.
+
+В строку журнала пишутся только сведения о самом событии (дельты, сводка награды,
+параметры действия) и состояние питомца после него:
+- часто меняющиеся поля (показатели, уровень, опыт, монеты) — всегда, это несколько чисел;
+- редко меняющиеся (стадия, характер, интеллект...) — только если изменились в этой транзакции;
+- каждое K-е событие питомца — полный снимок ("snapshot").
+Полное состояние на любое событие восстанавливается от ближайшего снимка вперёд.
+Старые строки с полным "stats" читаются как снимки.
+"""
+
+from typing import Any
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import EventLog, PetState
+from app.services.economy import stage_title, опыт_до_следующего_уровня
+
+
+PAYLOAD_VERSION = 2
+VOLATILE_FIELDS = (
+    "hunger",
+    "hygiene",
+    "happiness",
+    "health",
+    "energy",
+    "level",
+    "xp",
+    "coins",
+    "behavior_state",
+    "last_tick_at",
+)
+RARE_FIELDS = (
+    "name",
+    "stage",
+    "intelligence",
+    "crystals",
+    "character_courage",
+    "character_friendliness",
+    "character_energy",
+    "character_curiosity",
+    "character_tidiness",
+)
+# Ответ клиенту содержит их полностью, в журнал они не попадают
+FULL_ONLY_KEYS = ("stats", "daily")
+
+# Редкие поля, сброшенные в БД в текущей транзакции и уже закоммиченные, но ещё не
+# попавшие в журнал: запрос может закоммитить посередине (ensure_today_progress),
+# и изменения до такого коммита должны дожить до _record_event
+_PENDING_KEY = "event_payload_pending_fields"
+_COMMITTED_KEY = "event_payload_committed_fields"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_fields(session: Session, flush_context: Any) -> None:
+    pending: dict[int, set[str]] = session.info.setdefault(_PENDING_KEY, {})
+    for obj in session.dirty:
+        if isinstance(obj, PetState):
+            attrs = inspect(obj).attrs
+            names = {name for name in RARE_FIELDS if attrs[name].history.has_changes()}
+            if names:
+                pending.setdefault(obj.user_id, set()).update(names)
+
+
+@event.listens_for(Session, "after_commit")
+def _keep_committed_fields(session: Session) -> None:
+    committed: dict[int, set[str]] = session.info.setdefault(_COMMITTED_KEY, {})
+    for user_id, names in session.info.pop(_PENDING_KEY, {}).items():
+        committed.setdefault(user_id, set()).update(names)
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_changed_fields(session: Session) -> None:
+    # Откатываются только изменения текущей транзакции; закоммиченные остаются в силе
+    session.info.pop(_PENDING_KEY, None)
+
+
+def pop_changed_fields(session: Session, pet: PetState) -> set[str]:
+    """Редкие поля, изменённые с последнего события питомца в этой сессии: закоммиченные,
+    сброшенные в текущей транзакции и ещё не сброшенные."""
+    changed = session.info.get(_COMMITTED_KEY, {}).pop(pet.user_id, set())
+    changed |= session.info.get(_PENDING_KEY, {}).pop(pet.user_id, set())
+    attrs = inspect(pet).attrs
+    return changed | {name for name in RARE_FIELDS if attrs[name].history.has_changes()}
+
+
+def pet_fields(pet: PetState) -> dict[str, Any]:
+    fields = {name: getattr(pet, name) for name in VOLATILE_FIELDS + RARE_FIELDS}
+    fields["last_tick_at"] = pet.last_tick_at.isoformat()
+    return fields
+
+
+def _compact_reward(reward: dict[str, Any]) -> dict[str, Any]:
+    # Нулевые и пустые поля награды не несут информации
+    return {key: value for key, value in reward.items() if value not in (0, False, [], None, "")}
+
+
+def compact_payload(payload: dict[str, Any], pet: PetState, changed: set[str], snapshot: bool) -> dict[str, Any]:
+    body = {key: value for key, value in payload.items() if key not in FULL_ONLY_KEYS}
+    if isinstance(body.get("reward"), dict):
+        body["reward"] = _compact_reward(body["reward"])
+    fields = pet_fields(pet)
+    if snapshot:
+        body["snapshot"] = fields
+    else:
+        body["state"] = {
+            name: value for name, value in fields.items() if name in VOLATILE_FIELDS or name in changed
+        }
+    body["v"] = PAYLOAD_VERSION
+    return body
+
+
+def is_snapshot(payload: dict[str, Any]) -> bool:
+    return "snapshot" in payload or "stats" in payload
+
+
+def _state_of(payload: dict[str, Any]) -> dict[str, Any]:
+    return payload.get("snapshot") or payload.get("stats") or payload.get("state") or {}
+
+
+def full_stats(state: dict[str, Any], user_id: int) -> dict[str, Any]:
+    """Дополнить восстановленное состояние вычисляемыми полями, как в serialize_pet_state."""
+    stats = dict(state)
+    stats["user_id"] = user_id
+    if "stage" in stats:
+        stats["stage_title"] = stage_title(stats["stage"])
+    if "level" in stats:
+        stats["xp_to_next_level"] = опыт_до_следующего_уровня(stats["level"])
+    return stats
+
+
+def reconstruct_stats(rows: list[EventLog]) -> dict[int, dict[str, Any]]:
+    """Состояние питомца после каждого события; rows — события одного игрока от старых к новым.
+
+    Для точного результата первым должен идти снимок; без него восстанавливаются только
+    поля, встретившиеся в переданных событиях.
+    """
+    result: dict[int, dict[str, Any]] = {}
+    state: dict[str, Any] = {}
+    for row in rows:
+        payload = row.payload or {}
+        if is_snapshot(payload):
+            state = dict(_state_of(payload))
+        else:
+            state.update(_state_of(payload))
+        result[row.id] = full_stats(state, row.user_id)
+    return result
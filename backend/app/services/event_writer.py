@@ -0,0 +1,374 @@
+"""Запись журнала событий (event_logs) без отдельного коммита на каждое действие игрока.
+
+Режимы (EVENT_WRITER_MODE):
+- sync — строка вставляется в транзакции запроса и фиксируется вместе с питомцем.
+  Режим по умолчанию, используется в тестах и на SQLite;
+- buffered — id заранее выделяются блоками из последовательности event_logs, время
+  фиксируется в момент события. После коммита запроса записи попадают в очередь, а
+  фоновый поток вставляет их многострочным INSERT раз в EVENT_WRITER_FLUSH_MS или
+  по набору EVENT_WRITER_BATCH_SIZE. При остановке процесса очередь дописывается.
+
+В режиме buffered событие появляется в /history с задержкой в несколько миллисекунд.
+Пачка, которую не удалось вставить за WRITE_ATTEMPTS попыток, не теряется: она
+дописывается в JSONL-файл в EVENT_WRITER_SPILL_DIR (с fsync), а event_seq её игроков
+сбрасывается, чтобы следующее событие стало полным снимком. Файлы дописываются в
+event_logs при старте приложения (replay_spilled_events) или вручную:
+
+    python -m app.services.event_writer replay
+"""
+
+from collections import deque
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+import argparse
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any
+import uuid
+
+from sqlalchemy import Engine, event, insert, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import engine
+from app.models import EventLog, PetState, utcnow
+
+
+logger = logging.getLogger(__name__)
+
+WRITE_ATTEMPTS = 3
+_PENDING_KEY = "event_writer_pending"
+
+
+class SequenceIdAllocator:
+    """Выделяет id блоками из последовательности event_logs.id: один запрос на block_size событий."""
+
+    def __init__(self, engine: Engine, block_size: int) -> None:
+        self.engine = engine
+        self.block_size = block_size
+        self._ids: deque[int] = deque()
+        self._lock = threading.Lock()
+
+    def __call__(self) -> int:
+        with self._lock:
+            if not self._ids:
+                with self.engine.connect() as conn:
+                    self._ids.extend(
+                        conn.execute(
+                            text(
+                                "SELECT nextval(pg_get_serial_sequence('event_logs', 'id')) "
+                                "FROM generate_series(1, :n)"
+                            ),
+                            {"n": self.block_size},
+                        ).scalars()
+                    )
+            return self._ids.popleft()
+
+
+class BufferedEventWriter:
+    def __init__(
+        self,
+        engine: Engine,
+        allocate_id: Callable[[], int],
+        *,
+        flush_interval: float,
+        batch_size: int,
+        spill_dir: Path,
+    ) -> None:
+        self.engine = engine
+        self.allocate_id = allocate_id
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.spill_dir = spill_dir
+        self.spill_path = spill_dir / f"events-{os.getpid()}-{uuid.uuid4().hex}.jsonl"
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, rows: list[dict[str, Any]]) -> None:
+        self._ensure_started()
+        for row in rows:
+            self._queue.put(row)
+
+    def flush(self) -> None:
+        """Дождаться записи всего, что уже поставлено в очередь."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                self._queue.task_done()
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is None:
+                    # Остановка: дописываем уже собранное и выходим
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(row)
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+        # Всё, что успели положить после сигнала остановки
+        rest: list[dict[str, Any]] = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if row is not None:
+                rest.append(row)
+        for start in range(0, len(rest), self.batch_size):
+            self._write(rest[start : start + self.batch_size])
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(insert(EventLog.__table__), batch)
+                return
+            except Exception:
+                if attempt == WRITE_ATTEMPTS:
+                    logger.exception("event log write failed, spilling rows=%s path=%s", len(batch), self.spill_path)
+                    self._spill(batch)
+                    return
+                logger.warning("event log write failed rows=%s attempt=%s", len(batch), attempt, exc_info=True)
+                time.sleep(self.flush_interval * attempt)
+
+    def _spill(self, batch: list[dict[str, Any]]) -> None:
+        lines = "".join(_spill_line(row) for row in batch)
+        try:
+            _append_locked(self.spill_path, lines)
+        except OSError:
+            # Последний рубеж: строки остаются в логе и восстанавливаются из него вручную
+            logger.critical("event log spill failed, rows follow\n%s", lines, exc_info=True)
+        try:
+            reset_event_seq(self.engine, {row["user_id"] for row in batch})
+        except Exception:
+            logger.warning("event_seq reset failed, it is repeated on replay", exc_info=True)
+
+
+def _append_locked(path: Path, lines: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        with open(path, "a", encoding="utf-8") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            # Файл могли забрать на повтор между open и flock — тогда пишем в новый
+            try:
+                same = os.fstat(handle.fileno()).st_ino == os.stat(path).st_ino
+            except FileNotFoundError:
+                same = False
+            if same:
+                handle.write(lines)
+                handle.flush()
+                os.fsync(handle.fileno())
+                return
+
+
+def _spill_line(row: dict[str, Any]) -> str:
+    return json.dumps({**row, "created_at": row["created_at"].isoformat()}, ensure_ascii=False) + "\n"
+
+
+def reset_event_seq(engine: Engine, user_ids: set[int]) -> None:
+    """Следующее событие этих игроков запишется полным снимком, а не дельтой от потерянной строки."""
+    if not user_ids:
+        return
+    with engine.begin() as conn:
+        conn.execute(update(PetState).where(PetState.user_id.in_(sorted(user_ids))).values(event_seq=0))
+
+
+def replay_spilled_events(engine: Engine, spill_dir: Path, *, batch_size: int = 500) -> int:
+    """Дописать в event_logs строки из файлов spill_dir; возвращает число прочитанных строк.
+
+    Файл сначала переименовывается (захват одним процессом), вставка пропускает уже
+    записанные id, поэтому повтор после сбоя безопасен. Файл удаляется после коммита.
+    """
+    if not spill_dir.is_dir():
+        return 0
+    replayed = 0
+    for path in sorted(spill_dir.glob("events-*.jsonl")):
+        claimed = path.with_name(f"replaying-{os.getpid()}-{path.name}")
+        try:
+            path.rename(claimed)
+        except FileNotFoundError:
+            continue  # забрал другой процесс
+        replayed += _replay_file(engine, claimed, batch_size)
+    # Файлы процесса, упавшего посреди повтора: забираем так же переименованием
+    for orphan in sorted(spill_dir.glob("replaying-*.jsonl")):
+        claimed = orphan.with_name(f"replaying-{os.getpid()}-{orphan.name.split('-', 2)[2]}")
+        if claimed == orphan:
+            continue
+        try:
+            orphan.rename(claimed)
+        except FileNotFoundError:
+            continue
+        replayed += _replay_file(engine, claimed, batch_size)
+    return replayed
+
+
+def _replay_file(engine: Engine, path: Path, batch_size: int) -> int:
+    rows = []
+    with open(path, encoding="utf-8") as handle:
+        # Дождаться писателя, который открыл файл до переименования
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        for line in handle:
+            if line.strip():
+                row = json.loads(line)
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+                rows.append(row)
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    with engine.begin() as conn:
+        for start in range(0, len(rows), batch_size):
+            conn.execute(dialect.insert(EventLog.__table__).on_conflict_do_nothing(), rows[start : start + batch_size])
+    reset_event_seq(engine, {row["user_id"] for row in rows})
+    path.unlink(missing_ok=True)
+    logger.warning("replayed spilled event log rows=%s path=%s", len(rows), path)
+    return len(rows)
+
+
+_writer: BufferedEventWriter | None = None
+_configured = False
+_writer_lock = threading.Lock()
+
+
+def get_event_writer() -> BufferedEventWriter | None:
+    """Фоновый писатель или None, если журнал пишется синхронно в транзакции запроса."""
+    global _writer, _configured
+    if not _configured:
+        with _writer_lock:
+            if not _configured:
+                settings = get_settings()
+                if settings.event_writer_mode == "buffered":
+                    if engine.dialect.name == "postgresql":
+                        _writer = BufferedEventWriter(
+                            engine,
+                            SequenceIdAllocator(engine, settings.event_writer_id_block),
+                            flush_interval=settings.event_writer_flush_ms / 1000,
+                            batch_size=settings.event_writer_batch_size,
+                            spill_dir=Path(settings.event_writer_spill_dir),
+                        )
+                        atexit.register(_writer.close)
+                    else:
+                        logger.warning("buffered event writer needs PostgreSQL, falling back to sync")
+                _configured = True
+    return _writer
+
+
+def set_event_writer(writer: BufferedEventWriter | None) -> None:
+    """Подменить писатель (тесты); None — синхронная запись."""
+    global _writer, _configured
+    with _writer_lock:
+        _writer = writer
+        _configured = True
+
+
+def start_event_writer() -> None:
+    """Старт приложения: дописать строки, которые прошлые процессы не смогли вставить."""
+    settings = get_settings()
+    if settings.event_writer_mode == "buffered":
+        replay_spilled_events(engine, Path(settings.event_writer_spill_dir))
+
+
+def shutdown_event_writer() -> None:
+    if _writer is not None:
+        _writer.close()
+
+
+def write_event(
+    db: Session, user_id: int, action: str, payload: dict[str, Any], created_at: datetime | None = None
+) -> EventLog:
+    """Записать событие; коммит остаётся за вызывающим.
+
+    Возвращает EventLog с уже известными id и created_at. В режиме buffered объект не
+    связан с сессией, а строка уходит в очередь только после успешного коммита.
+    """
+    created_at = created_at or utcnow()
+    writer = get_event_writer()
+    if writer is None:
+        row = EventLog(user_id=user_id, action=action, payload=payload, created_at=created_at)
+        db.add(row)
+        # INSERT в текущей транзакции ради id; фиксируется общим коммитом запроса
+        db.flush()
+        return row
+    row = EventLog(id=writer.allocate_id(), user_id=user_id, action=action, payload=payload, created_at=created_at)
+    db.info.setdefault(_PENDING_KEY, []).append(
+        {"id": row.id, "user_id": user_id, "action": action, "payload": payload, "created_at": created_at}
+    )
+    return row
+
+
+def write_events(db: Session, rows: list[dict[str, Any]]) -> None:
+    """Записать пачку событий (user_id, action, payload, created_at); коммит остаётся за вызывающим.
+
+    Для beat-задач: в режиме sync — один многострочный INSERT в транзакции вызывающего,
+    в режиме buffered строки после коммита уходят в очередь писателя, как и write_event.
+    """
+    if not rows:
+        return
+    writer = get_event_writer()
+    if writer is None:
+        db.execute(insert(EventLog.__table__), rows)
+        return
+    db.info.setdefault(_PENDING_KEY, []).extend({**row, "id": writer.allocate_id()} for row in rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        writer = get_event_writer()
+        if writer is not None:
+            writer.enqueue(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Журнал событий")
+    parser.add_argument("command", choices=["replay"])
+    parser.parse_args()
+    replayed = replay_spilled_events(engine, Path(get_settings().event_writer_spill_dir))
+    sys.stdout.write(f"replayed={replayed}\n")
+
+
+if __name__ == "__main__":
+    main()
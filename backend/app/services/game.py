@@ -4,22 +4,35 @@ from typing import Any
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.config import get_settings
 from app.models import DailyProgress, EventLog, Inventory, NotificationSettings, PetState, Reward
 from app.services.daily_tasks import (
     DailyReward,
-    all_tasks_completed,
     claim_daily_chest,
     claim_login_bonus,
     ensure_today_progress,
     increment_task,
-    read_tasks,
+    load_tasks,
 )
 from app.services.economy import apply_progress, stage_title, опыт_до_следующего_уровня
+from app.services import leaderboard  # noqa: F401  регистрирует обновление таблиц лидеров при коммите
+from app.services.event_payloads import compact_payload, pop_changed_fields
+from app.services.event_writer import write_event
+from app.services.inventory import STARTER_PACK, consume_items, grant_items
 from app.services.pet_ai import is_absent_more_than_24h, определить_состояние_питомца
-from app.services.shop import CATALOG, find_item, price_for_level
+from app.services.shop import (
+    catalog_json,
+    catalog_payload,
+    find_item,
+    get_item_category,
+    get_item_effects,
+    is_consumable,
+    item_price,
+)
 from app.services.simulation import ActionResult, apply_action, apply_time_decay
+from app.services.sweeps import SweepProgress
 from app.services.random_events import trigger_random_event
 from app.services.gamification import (
     achievement_reward,
@@ -51,6 +64,14 @@ ACTION_REWARDS: dict[str, dict[str, int]] = {
     "clean": {"xp": 3, "coins": 5, "intelligence": 0, "crystals": 0},  # Награда за уборку
 }
 
+# Награды мини-игры за успех (score >= MINIGAME_SUCCESS_SCORE) и неудачу; energy и
+# happiness начисляются только за математику. Их же использует economy_simulator
+MINIGAME_SUCCESS_SCORE = 3
+MINIGAME_REWARDS: dict[str, dict[str, int]] = {
+    "success": {"xp": 15, "coins": 10, "intelligence": 2, "energy": 12, "happiness": 4},
+    "failure": {"xp": 6, "coins": 3, "intelligence": 0, "energy": 6, "happiness": 2},
+}
+
 TASK_BY_ACTION = {
     "feed": "feed_count",
     "play": "play_count",
@@ -142,6 +163,16 @@ class ShopExecution:
     event: EventLog
     item_key: str
     price: int
+    quantity: int = 1
+    total_price: int = 0
+
+
+@dataclass
+class ShopBulkExecution:
+    pet: PetState
+    event: EventLog
+    items: list[dict[str, Any]]
+    total_price: int
 
 
 def _now() -> datetime:
@@ -169,50 +200,32 @@ def ensure_pet_state(db: Session, user_id: int) -> PetState:
         behavior_state="Спокойный",
     )
     db.add(pet)
-    # Стартовые предметы - базовый набор для начала игры
-    db.add(Inventory(user_id=user_id, item_key="food_apple", quantity=8))
-    db.add(Inventory(user_id=user_id, item_key="food_carrot", quantity=5))
-    db.add(Inventory(user_id=user_id, item_key="wash_soap", quantity=5))
-    db.add(Inventory(user_id=user_id, item_key="medicine_bandage", quantity=3))
-    db.add(Inventory(user_id=user_id, item_key="toy_ball", quantity=3))
+    grant_items(db, user_id, STARTER_PACK)
     db.add(NotificationSettings(user_id=user_id))
     db.commit()
     db.refresh(pet)
     return pet
 
 
-def _upsert_inventory(db: Session, user_id: int, item_key: str, qty_delta: int) -> None:
-    row = db.execute(
-        select(Inventory).where(Inventory.user_id == user_id, Inventory.item_key == item_key)
-    ).scalar_one_or_none()
-    if row is None:
-        if qty_delta <= 0:
-            return
-        row = Inventory(user_id=user_id, item_key=item_key, quantity=qty_delta)
-        db.add(row)
-    else:
-        next_quantity = row.quantity + qty_delta
-        if next_quantity <= 0:
-            db.delete(row)
-        else:
-            row.quantity = next_quantity
-    db.flush()
-
 def _build_daily_payload(progress: DailyProgress) -> dict[str, Any]:
-    tasks = read_tasks(progress)
+    tasks = load_tasks(progress)
     return {
-        "tasks": tasks,
+        "tasks": tasks.to_payload(),
         "login_bonus_claimed": progress.login_bonus_claimed,
         "chest_claimed": progress.chest_claimed,
-        "all_completed": all_tasks_completed(tasks),
+        "all_completed": tasks.all_completed(),
     }
 
 
-def _record_event(db: Session, user_id: int, action: str, payload: dict[str, Any]) -> EventLog:
-    row = EventLog(user_id=user_id, action=action, payload=payload)
-    db.add(row)
-    db.commit()
-    db.refresh(row)
+def _record_event(db: Session, pet: PetState, action: str, payload: dict[str, Any]) -> EventLog:
+    """Записать событие в журнал; коммит вместе с питомцем делает вызывающий."""
+    # Каждое K-е событие питомца — полный снимок, между ними только изменения
+    snapshot = pet.event_seq % settings.event_snapshot_interval == 0
+    changed = pop_changed_fields(db, pet)
+    pet.event_seq += 1
+    row = write_event(db, pet.user_id, action, compact_payload(payload, pet, changed, snapshot))
+    # В журнале компактный payload, вызывающему возвращаем полный
+    set_committed_value(row, "payload", payload)
     return row
 
 
@@ -260,9 +273,9 @@ def _apply_progress_for_pet(
     for level_gained in progress.levels_gained:
         bonus_coins = 12 + level_gained * 2
         pet.coins += bonus_coins
-        decor_key = f"украшение_уровень_{level_gained}"
-        _upsert_inventory(db, pet.user_id, decor_key, 1)
-        unlocks.append(decor_key)
+        unlocks.append(f"украшение_уровень_{level_gained}")
+    # Украшения за все полученные уровни выдаются одним запросом
+    grant_items(db, pet.user_id, {decor_key: 1 for decor_key in unlocks})
 
     return ServiceReward(
         xp=progress.xp_gained,
@@ -314,26 +327,39 @@ def serialize_pet_state_for_event(pet: PetState) -> dict[str, Any]:
     return payload
 
 
-def _update_daily_progress_for_action(db: Session, pet: PetState, action: str) -> tuple[dict[str, Any], list[str]]:
-    progress = ensure_today_progress(db, pet.user_id)
-    before = read_tasks(progress)
-    task_key = TASK_BY_ACTION.get(action)
-    if task_key:
-        increment_task(progress, task_key, 1)
-    after = read_tasks(progress)
+def _update_daily_progress_for_action(
+    db: Session, pet: PetState, action: str, amount: int = 1
+) -> tuple[dict[str, Any], list[str]]:
+    return _update_daily_progress_for_actions(db, pet, {action: amount})
 
-    notifications: list[str] = []
-    for i, task in enumerate(after):
-        prev_done = bool(before[i].get("completed")) if i < len(before) else False
-        if not prev_done and bool(task.get("completed")):
-            notifications.append("Задание выполнено")
+
+def _update_daily_progress_for_actions(
+    db: Session, pet: PetState, action_counts: dict[str, int]
+) -> tuple[dict[str, Any], list[str]]:
+    progress = ensure_today_progress(db, pet.user_id)
+    before = load_tasks(progress).completed_keys()
+    for action, amount in action_counts.items():
+        task_key = TASK_BY_ACTION.get(action)
+        if task_key and amount > 0:
+            increment_task(progress, task_key, amount)
+    after = load_tasks(progress).completed_keys()
+
+    notifications: list[str] = ["Задание выполнено" for _ in after - before]
     db.add(progress)
     db.flush()
     return _build_daily_payload(progress), notifications
 
 
-def _apply_live_event_points_for_action(db: Session, user_id: int, action: str, notifications: list[str]) -> int:
-    points = EVENT_POINTS_BY_ACTION.get(action, 0)
+def _apply_live_event_points_for_action(
+    db: Session, user_id: int, action: str, notifications: list[str], amount: int = 1
+) -> int:
+    return _apply_live_event_points_for_actions(db, user_id, {action: amount}, notifications)
+
+
+def _apply_live_event_points_for_actions(
+    db: Session, user_id: int, action_counts: dict[str, int], notifications: list[str]
+) -> int:
+    points = sum(EVENT_POINTS_BY_ACTION.get(action, 0) * amount for action, amount in action_counts.items())
     if points <= 0:
         return 0
     update = add_event_points(db, user_id, points)
@@ -359,16 +385,43 @@ def _apply_streak_achievements(db: Session, user_id: int, best_streak: int, noti
             notifications.append(f"Достижение выполнено: {state.title}")
 
 
-def run_decay(db: Session, pet: PetState) -> int:
-    now = _now()
+def _decay_pet(pet: PetState, now: datetime) -> int:
     lonely = is_absent_more_than_24h(pet.last_active_at, now)
     applied = apply_time_decay(pet, now=now, cap_seconds=settings.decay_cap_seconds, lonely=lonely)
     _update_behavior_state(pet)
+    return applied
+
+
+def run_decay(db: Session, pet: PetState) -> int:
+    applied = _decay_pet(pet, _now())
     db.add(pet)
     db.commit()
     return applied
 
 
+def decay_pets(db: Session, *, chunk_size: int = 500, progress: SweepProgress | None = None) -> int:
+    """Распад всех питомцев пачками по user_id, один коммит на пачку; возвращает число изменённых.
+
+    С progress обход начинается после progress.cursor и сдвигает его в коммите каждой пачки.
+    """
+    updated = 0
+    last_user_id = progress.cursor if progress else 0
+    while True:
+        pets = db.execute(
+            select(PetState).where(PetState.user_id > last_user_id).order_by(PetState.user_id).limit(chunk_size)
+        ).scalars().all()
+        if not pets:
+            break
+        now = _now()
+        updated += sum(1 for pet in pets if _decay_pet(pet, now) > 0)
+        last_user_id = pets[-1].user_id
+        if progress is not None:
+            progress.advance(db, last_user_id)
+        db.commit()
+        db.expunge_all()
+    return updated
+
+
 def execute_action(db: Session, pet: PetState, action: str) -> ActionExecution:
     now = _now()
     lonely = is_absent_more_than_24h(pet.last_active_at, now)
@@ -416,13 +469,9 @@ def execute_action(db: Session, pet: PetState, action: str) -> ActionExecution:
     # СЛУЧАЙНЫЕ СОБЫТИЯ
     trigger_random_event(pet, action, notifications)
 
-    db.add(pet)
-    db.commit()
-    db.refresh(pet)
-
     event = _record_event(
         db,
-        pet.user_id,
+        pet,
         action,
         {
             "deltas": result.deltas,
@@ -432,6 +481,9 @@ def execute_action(db: Session, pet: PetState, action: str) -> ActionExecution:
             "stats": serialize_pet_state_for_event(pet),
         },
     )
+    db.add(pet)
+    db.commit()
+    db.refresh(pet)
     return ActionExecution(pet=pet, event=event, reward=reward, notifications=notifications)
 
 
@@ -443,44 +495,32 @@ def execute_minigame(
     apply_time_decay(pet, now=now, cap_seconds=settings.decay_cap_seconds, lonely=lonely)
 
     category = _minigame_category(game_type, source)
-    success = score >= 3
-    base_xp = 15 if success else 6
-    base_coins = 10 if success else 3
-    base_intelligence = 2 if success else 0
+    success = score >= MINIGAME_SUCCESS_SCORE
+    minigame_reward = MINIGAME_REWARDS["success" if success else "failure"]
 
     reward = _apply_progress_for_pet(
         db,
         pet,
-        base_xp=base_xp,
-        base_coins=base_coins,
-        base_intelligence=base_intelligence,
+        base_xp=minigame_reward["xp"],
+        base_coins=minigame_reward["coins"],
+        base_intelligence=minigame_reward["intelligence"],
     )
     energy_recovered = 0
     if source == "math":
-        energy_recovered = 12 if success else 6
+        energy_recovered = minigame_reward["energy"]
         pet.energy = _clamp_stat(pet.energy + energy_recovered)
-        pet.happiness = _clamp_stat(pet.happiness + (4 if success else 2))
+        pet.happiness = _clamp_stat(pet.happiness + minigame_reward["happiness"])
     pet.last_active_at = now
     _update_behavior_state(pet)
 
     progress = ensure_today_progress(db, pet.user_id)
-    before = read_tasks(progress)
-    before_completed = {
-        str(task.get("task_key")): bool(task.get("completed"))
-        for task in before
-        if task.get("task_key")
-    }
+    before_completed = load_tasks(progress).completed_keys()
     increment_task(progress, "minigame_count", 1)
     if category == "math":
         increment_task(progress, "math_minigame_count", 1)
     if category == "letters":
         increment_task(progress, "letters_game_count", 1)
-    after = read_tasks(progress)
-    completed_notice = any(
-        (not before_completed.get(str(task.get("task_key")), False)) and bool(task.get("completed"))
-        for task in after
-        if task.get("task_key")
-    )
+    completed_notice = bool(load_tasks(progress).completed_keys() - before_completed)
     db.add(progress)
 
     reward_row = Reward(
@@ -503,9 +543,8 @@ def execute_minigame(
     )
     db.add(reward_row)
     db.add(pet)
-    db.commit()
-    db.refresh(pet)
-    db.refresh(reward_row)
+    # id награды нужен в событии; всё фиксируется одним коммитом вместе с журналом
+    db.flush()
 
     notifications = []
     if energy_recovered > 0:
@@ -535,7 +574,7 @@ def execute_minigame(
 
     event = _record_event(
         db,
-        pet.user_id,
+        pet,
         "мини_игра",
         {
             "game_type": game_type,
@@ -551,6 +590,9 @@ def execute_minigame(
             "stats": serialize_pet_state_for_event(pet),
         },
     )
+    db.add(pet)
+    db.commit()
+    db.refresh(pet)
     return ActionExecution(pet=pet, event=event, reward=reward, notifications=notifications)
 
 
@@ -597,13 +639,9 @@ def claim_active_event_for_pet(db: Session, pet: PetState) -> ActionExecution:
 
     pet.last_active_at = _now()
     _update_behavior_state(pet)
-    db.add(pet)
-    db.commit()
-    db.refresh(pet)
-
     event = _record_event(
         db,
-        pet.user_id,
+        pet,
         "награда_события",
         {
             "event_key": event_state.event_key,
@@ -611,6 +649,9 @@ def claim_active_event_for_pet(db: Session, pet: PetState) -> ActionExecution:
             "stats": serialize_pet_state_for_event(pet),
         },
     )
+    db.add(pet)
+    db.commit()
+    db.refresh(pet)
     return ActionExecution(pet=pet, event=event, reward=reward, notifications=notifications)
 
 
@@ -635,13 +676,9 @@ def claim_achievement_for_pet(db: Session, pet: PetState, achievement_key: str)
 
     pet.last_active_at = _now()
     _update_behavior_state(pet)
-    db.add(pet)
-    db.commit()
-    db.refresh(pet)
-
     event = _record_event(
         db,
-        pet.user_id,
+        pet,
         "награда_достижения",
         {
             "achievement_key": achievement_key,
@@ -649,6 +686,9 @@ def claim_achievement_for_pet(db: Session, pet: PetState, achievement_key: str)
             "stats": serialize_pet_state_for_event(pet),
         },
     )
+    db.add(pet)
+    db.commit()
+    db.refresh(pet)
     return ActionExecution(pet=pet, event=event, reward=reward, notifications=notifications)
 
 
@@ -674,13 +714,9 @@ def claim_quest_step_for_pet(db: Session, pet: PetState, quest_key: str) -> Acti
 
     pet.last_active_at = _now()
     _update_behavior_state(pet)
-    db.add(pet)
-    db.commit()
-    db.refresh(pet)
-
     event = _record_event(
         db,
-        pet.user_id,
+        pet,
         "награда_квеста",
         {
             "quest_key": claim.quest_key,
@@ -689,6 +725,9 @@ def claim_quest_step_for_pet(db: Session, pet: PetState, quest_key: str) -> Acti
             "stats": serialize_pet_state_for_event(pet),
         },
     )
+    db.add(pet)
+    db.commit()
+    db.refresh(pet)
     return ActionExecution(pet=pet, event=event, reward=reward, notifications=notifications)
 
 
@@ -752,198 +791,268 @@ def _apply_daily_grant(
 
     pet.last_active_at = _now()
     _update_behavior_state(pet)
-    db.add(progress)
-    db.add(pet)
-    db.commit()
-    db.refresh(pet)
-
+    daily_payload = _build_daily_payload(progress)
     event = _record_event(
         db,
-        pet.user_id,
+        pet,
         action_name,
         {
             "reward": reward.__dict__,
-            "daily": _build_daily_payload(progress),
+            "daily": daily_payload,
             "notifications": notifications,
             "stats": serialize_pet_state_for_event(pet),
         },
     )
+    db.add(progress)
+    db.add(pet)
+    db.commit()
+    db.refresh(pet)
     return DailyExecution(
         pet=pet,
         event=event,
         reward=reward,
-        daily=_build_daily_payload(progress),
+        daily=daily_payload,
         notifications=notifications,
     )
 
 
+def _owned_item_keys(db: Session, user_id: int) -> set[str]:
+    return set(
+        db.execute(select(Inventory.item_key).where(Inventory.user_id == user_id, Inventory.quantity > 0)).scalars()
+    )
+
+
 def get_shop_catalog(db: Session, pet: PetState) -> list[dict[str, Any]]:
-    inventory = {row.item_key: row.quantity for row in get_inventory(db, pet.user_id)}
-    items: list[dict[str, Any]] = []
-    for item in CATALOG:
-        price = price_for_level(item.base_price, pet.level)
-        items.append(
+    owned = _owned_item_keys(db, pet.user_id)
+    return [{**item, "owned": item["item_key"] in owned} for item in catalog_payload(pet.level)]
+
+
+def get_shop_catalog_json(db: Session, pet: PetState) -> bytes:
+    """То же, что get_shop_catalog, но готовым JSON-телом ответа без сериализации в запросе."""
+    return catalog_json(pet.level, _owned_item_keys(db, pet.user_id))
+
+
+def _merge_quantities(entries: list[tuple[str, int]]) -> dict[str, int]:
+    merged: dict[str, int] = {}
+    for item_key, quantity in entries:
+        if quantity <= 0:
+            raise ValueError("Количество должно быть положительным")
+        merged[item_key] = merged.get(item_key, 0) + quantity
+    if not merged:
+        raise ValueError("Не выбрано ни одного товара")
+    return merged
+
+
+def buy_shop_items(db: Session, pet: PetState, entries: list[tuple[str, int]]) -> ShopBulkExecution:
+    """Покупка нескольких товаров (с количеством) одной транзакцией и одной записью в журнале."""
+    orders = _merge_quantities(entries)
+
+    lines: list[dict[str, Any]] = []
+    total_price = 0
+    for item_key, quantity in orders.items():
+        item = find_item(item_key)
+        if item is None:
+            raise ValueError("Товар не найден")
+        if pet.level < item.level_required:
+            raise ValueError("Недостаточный уровень")
+        price = item_price(item, pet.level)
+        line_total = price * quantity
+        total_price += line_total
+        lines.append(
             {
                 "item_key": item.item_key,
                 "title": item.title,
                 "section": item.section,
-                "base_price": item.base_price,
                 "price": price,
-                "level_required": item.level_required,
-                "owned": inventory.get(item.item_key, 0) > 0,
+                "quantity": quantity,
+                "total_price": line_total,
             }
         )
-    return items
-
 
-def buy_shop_item(db: Session, pet: PetState, item_key: str) -> ShopExecution:
-    item = find_item(item_key)
-    if item is None:
-        raise ValueError("Товар не найден")
-    if pet.level < item.level_required:
-        raise ValueError("Недостаточный уровень")
-
-    price = price_for_level(item.base_price, pet.level)
-    if pet.coins < price:
+    if pet.coins < total_price:
         raise ValueError("Недостаточно монет")
 
-    pet.coins -= price
-    _upsert_inventory(db, pet.user_id, item.item_key, 1)
+    pet.coins -= total_price
+    grant_items(db, pet.user_id, {line["item_key"]: line["quantity"] for line in lines})
     pet.last_active_at = _now()
     _update_behavior_state(pet)
 
-    apply_quest_metric(db, pet.user_id, "shop_buy", 1)
-    
+    bought = sum(orders.values())
+    apply_quest_metric(db, pet.user_id, "shop_buy", bought)
+
     notifications: list[str] = []
-    _apply_achievement_delta(db, pet.user_id, "shopaholic_20", 1, notifications)
+    _apply_achievement_delta(db, pet.user_id, "shopaholic_20", bought, notifications)
 
+    payload: dict[str, Any] = {"items": lines, "total_price": total_price}
+    if len(lines) == 1:
+        payload.update(lines[0])
+        payload["total_price"] = total_price
+    event = _record_event(db, pet, "покупка", payload)
     db.add(pet)
     db.commit()
     db.refresh(pet)
-
-    event = _record_event(
-        db,
-        pet.user_id,
-        "покупка",
-        {"item_key": item.item_key, "title": item.title, "section": item.section, "price": price},
+    return ShopBulkExecution(pet=pet, event=event, items=lines, total_price=total_price)
+
+
+def buy_shop_item(db: Session, pet: PetState, item_key: str, quantity: int = 1) -> ShopExecution:
+    result = buy_shop_items(db, pet, [(item_key, quantity)])
+    line = result.items[0]
+    return ShopExecution(
+        pet=result.pet,
+        event=result.event,
+        item_key=line["item_key"],
+        price=line["price"],
+        quantity=line["quantity"],
+        total_price=result.total_price,
     )
-    return ShopExecution(pet=pet, event=event, item_key=item.item_key, price=price)
 
 
+SWEET_ITEM_KEYS = {"food_candy", "food_icecream", "food_cake"}
+
+
+def _base_reward_for_item_category(category: str) -> tuple[int, int]:
+    if category == "food":
+        return 5, 2
+    if category == "medicine":
+        return 7, 3
+    if category == "wash":
+        return 5, 2
+    if category == "toy":
+        return 10, 5
+    return 3, 1
+
+
+def use_items(db: Session, pet: PetState, entries: list[tuple[str, int]]) -> ActionExecution:
+    """Использовать несколько предметов из инвентаря (с количеством) за один запрос"""
+    orders = _merge_quantities(entries)
+
+    # Проверяем, что предметы расходные
+    for item_key in orders:
+        if not is_consumable(item_key):
+            raise ValueError("Этот предмет нельзя использовать")
+
+    # Проверяем наличие в инвентаре одним запросом
+    owned = dict(
+        db.execute(
+            select(Inventory.item_key, Inventory.quantity).where(
+                Inventory.user_id == pet.user_id, Inventory.item_key.in_(list(orders))
+            )
+        ).all()
+    )
+    for item_key, quantity in orders.items():
+        if owned.get(item_key, 0) <= 0:
+            raise ValueError("У вас нет этого предмета")
+        if owned[item_key] < quantity:
+            raise ValueError("Недостаточно предметов в инвентаре")
+
+    # Списываем атомарно: параллельный запрос мог потратить те же предметы после проверки
+    consume_items(db, pet.user_id, orders)
 
-def use_item(db: Session, pet: PetState, item_key: str) -> ActionExecution:
-    """Использовать предмет из инвентаря"""
-    from app.services.shop import get_item_category, get_item_effects, is_consumable, find_item
-    
-    # Проверяем, что предмет расходный
-    if not is_consumable(item_key):
-        raise ValueError("Этот предмет нельзя использовать")
-    
-    # Проверяем наличие в инвентаре
-    inventory_item = db.execute(
-        select(Inventory).where(Inventory.user_id == pet.user_id, Inventory.item_key == item_key)
-    ).scalar_one_or_none()
-    
-    if not inventory_item or inventory_item.quantity <= 0:
-        raise ValueError("У вас нет этого предмета")
-    
     # Применяем деградацию
     now = _now()
     lonely = is_absent_more_than_24h(pet.last_active_at, now)
     apply_time_decay(pet, now=now, cap_seconds=settings.decay_cap_seconds, lonely=lonely)
-    
-    # Получаем эффекты предмета
-    effects = get_item_effects(item_key)
+
     deltas: dict[str, int] = {}
-    
-    # Применяем эффекты
-    for stat, delta in effects.items():
-        if stat == "intelligence":
-            deltas[stat] = delta
-            continue
-        before = getattr(pet, stat)
-        after = _clamp_stat(before + delta)
-        setattr(pet, stat, after)
-        deltas[stat] = after - before
-    # Уменьшаем количество предмета
-    inventory_item.quantity -= 1
-    if inventory_item.quantity <= 0:
-        db.delete(inventory_item)
-    
-    # Определяем награды в зависимости от категории
-    category = get_item_category(item_key)
-    if category == "food":
-        base_xp, base_coins = 5, 2
-    elif category == "medicine":
-        base_xp, base_coins = 7, 3
-    elif category == "wash":
-        base_xp, base_coins = 5, 2
-    elif category == "toy":
-        base_xp, base_coins = 10, 5
-    else:
-        base_xp, base_coins = 3, 1
-    
+    used: list[dict[str, Any]] = []
+    action_counts: dict[str, int] = {}
+    base_xp = base_coins = base_intelligence = 0
+    sweets = 0
+    for item_key, quantity in orders.items():
+        # Применяем эффекты: повторное применение с ограничением 0..100
+        # равно однократному сдвигу на delta * quantity
+        effects = get_item_effects(item_key)
+        for stat, delta in effects.items():
+            if stat == "intelligence":
+                deltas[stat] = deltas.get(stat, 0) + delta * quantity
+                continue
+            before = getattr(pet, stat)
+            after = _clamp_stat(before + delta * quantity)
+            setattr(pet, stat, after)
+            deltas[stat] = deltas.get(stat, 0) + after - before
+
+        # Определяем награды в зависимости от категории
+        category = get_item_category(item_key)
+        item_xp, item_coins = _base_reward_for_item_category(category)
+        base_xp += item_xp * quantity
+        base_coins += item_coins * quantity
+        base_intelligence += effects.get("intelligence", 0) * quantity
+
+        mapped_action = _action_for_item_category(category)
+        action_counts[mapped_action] = action_counts.get(mapped_action, 0) + quantity
+        if item_key in SWEET_ITEM_KEYS:
+            sweets += quantity
+
+        shop_item = find_item(item_key)
+        used.append(
+            {
+                "item_key": item_key,
+                "item_title": shop_item.title if shop_item else item_key,
+                "category": category,
+                "quantity": quantity,
+            }
+        )
+
     # Применяем прогресс
     reward = _apply_progress_for_pet(
         db,
         pet,
         base_xp=base_xp,
         base_coins=base_coins,
-        base_intelligence=effects.get("intelligence", 0),
+        base_intelligence=base_intelligence,
     )
-    
+
     pet.last_active_at = now
     _update_behavior_state(pet)
-    
+
     # Обновляем ежедневные задания
-    daily_payload, notifications = _update_daily_progress_for_action(db, pet, _action_for_item_category(category))
-    
+    daily_payload, notifications = _update_daily_progress_for_actions(db, pet, action_counts)
+
     if reward.level_up:
         notifications.append("Новый уровень!")
     if lonely:
         notifications.append("Питомец скучает")
-    
-    mapped_action = _action_for_item_category(category)
-    event_points = _apply_live_event_points_for_action(db, pet.user_id, mapped_action, notifications)
-    if mapped_action == "feed":
-        _apply_achievement_delta(db, pet.user_id, "feed_count_25", 1, notifications)
-    if mapped_action == "play":
-        _apply_achievement_delta(db, pet.user_id, "play_count_25", 1, notifications)
-    if mapped_action == "wash":
-        _apply_achievement_delta(db, pet.user_id, "neat_freak_50", 1, notifications)
-    
+
+    event_points = _apply_live_event_points_for_actions(db, pet.user_id, action_counts, notifications)
+    _apply_achievement_delta(db, pet.user_id, "feed_count_25", action_counts.get("feed", 0), notifications)
+    _apply_achievement_delta(db, pet.user_id, "play_count_25", action_counts.get("play", 0), notifications)
+    _apply_achievement_delta(db, pet.user_id, "neat_freak_50", action_counts.get("wash", 0), notifications)
+
     # Специфично для сладостей
-    if item_key in ["food_candy", "food_icecream", "food_cake"]:
-        _apply_achievement_delta(db, pet.user_id, "sweet_tooth_10", 1, notifications)
-        
+    _apply_achievement_delta(db, pet.user_id, "sweet_tooth_10", sweets, notifications)
+
     _apply_achievement_delta(db, pet.user_id, "coins_earned_1000", reward.coins, notifications)
-    notifications.extend(apply_quest_metric(db, pet.user_id, "use_item", 1))
-    notifications.extend(apply_quest_metric(db, pet.user_id, f"action:{mapped_action}", 1))
+    notifications.extend(apply_quest_metric(db, pet.user_id, "use_item", sum(orders.values())))
+    for mapped_action, count in action_counts.items():
+        notifications.extend(apply_quest_metric(db, pet.user_id, f"action:{mapped_action}", count))
     if event_points:
         notifications.extend(apply_quest_metric(db, pet.user_id, "event_points", event_points))
 
+    notifications[:0] = [
+        f"Использован: {line['item_title']}" + (f" ×{line['quantity']}" if line["quantity"] > 1 else "")
+        for line in used
+    ]
 
-    # Получаем название предмета
-    shop_item = find_item(item_key)
-    item_title = shop_item.title if shop_item else item_key
-    notifications.insert(0, f"Использован: {item_title}")
-    
+    payload: dict[str, Any] = {
+        "items": used,
+        "deltas": deltas,
+        "reward": reward.__dict__,
+        "daily": daily_payload,
+        "notifications": notifications,
+        "stats": serialize_pet_state_for_event(pet),
+    }
+    if len(used) == 1:
+        action_name = f"use_item_{used[0]['category']}"
+        payload.update(item_key=used[0]["item_key"], item_title=used[0]["item_title"], quantity=used[0]["quantity"])
+    else:
+        action_name = "use_items"
+    event = _record_event(db, pet, action_name, payload)
     db.add(pet)
     db.commit()
     db.refresh(pet)
-    
-    event = _record_event(
-        db,
-        pet.user_id,
-        f"use_item_{category}",
-        {
-            "item_key": item_key,
-            "item_title": item_title,
-            "deltas": deltas,
-            "reward": reward.__dict__,
-            "daily": daily_payload,
-            "notifications": notifications,
-            "stats": serialize_pet_state_for_event(pet),
-        },
-    )
     return ActionExecution(pet=pet, event=event, reward=reward, notifications=notifications)
+
+
+def use_item(db: Session, pet: PetState, item_key: str, quantity: int = 1) -> ActionExecution:
+    """Использовать предмет из инвентаря"""
+    return use_items(db, pet, [(item_key, quantity)])
@@ -0,0 +1,97 @@
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models import EventLog, utcnow
+from app.services.cursors import decode_cursor, encode_cursor
+from app.services.event_payloads import is_snapshot, reconstruct_stats
+from app.services.partitions import month_start
+
+
+def history_query(
+    user_id: int,
+    limit: int,
+    before: str | None = None,
+    *,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> Select:
+    """События игрока от новых к старым; keyset по (created_at, id) идёт по индексу ix_event_logs_user_created.
+
+    since/until ограничивают created_at, чтобы на секционированной таблице запрос
+    затрагивал только нужные месячные секции.
+    """
+    stmt = select(EventLog).where(EventLog.user_id == user_id)
+    if before is not None:
+        created_at, event_id = decode_cursor(before, 2)
+        try:
+            created_at, event_id = datetime.fromisoformat(created_at), int(event_id)
+        except (TypeError, ValueError):
+            raise ValueError("Некорректный курсор") from None
+        stmt = stmt.where(tuple_(EventLog.created_at, EventLog.id) < tuple_(created_at, event_id))
+    if since is not None:
+        stmt = stmt.where(EventLog.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(EventLog.created_at < until)
+    return stmt.order_by(EventLog.created_at.desc(), EventLog.id.desc()).limit(limit)
+
+
+def _cursor_for(row: EventLog) -> str:
+    return encode_cursor([row.created_at.isoformat(), row.id])
+
+
+def history_page(db: Session, user_id: int, limit: int, before: str | None = None) -> tuple[list[EventLog], str | None]:
+    """Страница истории и курсор для следующей (None, если дальше событий нет).
+
+    Сначала читается только текущий месяц (новейшая секция); более старые секции
+    затрагиваются, лишь если его не хватило на страницу.
+    """
+    current_month = month_start(utcnow())
+    rows = list(db.execute(history_query(user_id, limit + 1, before, since=current_month)).scalars())
+    if len(rows) <= limit:
+        older_before = _cursor_for(rows[-1]) if rows else before
+        rows.extend(
+            db.execute(history_query(user_id, limit + 1 - len(rows), older_before, until=current_month)).scalars()
+        )
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _cursor_for(rows[-1])
+
+
+def stats_for_rows(db: Session, user_id: int, rows: list[EventLog]) -> dict[int, dict[str, Any]]:
+    """Полное состояние питомца после каждого события страницы: от ближайшего снимка вперёд.
+
+    Снимки пишутся раз в event_snapshot_interval событий, поэтому до страницы
+    дочитывается не больше этого числа строк по тому же индексу.
+    """
+    if not rows:
+        return {}
+    ordered = sorted(rows, key=lambda row: (row.created_at, row.id))
+    oldest = ordered[0]
+    prefix: list[EventLog] = []
+    if not is_snapshot(oldest.payload or {}):
+        older = db.execute(
+            select(EventLog)
+            .where(
+                EventLog.user_id == user_id,
+                tuple_(EventLog.created_at, EventLog.id) < tuple_(oldest.created_at, oldest.id),
+            )
+            .order_by(EventLog.created_at.desc(), EventLog.id.desc())
+            .limit(get_settings().event_snapshot_interval)
+        ).scalars()
+        for row in older:
+            prefix.append(row)
+            if is_snapshot(row.payload or {}):
+                break
+        prefix.reverse()
+    stats = reconstruct_stats(prefix + ordered)
+    return {row.id: stats[row.id] for row in rows}
+
+
+def history_payload(row: EventLog, stats: dict[str, Any] | None = None) -> dict[str, Any]:
+    payload = row.payload if stats is None else {**row.payload, "stats": stats}
+    return {"id": row.id, "action": row.action, "payload": payload, "created_at": row.created_at}
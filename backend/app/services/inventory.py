@@ -0,0 +1,83 @@
+from sqlalchemy import case, delete, update
+from sqlalchemy.orm import Session
+
+from app.database import dialect_insert
+from app.models import Inventory, utcnow
+
+
+# Стартовые предметы - базовый набор для начала игры
+STARTER_PACK: dict[str, int] = {
+    "food_apple": 8,
+    "food_carrot": 5,
+    "wash_soap": 5,
+    "medicine_bandage": 3,
+    "toy_ball": 3,
+}
+
+
+def _expire_cached_rows(db: Session, user_id: int, item_keys: set[str]) -> None:
+    # Изменения идут мимо ORM, поэтому загруженные в сессию строки нужно перечитать
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Inventory) and obj.user_id == user_id and obj.item_key in item_keys:
+            db.expire(obj)
+
+
+def grant_items(db: Session, user_id: int, quantities: dict[str, int]) -> None:
+    """Выдать предметы одним INSERT ... ON CONFLICT DO UPDATE (quantity = quantity + delta)."""
+    quantities = {item_key: qty for item_key, qty in quantities.items() if qty > 0}
+    if not quantities:
+        return
+    table = Inventory.__table__
+    now = utcnow()
+    stmt = dialect_insert(db, table).values(
+        [
+            {"user_id": user_id, "item_key": item_key, "quantity": qty, "updated_at": now}
+            for item_key, qty in quantities.items()
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "item_key"],
+        set_={"quantity": table.c.quantity + stmt.excluded.quantity, "updated_at": now},
+    )
+    db.execute(stmt)
+    _expire_cached_rows(db, user_id, set(quantities))
+
+
+def consume_items(db: Session, user_id: int, quantities: dict[str, int]) -> None:
+    """Списать предметы атомарно: один UPDATE с CASE по item_key и условием quantity >= qty,
+    затем один DELETE опустевших строк — два запроса при любом числе предметов.
+
+    Если какого-то предмета не хватает (например, его уже потратил параллельный запрос),
+    UPDATE затронет меньше строк, чем предметов в заказе, и поднимется ValueError; откат
+    остальных списаний — забота вызывающей транзакции.
+    """
+    quantities = {item_key: qty for item_key, qty in quantities.items() if qty > 0}
+    if not quantities:
+        return
+    table = Inventory.__table__
+    qty_for_item = case(quantities, value=table.c.item_key)
+    result = db.execute(
+        update(table)
+        .where(
+            table.c.user_id == user_id,
+            table.c.item_key.in_(list(quantities)),
+            table.c.quantity >= qty_for_item,
+        )
+        .values(quantity=table.c.quantity - qty_for_item, updated_at=utcnow())
+    )
+    if result.rowcount != len(quantities):
+        raise ValueError("Недостаточно предметов в инвентаре")
+    db.execute(
+        delete(table).where(
+            table.c.user_id == user_id,
+            table.c.item_key.in_(list(quantities)),
+            table.c.quantity <= 0,
+        )
+    )
+    _expire_cached_rows(db, user_id, set(quantities))
+
+
+def apply_inventory_deltas(db: Session, user_id: int, deltas: dict[str, int]) -> None:
+    """Пакетно изменить инвентарь: положительные дельты выдаются, отрицательные списываются."""
+    consume_items(db, user_id, {item_key: -delta for item_key, delta in deltas.items() if delta < 0})
+    grant_items(db, user_id, {item_key: delta for item_key, delta in deltas.items() if delta > 0})
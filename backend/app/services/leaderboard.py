@@ -0,0 +1,871 @@
+"""Таблицы лидеров в отсортированных множествах.
+
+Счёт хранится отдельно от pet_states: в Redis (ZSET) в проде и в памяти процесса
+в dev и тестах. Множества обновляются при коммите любой сессии, в которой менялись
+coins, level, xp или stage питомца, поэтому отдельные пути записи ничего не вызывают сами.
+Если множества разошлись с базой (сбой Redis, ручная правка), их пересобирает
+python -m app.services.leaderboard rebuild
+
+Пересборка идёт под блокировкой rebuild_lock, одна на все процессы. Изменения,
+опубликованные, пока она читает базу, пишутся и в живые множества, и в журнал
+пересборки; после подмены множеств журнал применяется к новым, поэтому они не теряются.
+Маркер собранности (built:<ширина>) проверяется не реже раза в BUILT_CHECK_SECONDS:
+после FLUSHALL или переключения на пустую реплику множества пересоберутся сами. Redis
+для таблиц лидеров должен работать с maxmemory-policy noeviction — вытеснение
+отдельного множества маркер не заметит.
+
+Хранилище в памяти (LEADERBOARD_BACKEND=memory) — только для dev и тестов с одним
+процессом: у каждого воркера API своя копия, публикации Celery и снимки
+refresh_leaderboard_snapshots в неё не попадают.
+
+Кроме общей таблицы у каждой есть «сетки» — отдельные множества по стадии и по
+диапазону уровней, так что любая сетка и любая страница стоят O(log n + k).
+Порядок везде: счёт по убыванию, при равенстве — user_id по убыванию (участники
+хранятся строками фиксированной ширины, и ZREVRANGE сравнивает их как числа).
+"""
+
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Any
+import uuid
+
+import redis
+from sqlalchemy import Select, event, func, inspect, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import PetState, utcnow
+from app.services.cursors import decode_cursor, encode_cursor
+
+
+logger = logging.getLogger(__name__)
+
+BOARDS = ("wealth", "level")
+STAGES = ("baby", "child", "teen", "adult", "gold_adult", "dark_adult", "fun_adult", "fire_adult")
+LEVEL_BANDS = ((1, 5), (6, 10), (11, 20), (21, 35), (36, 50), (51, None))
+# Опыт внутри уровня заведомо меньше множителя, поэтому level * SCALE + xp упорядочивает как (level, xp)
+LEVEL_SCORE_SCALE = 10**8
+MEMBER_WIDTH = 20
+REBUILD_CHUNK_SIZE = 1000
+SNAPSHOT_SIZE = 100
+# Снимок старше стольких интервалов обновления считается брошенным: его пересчитывает
+# один запрос под блокировкой, остальные пока отдают устаревший
+SNAPSHOT_STALE_INTERVALS = 3
+# Снимок хранится дольше, чем считается свежим, чтобы при отставшем beat было что отдать
+SNAPSHOT_KEEP_SECONDS = 86400
+# Сколько запрос ждёт первый снимок, который считает другой процесс
+SNAPSHOT_WAIT_SECONDS = 5.0
+# Пересборка держит блокировку не дольше; упавший процесс не заблокирует пересборку навсегда
+REBUILD_LOCK_SECONDS = 300
+# Как долго процесс доверяет тому, что множества собраны, прежде чем снова проверить маркер
+BUILT_CHECK_SECONDS = 5
+
+_TRACKED_FIELDS = ("coins", "level", "xp", "stage")
+_PENDING_KEY = "leaderboard_pending"
+
+
+def _band_label(low: int, high: int | None) -> str:
+    return f"{low}+" if high is None else f"{low}-{high}"
+
+
+BRACKETS = tuple(f"stage:{stage}" for stage in STAGES) + tuple(
+    f"band:{_band_label(low, high)}" for low, high in LEVEL_BANDS
+)
+
+
+def set_key(board: str, bracket: str | None = None) -> str:
+    return board if bracket is None else f"{board}:{bracket}"
+
+
+ALL_SET_KEYS = tuple(set_key(board, bracket) for board in BOARDS for bracket in (None, *BRACKETS))
+
+
+def parse_bracket(value: str | None) -> str | None:
+    if value is None or value == "":
+        return None
+    if value not in BRACKETS:
+        raise ValueError("Неизвестная сетка таблицы лидеров")
+    return value
+
+
+class LeaderboardUnavailable(Exception):
+    """Хранилище ещё собирается другим процессом."""
+
+
+def member_for(user_id: int) -> str:
+    return f"{user_id:0{MEMBER_WIDTH}d}"
+
+
+def brackets_for(level: int, stage: str) -> list[str]:
+    brackets = []
+    if stage in STAGES:
+        brackets.append(f"stage:{stage}")
+    for low, high in LEVEL_BANDS:
+        if level >= low and (high is None or level <= high):
+            brackets.append(f"band:{_band_label(low, high)}")
+            break
+    return brackets
+
+
+def board_scores(coins: int, level: int, xp: int) -> dict[str, float]:
+    return {"wealth": float(coins), "level": float(level * LEVEL_SCORE_SCALE + xp)}
+
+
+def set_scores(coins: int, level: int, xp: int, stage: str) -> dict[str, float]:
+    """Счёт питомца во всех множествах, где он должен состоять."""
+    scores: dict[str, float] = {}
+    brackets = brackets_for(level, stage)
+    for board, score in board_scores(coins, level, xp).items():
+        scores[board] = score
+        for bracket in brackets:
+            scores[set_key(board, bracket)] = score
+    return scores
+
+
+@dataclass
+class MemberChange:
+    scores: dict[str, float] = field(default_factory=dict)
+    removed: set[str] = field(default_factory=set)
+
+
+class InMemoryLeaderboardStore:
+    """Отсортированные списки (score, member) на процесс; порядок равных счётов как у ZREVRANGE."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._scores: dict[str, dict[str, float]] = {key: {} for key in ALL_SET_KEYS}
+        self._sorted: dict[str, list[tuple[float, str]]] = {key: [] for key in ALL_SET_KEYS}
+        self._built = False
+        self._rebuild_lock = threading.Lock()
+        self._journal: list[dict[str, MemberChange]] | None = None
+        self._snapshots: dict[str, tuple[float, str]] = {}
+        self._snapshot_locks = {board: threading.Lock() for board in BOARDS}
+
+    def _discard(self, key: str, member: str) -> None:
+        score = self._scores[key].pop(member, None)
+        if score is not None:
+            entries = self._sorted[key]
+            del entries[bisect_left(entries, (score, member))]
+
+    def _apply(self, changes: dict[str, MemberChange]) -> None:
+        for member, change in changes.items():
+            for key in change.removed | set(change.scores):
+                self._discard(key, member)
+            for key, score in change.scores.items():
+                self._scores[key][member] = score
+                insort(self._sorted[key], (score, member))
+
+    def update(self, changes: dict[str, MemberChange]) -> None:
+        with self._lock:
+            self._apply(changes)
+            if self._journal is not None:
+                self._journal.append(changes)
+
+    def begin_rebuild(self) -> None:
+        with self._lock:
+            self._journal = []
+
+    def replace_all(self, scores: dict[str, dict[str, float]]) -> None:
+        with self._lock:
+            for key in ALL_SET_KEYS:
+                self._scores[key] = dict(scores.get(key, {}))
+                self._sorted[key] = sorted((score, member) for member, score in self._scores[key].items())
+            for changes in self._journal or ():
+                self._apply(changes)
+            self._journal = None
+            self._built = True
+
+    def is_built(self) -> bool:
+        return self._built
+
+    def try_lock_rebuild(self) -> bool:
+        return self._rebuild_lock.acquire(blocking=False)
+
+    def unlock_rebuild(self) -> None:
+        self._rebuild_lock.release()
+
+    def range(self, key: str, start: int, stop: int) -> list[tuple[str, float]]:
+        """Участники с местами start..stop включительно (с нуля, по убыванию счёта)."""
+        with self._lock:
+            entries = self._sorted[key]
+            count = len(entries)
+            result = []
+            for index in range(max(0, start), min(stop, count - 1) + 1):
+                score, member = entries[count - 1 - index]
+                result.append((member, score))
+            return result
+
+    def size(self, key: str) -> int:
+        return len(self._scores[key])
+
+    def rank(self, key: str, member: str) -> int | None:
+        with self._lock:
+            score = self._scores[key].get(member)
+            if score is None:
+                return None
+            entries = self._sorted[key]
+            return len(entries) - 1 - bisect_left(entries, (score, member))
+
+    def position_after(self, key: str, score: float, member: str) -> int:
+        """Место первого участника, идущего после (score, member) — даже если такого участника уже нет."""
+        with self._lock:
+            entries = self._sorted[key]
+            return len(entries) - bisect_left(entries, (score, member))
+
+    def save_snapshot(self, board: str, generated_at: float, body: str, ttl_seconds: int) -> None:
+        self._snapshots[board] = (generated_at, body)
+
+    def load_snapshot(self, board: str) -> tuple[float, str] | None:
+        return self._snapshots.get(board)
+
+    def try_lock_snapshot(self, board: str) -> bool:
+        return self._snapshot_locks[board].acquire(blocking=False)
+
+    def unlock_snapshot(self, board: str) -> None:
+        self._snapshot_locks[board].release()
+
+
+# Операции ["zadd", ключ, участник, счёт] / ["zrem", ключ, участник] в JSON
+_APPLY_OPS_LUA = """
+local function apply(ops)
+  for _, op in ipairs(cjson.decode(ops)) do
+    if op[1] == 'zadd' then
+      redis.call('zadd', op[2], op[4], op[3])
+    else
+      redis.call('zrem', op[2], op[3])
+    end
+  end
+end
+"""
+# KEYS: блокировка пересборки, журнал. Пока идёт пересборка, изменения дописываются в журнал
+_UPDATE_SCRIPT = _APPLY_OPS_LUA + """
+apply(ARGV[1])
+if redis.call('exists', KEYS[1]) == 1 then
+  redis.call('rpush', KEYS[2], ARGV[1])
+  redis.call('expire', KEYS[2], ARGV[2])
+end
+return 0
+"""
+# KEYS: журнал, маркер; ARGV: пары (временный ключ, живой ключ). Подмена и повтор журнала атомарны
+_SWAP_SCRIPT = _APPLY_OPS_LUA + """
+for i = 1, #ARGV, 2 do
+  if redis.call('exists', ARGV[i]) == 1 then
+    redis.call('rename', ARGV[i], ARGV[i + 1])
+  else
+    redis.call('del', ARGV[i + 1])
+  end
+end
+for _, ops in ipairs(redis.call('lrange', KEYS[1], 0, -1)) do
+  apply(ops)
+end
+redis.call('del', KEYS[1])
+redis.call('set', KEYS[2], '1')
+return 0
+"""
+
+
+class RedisLeaderboardStore:
+    def __init__(self, client: redis.Redis, prefix: str = "leaderboard") -> None:
+        self._client = client
+        self._prefix = prefix
+        self._built_checked_at: float | None = None
+        self._rebuild_token: str | None = None
+        self._snapshot_tokens: dict[str, str] = {}
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}:{key}"
+
+    def update(self, changes: dict[str, MemberChange]) -> None:
+        ops: list[list[Any]] = []
+        for member, change in changes.items():
+            ops.extend(["zrem", self._key(key), member] for key in sorted(change.removed - set(change.scores)))
+            ops.extend(["zadd", self._key(key), member, repr(score)] for key, score in change.scores.items())
+        if ops:
+            self._client.eval(
+                _UPDATE_SCRIPT,
+                2,
+                self._key("rebuild_lock"),
+                self._key("rebuild_journal"),
+                json.dumps(ops),
+                REBUILD_LOCK_SECONDS,
+            )
+
+    def begin_rebuild(self) -> None:
+        # Журнал прошлой, упавшей пересборки к этой не относится
+        self._client.delete(self._key("rebuild_journal"))
+
+    def replace_all(self, scores: dict[str, dict[str, float]]) -> None:
+        pairs: list[str] = []
+        for key in ALL_SET_KEYS:
+            # Собираем во временные ключи и подменяем одним скриптом, чтобы читатели не видели
+            # пустую таблицу; изменения, пришедшие за время сборки, скрипт применяет из журнала
+            temp_key = f"{self._key(key)}:rebuild:{uuid.uuid4().hex}"
+            items = list(scores.get(key, {}).items())
+            for start in range(0, len(items), REBUILD_CHUNK_SIZE):
+                self._client.zadd(temp_key, dict(items[start : start + REBUILD_CHUNK_SIZE]))
+            pairs.extend((temp_key, self._key(key)))
+        self._client.eval(
+            _SWAP_SCRIPT, 2, self._key("rebuild_journal"), self._key(f"built:{MEMBER_WIDTH}"), *pairs
+        )
+        self._built_checked_at = time.monotonic()
+
+    def is_built(self) -> bool:
+        # Маркер зависит от формата участников, чтобы смена формата вызвала пересборку;
+        # перепроверяется раз в BUILT_CHECK_SECONDS, чтобы заметить FLUSHALL или пустую реплику
+        now = time.monotonic()
+        if self._built_checked_at is not None and now - self._built_checked_at < BUILT_CHECK_SECONDS:
+            return True
+        if self._client.exists(self._key(f"built:{MEMBER_WIDTH}")):
+            self._built_checked_at = now
+            return True
+        self._built_checked_at = None
+        return False
+
+    def try_lock_rebuild(self) -> bool:
+        token = uuid.uuid4().hex
+        if self._client.set(self._key("rebuild_lock"), token, nx=True, ex=REBUILD_LOCK_SECONDS):
+            self._rebuild_token = token
+            return True
+        return False
+
+    def unlock_rebuild(self) -> None:
+        key = self._key("rebuild_lock")
+        if self._rebuild_token is not None and self._client.get(key) == self._rebuild_token:
+            self._client.delete(key)
+        self._rebuild_token = None
+
+    def range(self, key: str, start: int, stop: int) -> list[tuple[str, float]]:
+        return [
+            (str(member), float(score))
+            for member, score in self._client.zrevrange(self._key(key), max(0, start), stop, withscores=True)
+        ]
+
+    def size(self, key: str) -> int:
+        return int(self._client.zcard(self._key(key)))
+
+    def rank(self, key: str, member: str) -> int | None:
+        rank = self._client.zrevrank(self._key(key), member)
+        return None if rank is None else int(rank)
+
+    def position_after(self, key: str, score: float, member: str) -> int:
+        full_key = self._key(key)
+        current = self._client.zscore(full_key, member)
+        if current is not None and float(current) == score:
+            return int(self._client.zrevrank(full_key, member)) + 1
+        # Участник курсора сдвинулся: все с большим счётом плюс равные с бо́льшим member.
+        # Равные идут по убыванию member (ширина фиксирована, сравнение как у чисел),
+        # поэтому границу ищем двоичным поиском по местам: O(log ties · log n), а не O(ties)
+        low = int(self._client.zcount(full_key, f"({score}", "+inf"))
+        high = low + int(self._client.zcount(full_key, score, score))
+        while low < high:
+            middle = (low + high) // 2
+            probe = self._client.zrevrange(full_key, middle, middle)
+            if probe and str(probe[0]) > member:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def save_snapshot(self, board: str, generated_at: float, body: str, ttl_seconds: int) -> None:
+        key = self._key(f"snapshot:{board}")
+        pipe = self._client.pipeline(transaction=True)
+        pipe.hset(key, mapping={"generated_at": repr(generated_at), "body": body})
+        pipe.expire(key, ttl_seconds)
+        pipe.execute()
+
+    def load_snapshot(self, board: str) -> tuple[float, str] | None:
+        values = self._client.hgetall(self._key(f"snapshot:{board}"))
+        if not values:
+            return None
+        return float(values["generated_at"]), values["body"]
+
+    def try_lock_snapshot(self, board: str) -> bool:
+        token = uuid.uuid4().hex
+        if self._client.set(self._key(f"snapshot_lock:{board}"), token, nx=True, ex=REBUILD_LOCK_SECONDS):
+            self._snapshot_tokens[board] = token
+            return True
+        return False
+
+    def unlock_snapshot(self, board: str) -> None:
+        key = self._key(f"snapshot_lock:{board}")
+        token = self._snapshot_tokens.pop(board, None)
+        if token is not None and self._client.get(key) == token:
+            self._client.delete(key)
+
+
+LeaderboardStore = InMemoryLeaderboardStore | RedisLeaderboardStore
+
+_store: LeaderboardStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_leaderboard_store() -> LeaderboardStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                settings = get_settings()
+                if settings.leaderboard_backend == "redis":
+                    _store = RedisLeaderboardStore(redis.Redis.from_url(settings.redis_url, decode_responses=True))
+                else:
+                    _store = InMemoryLeaderboardStore()
+    return _store
+
+
+def set_leaderboard_store(store: LeaderboardStore | None) -> None:
+    """Подменить хранилище (тесты); None — создать заново по настройкам."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def _previous_value(obj: PetState, name: str) -> Any:
+    history = inspect(obj).attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(obj, name)
+
+
+def _record_change(pending: dict[str, MemberChange], member: str, scores: dict[str, float], removed: set[str]) -> None:
+    change = pending.setdefault(member, MemberChange())
+    change.removed = (change.removed | removed) - set(scores)
+    change.scores = scores
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_leaderboard_changes(session: Session, flush_context: Any) -> None:
+    pending: dict[str, MemberChange] = session.info.setdefault(_PENDING_KEY, {})
+    for obj in session.new:
+        if isinstance(obj, PetState):
+            _record_change(pending, member_for(obj.user_id), set_scores(obj.coins, obj.level, obj.xp, obj.stage), set())
+    for obj in session.dirty:
+        if isinstance(obj, PetState):
+            attrs = inspect(obj).attrs
+            if not any(attrs[name].history.has_changes() for name in _TRACKED_FIELDS):
+                continue
+            scores = set_scores(obj.coins, obj.level, obj.xp, obj.stage)
+            # Питомец мог перейти в другую сетку — из прежних множеств его нужно убрать
+            previous = set_scores(*(_previous_value(obj, name) for name in _TRACKED_FIELDS))
+            _record_change(pending, member_for(obj.user_id), scores, set(previous) - set(scores))
+    for obj in session.deleted:
+        if isinstance(obj, PetState):
+            _record_change(pending, member_for(obj.user_id), {}, set(ALL_SET_KEYS))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_leaderboard_changes(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    try:
+        get_leaderboard_store().update(pending)
+    except redis.RedisError:
+        # Таблица лидеров — производные данные: расхождение исправит rebuild
+        logger.exception("leaderboard update failed users=%s", len(pending))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_leaderboard_changes(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _wait_for_rebuild_lock(store: LeaderboardStore) -> None:
+    deadline = time.monotonic() + REBUILD_LOCK_SECONDS
+    while not store.try_lock_rebuild():
+        if time.monotonic() >= deadline:
+            raise LeaderboardUnavailable()
+        time.sleep(1)
+
+
+def rebuild_leaderboards(db: Session, store: LeaderboardStore | None = None, *, locked: bool = False) -> int:
+    """Пересобрать все таблицы и сетки из pet_states; возвращает число питомцев.
+
+    Без locked ждёт, пока закончится чужая пересборка, и берёт блокировку сама.
+    """
+    store = store or get_leaderboard_store()
+    if not locked:
+        _wait_for_rebuild_lock(store)
+        try:
+            return rebuild_leaderboards(db, store, locked=True)
+        finally:
+            store.unlock_rebuild()
+
+    store.begin_rebuild()
+    scores: dict[str, dict[str, float]] = {key: {} for key in ALL_SET_KEYS}
+    count = 0
+    last_user_id = None
+    while True:
+        stmt = select(PetState.user_id, PetState.coins, PetState.level, PetState.xp, PetState.stage).order_by(
+            PetState.user_id
+        )
+        if last_user_id is not None:
+            stmt = stmt.where(PetState.user_id > last_user_id)
+        rows = db.execute(stmt.limit(REBUILD_CHUNK_SIZE)).all()
+        if not rows:
+            break
+        for user_id, coins, level, xp, stage in rows:
+            member = member_for(user_id)
+            for key, score in set_scores(coins, level, xp, stage).items():
+                scores[key][member] = score
+        count += len(rows)
+        last_user_id = rows[-1].user_id
+
+    store.replace_all(scores)
+    return count
+
+
+def _ensure_built(db: Session, store: LeaderboardStore) -> None:
+    """Заполнить хранилище из базы после рестарта (память) или первого деплоя (Redis).
+
+    Пересобирает только процесс, взявший блокировку; остальные получают
+    LeaderboardUnavailable и отвечают из базы, а не запускают ещё одну пересборку.
+    """
+    if store.is_built():
+        return
+    if not store.try_lock_rebuild():
+        raise LeaderboardUnavailable()
+    try:
+        if not store.is_built():
+            rebuild_leaderboards(db, store, locked=True)
+    finally:
+        store.unlock_rebuild()
+
+
+def _entries_for(db: Session, store: LeaderboardStore, ranked: list[tuple[str, float]], first_rank: int) -> list[dict[str, Any]]:
+    user_ids = [int(member) for member, _ in ranked]
+    details = {
+        row.user_id: row
+        for row in db.execute(
+            select(PetState.user_id, PetState.name, PetState.level, PetState.coins).where(PetState.user_id.in_(user_ids))
+        )
+    }
+    missing = {member_for(user_id): MemberChange(removed=set(ALL_SET_KEYS)) for user_id in user_ids if user_id not in details}
+    if missing:
+        store.update(missing)
+    return [
+        {
+            "user_id": user_id,
+            "name": details[user_id].name,
+            "level": details[user_id].level,
+            "coins": details[user_id].coins,
+            "rank": first_rank + offset,
+        }
+        for offset, user_id in enumerate(user_ids)
+        if user_id in details
+    ]
+
+
+def top_query(board: str, limit: int) -> Select:
+    """Top-N из pet_states: только колонки покрывающего индекса, порядок совпадает с индексом."""
+    stmt = select(PetState.user_id, PetState.name, PetState.level, PetState.coins)
+    # При равном счёте — user_id по убыванию, как в отсортированных множествах хранилища
+    if board == "wealth":
+        stmt = stmt.order_by(PetState.coins.desc(), PetState.user_id.desc())
+    else:
+        stmt = stmt.order_by(PetState.level.desc(), PetState.xp.desc(), PetState.user_id.desc())
+    return stmt.limit(limit)
+
+
+def top_entries_from_db(db: Session, board: str, limit: int) -> list[dict[str, Any]]:
+    return [
+        {"user_id": row.user_id, "name": row.name, "level": row.level, "coins": row.coins, "rank": index + 1}
+        for index, row in enumerate(db.execute(top_query(board, limit)))
+    ]
+
+
+def top_entries(db: Session, board: str, limit: int) -> list[dict[str, Any]]:
+    store = get_leaderboard_store()
+    try:
+        _ensure_built(db, store)
+        ranked = store.range(board, 0, limit - 1)
+    except LeaderboardUnavailable:
+        return top_entries_from_db(db, board, limit)
+    except redis.RedisError:
+        # Redis недоступен — отвечаем из базы по индексу
+        logger.exception("leaderboard store unavailable, falling back to database")
+        return top_entries_from_db(db, board, limit)
+    return _entries_for(db, store, ranked, first_rank=1)
+
+
+def _db_sort_columns(board: str) -> tuple[Any, ...]:
+    # Все колонки по убыванию, поэтому «идёт раньше» — это сравнение кортежей
+    if board == "wealth":
+        return (PetState.coins, PetState.user_id)
+    return (PetState.level, PetState.xp, PetState.user_id)
+
+
+def _db_sort_key(board: str, score: float, user_id: int) -> tuple[int, ...]:
+    if board == "wealth":
+        return (int(score), user_id)
+    level, xp = divmod(int(score), LEVEL_SCORE_SCALE)
+    return (level, xp, user_id)
+
+
+def _db_ranked(board: str, bracket: str | None) -> Select:
+    """Таблица или сетка из pet_states в порядке хранилища."""
+    stmt = select(PetState.user_id, PetState.name, PetState.level, PetState.coins, PetState.xp).order_by(
+        *(column.desc() for column in _db_sort_columns(board))
+    )
+    if bracket is not None:
+        kind, value = bracket.split(":", 1)
+        if kind == "stage":
+            stmt = stmt.where(PetState.stage == value)
+        else:
+            low, high = next(band for band in LEVEL_BANDS if _band_label(*band) == value)
+            stmt = stmt.where(PetState.level >= low)
+            if high is not None:
+                stmt = stmt.where(PetState.level <= high)
+    return stmt
+
+
+def _db_count(db: Session, stmt: Select) -> int:
+    return int(db.execute(select(func.count()).select_from(stmt.order_by(None).subquery())).scalar_one())
+
+
+def _db_entries(rows: list[Any], first_rank: int) -> list[dict[str, Any]]:
+    return [
+        {"user_id": row.user_id, "name": row.name, "level": row.level, "coins": row.coins, "rank": first_rank + offset}
+        for offset, row in enumerate(rows)
+    ]
+
+
+def _db_score(board: str, row: Any) -> int:
+    return row.coins if board == "wealth" else row.level * LEVEL_SCORE_SCALE + row.xp
+
+
+def _page_from_db(
+    db: Session, board: str, limit: int, bracket: str | None, after: tuple[float, int] | None
+) -> dict[str, Any]:
+    stmt = _db_ranked(board, bracket)
+    start = 0
+    if after is not None:
+        key = tuple_(*_db_sort_columns(board))
+        bound = _db_sort_key(board, *after)
+        start = _db_count(db, stmt.where(key >= bound))
+        stmt = stmt.where(key < bound)
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([_db_score(board, rows[-1]), rows[-1].user_id])
+    return {"type": board, "bracket": bracket, "entries": _db_entries(rows, start + 1), "next_cursor": next_cursor}
+
+
+def _rank_from_db(db: Session, board: str, user_id: int, bracket: str | None) -> int | None:
+    stmt = _db_ranked(board, bracket)
+    own = db.execute(stmt.where(PetState.user_id == user_id)).one_or_none()
+    if own is None:
+        return None
+    bound = _db_sort_key(board, _db_score(board, own), user_id)
+    return _db_count(db, stmt.where(tuple_(*_db_sort_columns(board)) > bound)) + 1
+
+
+def _neighbourhood_from_db(db: Session, board: str, user_id: int, k: int, bracket: str | None) -> dict[str, Any] | None:
+    rank = _rank_from_db(db, board, user_id, bracket)
+    if rank is None:
+        return None
+    stmt = _db_ranked(board, bracket)
+    start = max(0, rank - 1 - k)
+    rows = db.execute(stmt.offset(start).limit(rank + k - start)).all()
+    return {"type": board, "rank": rank, "total": _db_count(db, stmt), "entries": _db_entries(rows, start + 1)}
+
+
+def _log_fallback(exc: Exception) -> None:
+    if isinstance(exc, redis.RedisError):
+        logger.error("leaderboard store unavailable, falling back to database", exc_info=exc)
+
+
+def page_entries(
+    db: Session, board: str, limit: int, *, bracket: str | None = None, cursor: str | None = None
+) -> dict[str, Any]:
+    """Страница таблицы или сетки после курсора (счёт, user_id): O(log n + limit) на любой глубине.
+
+    Если хранилище недоступно или пересобирается, страница читается из pet_states.
+    """
+    after = None
+    if cursor is not None:
+        score, user_id = decode_cursor(cursor, 2)
+        try:
+            after = (float(int(score)), int(user_id))
+        except (TypeError, ValueError):
+            raise ValueError("Некорректный курсор") from None
+    store = get_leaderboard_store()
+    try:
+        return _page_from_store(db, store, board, limit, bracket, after)
+    except (redis.RedisError, LeaderboardUnavailable) as exc:
+        _log_fallback(exc)
+        return _page_from_db(db, board, limit, bracket, after)
+
+
+def _page_from_store(
+    db: Session,
+    store: LeaderboardStore,
+    board: str,
+    limit: int,
+    bracket: str | None,
+    after: tuple[float, int] | None,
+) -> dict[str, Any]:
+    _ensure_built(db, store)
+    key = set_key(board, bracket)
+    start = 0
+    if after is not None:
+        start = store.position_after(key, after[0], member_for(after[1]))
+
+    ranked = store.range(key, start, start + limit - 1)
+    next_cursor = None
+    if len(ranked) == limit and start + limit < store.size(key):
+        last_member, last_score = ranked[-1]
+        next_cursor = encode_cursor([int(last_score), int(last_member)])
+    return {
+        "type": board,
+        "bracket": bracket,
+        "entries": _entries_for(db, store, ranked, first_rank=start + 1),
+        "next_cursor": next_cursor,
+    }
+
+
+@dataclass(frozen=True)
+class LeaderboardSnapshot:
+    board: str
+    generated_at: datetime
+    body: str  # JSON-список записей top-SNAPSHOT_SIZE, готовый к отдаче как есть
+
+    def entries(self, limit: int) -> list[dict[str, Any]]:
+        return json.loads(self.body)[:limit]
+
+
+def refresh_snapshot(db: Session, board: str) -> LeaderboardSnapshot:
+    """Пересчитать top-SNAPSHOT_SIZE и сохранить его сериализованным в хранилище."""
+    entries = top_entries(db, board, SNAPSHOT_SIZE)
+    generated_at = utcnow()
+    body = json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+    try:
+        get_leaderboard_store().save_snapshot(board, generated_at.timestamp(), body, SNAPSHOT_KEEP_SECONDS)
+    except redis.RedisError:
+        logger.exception("leaderboard snapshot save failed board=%s", board)
+    return LeaderboardSnapshot(board=board, generated_at=generated_at, body=body)
+
+
+def _load_snapshot(store: LeaderboardStore, board: str) -> LeaderboardSnapshot | None:
+    try:
+        stored = store.load_snapshot(board)
+    except redis.RedisError:
+        logger.exception("leaderboard snapshot load failed board=%s", board)
+        return None
+    if stored is None:
+        return None
+    return LeaderboardSnapshot(board=board, generated_at=datetime.fromtimestamp(stored[0], UTC), body=stored[1])
+
+
+def _try_lock_snapshot(store: LeaderboardStore, board: str) -> bool:
+    try:
+        return store.try_lock_snapshot(board)
+    except redis.RedisError:
+        logger.exception("leaderboard snapshot lock failed board=%s", board)
+        return False
+
+
+def _refresh_locked(db: Session, store: LeaderboardStore, board: str) -> LeaderboardSnapshot:
+    try:
+        return refresh_snapshot(db, board)
+    finally:
+        try:
+            store.unlock_snapshot(board)
+        except redis.RedisError:
+            logger.exception("leaderboard snapshot unlock failed board=%s", board)
+
+
+def get_snapshot(db: Session, board: str) -> LeaderboardSnapshot:
+    """Снимок из хранилища, который обновляет beat-задача refresh_leaderboard_snapshots.
+
+    Если beat отстал, снимок пересчитывает один запрос, взявший блокировку снимка, а
+    остальные отдают устаревший. Если снимка нет совсем, запросы без блокировки ждут,
+    пока его посчитает владелец блокировки, и после SNAPSHOT_WAIT_SECONDS получают
+    LeaderboardUnavailable.
+    """
+    store = get_leaderboard_store()
+    max_age = get_settings().leaderboard_snapshot_interval_seconds * SNAPSHOT_STALE_INTERVALS
+    snapshot = _load_snapshot(store, board)
+    if snapshot is not None:
+        if (utcnow() - snapshot.generated_at).total_seconds() > max_age and _try_lock_snapshot(store, board):
+            return _refresh_locked(db, store, board)
+        return snapshot
+
+    deadline = time.monotonic() + SNAPSHOT_WAIT_SECONDS
+    while not _try_lock_snapshot(store, board):
+        time.sleep(0.05)
+        snapshot = _load_snapshot(store, board)
+        if snapshot is not None:
+            return snapshot
+        if time.monotonic() >= deadline:
+            raise LeaderboardUnavailable()
+    return _refresh_locked(db, store, board)
+
+
+def rank_of(db: Session, board: str, user_id: int, bracket: str | None = None) -> int | None:
+    """Место игрока (с единицы) или None, если его нет в таблице."""
+    store = get_leaderboard_store()
+    try:
+        _ensure_built(db, store)
+        rank = store.rank(set_key(board, bracket), member_for(user_id))
+    except (redis.RedisError, LeaderboardUnavailable) as exc:
+        _log_fallback(exc)
+        return _rank_from_db(db, board, user_id, bracket)
+    return None if rank is None else rank + 1
+
+
+def neighbourhood(db: Session, board: str, user_id: int, k: int, bracket: str | None = None) -> dict[str, Any] | None:
+    """Место игрока и по k соседей сверху и снизу: ZREVRANK плюс ZREVRANGE, оба за O(log n + k).
+
+    Если хранилище недоступно или пересобирается, считается по pet_states.
+    """
+    store = get_leaderboard_store()
+    try:
+        return _neighbourhood_from_store(db, store, board, user_id, k, bracket)
+    except (redis.RedisError, LeaderboardUnavailable) as exc:
+        _log_fallback(exc)
+        return _neighbourhood_from_db(db, board, user_id, k, bracket)
+
+
+def _neighbourhood_from_store(
+    db: Session, store: LeaderboardStore, board: str, user_id: int, k: int, bracket: str | None
+) -> dict[str, Any] | None:
+    _ensure_built(db, store)
+    key = set_key(board, bracket)
+    member = member_for(user_id)
+    rank = store.rank(key, member)
+    if rank is None:
+        # Публикация могла не дойти (сбой Redis) — досчитываем игрока по базе
+        row = db.execute(
+            select(PetState.coins, PetState.level, PetState.xp, PetState.stage).where(PetState.user_id == user_id)
+        ).one_or_none()
+        if row is None:
+            return None
+        store.update({member: MemberChange(scores=set_scores(row.coins, row.level, row.xp, row.stage))})
+        rank = store.rank(key, member)
+        if rank is None:
+            return None
+
+    start = max(0, rank - k)
+    entries = _entries_for(db, store, store.range(key, start, rank + k), first_rank=start + 1)
+    return {"type": board, "rank": rank + 1, "total": store.size(key), "entries": entries}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Таблицы лидеров")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    with SessionLocal() as db:
+        count = rebuild_leaderboards(db)
+    sys.stdout.write(f"leaderboards rebuilt: {count} pets\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""Доставка уведомлений из notification_outbox в Telegram.
+
+Beat-задачи (soft_push_notifications, daily_report) кладут уведомления в outbox вместе
+со строками журнала, если NOTIFICATION_OUTBOX_ENABLED. Задача deliver_notifications:
+1. забирает пачку готовых строк (SELECT ... FOR UPDATE SKIP LOCKED) и ставит им аренду
+   locked_until — несколько воркеров разбирают outbox, не мешая друг другу, а строки
+   упавшего воркера после конца аренды забирает следующий;
+2. рассылает пачку в NOTIFICATION_DELIVERY_CONCURRENCY потоков через транспорт с пулом
+   постоянных HTTPS-соединений. Лимит Bot API — около 30 сообщений в секунду на бота,
+   поэтому NOTIFICATION_RATE_PER_SECOND делится на NOTIFICATION_DELIVERY_WORKERS —
+   число процессов, которые одновременно выполняют доставку. Токен-бакет один на
+   процесс и переживает вызовы задачи, так что запас не пополняется с каждым запуском;
+3. записывает результаты executemany UPDATE по мере готовности, порциями по
+   NOTIFICATION_DELIVERY_CONCURRENCY сообщений: если воркер упал посреди пачки,
+   повторно уйдут только сообщения из незаписанной порции. Успех — sent, временная
+   ошибка (сеть, 429, 5xx) — повтор через экспоненциальную задержку, постоянная ошибка
+   (бот заблокирован, чат не найден) или исчерпанные попытки — failed.
+
+Транспорт подменяется через set_notification_transport (в тестах — локальный фейк).
+"""
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import http.client
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Protocol
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models import NotificationOutbox
+
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_HOST = "api.telegram.org"
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+
+class DeliveryError(Exception):
+    """Сообщение не доставлено. permanent — повтор бессмыслен; retry_after — пауза от сервера."""
+
+    def __init__(self, message: str, *, permanent: bool = False, retry_after: int | None = None) -> None:
+        super().__init__(message)
+        self.permanent = permanent
+        self.retry_after = retry_after
+
+
+class NotificationTransport(Protocol):
+    def send(self, chat_id: int, text: str) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class TelegramTransport:
+    """sendMessage Bot API через пул постоянных HTTPS-соединений (keep-alive)."""
+
+    def __init__(self, token: str, *, pool_size: int, timeout: float = 10.0, host: str = TELEGRAM_API_HOST) -> None:
+        self.path = f"/bot{token}/sendMessage"
+        self.host = host
+        self.timeout = timeout
+        self._pool: queue.LifoQueue[http.client.HTTPSConnection | None] = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(None)
+
+    def send(self, chat_id: int, text: str) -> None:
+        connection = self._pool.get() or http.client.HTTPSConnection(self.host, timeout=self.timeout)
+        try:
+            body = json.dumps({"chat_id": chat_id, "text": text}, ensure_ascii=False).encode("utf-8")
+            connection.request("POST", self.path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            connection.close()
+            connection = None
+            raise DeliveryError(f"network: {exc}") from exc
+        finally:
+            self._pool.put(connection)
+
+        if response.status == 200:
+            return
+        try:
+            description = json.loads(data)
+        except ValueError:
+            description = {}
+        message = f"{response.status}: {description.get('description', '')}"
+        if response.status == 429:
+            raise DeliveryError(message, retry_after=(description.get("parameters") or {}).get("retry_after"))
+        raise DeliveryError(message, permanent=400 <= response.status < 500)
+
+    def close(self) -> None:
+        while not self._pool.empty():
+            connection = self._pool.get_nowait()
+            if connection is not None:
+                connection.close()
+
+
+class LoggingTransport:
+    """Без токена бота сообщения только пишутся в лог (dev)."""
+
+    def send(self, chat_id: int, text: str) -> None:
+        logger.info("notification chat_id=%s text=%s", chat_id, text)
+
+    def close(self) -> None:
+        pass
+
+
+class TokenBucket:
+    """Не больше rate токенов в секунду с запасом capacity; acquire ждёт, пока токен появится."""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float | None = None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                # Допуск на погрешность float: иначе ожидание может оказаться меньше шага часов
+                if self._tokens >= 1 - 1e-9:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+_transport: NotificationTransport | None = None
+_bucket: TokenBucket | None = None
+
+
+def get_notification_transport() -> NotificationTransport:
+    global _transport
+    if _transport is None:
+        settings = get_settings()
+        if settings.telegram_bot_token:
+            _transport = TelegramTransport(
+                settings.telegram_bot_token, pool_size=settings.notification_delivery_concurrency
+            )
+        else:
+            _transport = LoggingTransport()
+    return _transport
+
+
+def get_token_bucket() -> TokenBucket:
+    """Токен-бакет процесса: доля лимита бота на один процесс доставки."""
+    global _bucket
+    if _bucket is None:
+        settings = get_settings()
+        _bucket = TokenBucket(settings.notification_rate_per_second / max(1, settings.notification_delivery_workers))
+    return _bucket
+
+
+def set_notification_transport(transport: NotificationTransport | None) -> None:
+    global _transport
+    if _transport is not None and _transport is not transport:
+        _transport.close()
+    _transport = transport
+
+
+def render_message(kind: str, payload: dict[str, Any]) -> str:
+    if "messages" in payload:
+        return "\n".join(payload["messages"])
+    summary = payload.get("summary")
+    if summary:
+        return (
+            f"{summary['name']} ({summary['stage_title']}, уровень {summary['level']}): "
+            f"сытость {summary['hunger']}, чистота {summary['hygiene']}, радость {summary['happiness']}, "
+            f"здоровье {summary['health']}, энергия {summary['energy']}"
+        )
+    return kind
+
+
+def enqueue_notifications(db: Session, events: list[dict[str, Any]], now: datetime) -> None:
+    """Положить в outbox уведомления по строкам журнала (user_id, action, payload); коммит за вызывающим."""
+    if not events:
+        return
+    db.execute(
+        insert(NotificationOutbox.__table__),
+        [
+            {
+                "user_id": event["user_id"],
+                "kind": event["action"],
+                "payload": event["payload"],
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+            }
+            for event in events
+        ],
+    )
+
+
+@dataclass
+class ClaimedNotification:
+    id: int
+    user_id: int
+    kind: str
+    payload: dict[str, Any]
+    attempts: int
+
+
+def claim_batch(db: Session, now: datetime, *, batch_size: int, lease: timedelta) -> list[ClaimedNotification]:
+    """Забрать готовые к отправке строки и поставить им аренду; коммитит."""
+    rows = db.execute(
+        select(
+            NotificationOutbox.id,
+            NotificationOutbox.user_id,
+            NotificationOutbox.kind,
+            NotificationOutbox.payload,
+            NotificationOutbox.attempts,
+        )
+        .where(
+            NotificationOutbox.status == "pending",
+            NotificationOutbox.next_attempt_at <= now,
+            (NotificationOutbox.locked_until.is_(None)) | (NotificationOutbox.locked_until <= now),
+        )
+        .order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if rows:
+        db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_([row.id for row in rows]))
+            .values(locked_until=now + lease, attempts=NotificationOutbox.attempts + 1)
+        )
+    db.commit()
+    return [
+        ClaimedNotification(id=row.id, user_id=row.user_id, kind=row.kind, payload=row.payload, attempts=row.attempts + 1)
+        for row in rows
+    ]
+
+
+def retry_delay(attempts: int, base: timedelta) -> timedelta:
+    return min(MAX_RETRY_DELAY, base * 2 ** (attempts - 1))
+
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+
+
+def deliver_batch(
+    db: Session,
+    batch: list[ClaimedNotification],
+    now: datetime,
+    *,
+    transport: NotificationTransport,
+    bucket: TokenBucket,
+    concurrency: int,
+    max_attempts: int,
+    retry_base: timedelta,
+) -> DeliveryStats:
+    """Разослать пачку; результаты пишутся порциями по concurrency сообщений по мере готовности."""
+
+    def send(item: ClaimedNotification) -> DeliveryError | None:
+        bucket.acquire()
+        try:
+            transport.send(item.user_id, render_message(item.kind, item.payload))
+        except DeliveryError as exc:
+            return exc
+        return None
+
+    stats = DeliveryStats()
+    table = NotificationOutbox.__table__
+    statement = update(table).where(table.c.id == bindparam("target_id"))
+    flush_size = max(1, concurrency)
+    results: list[dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batch)))) as pool:
+        futures = {pool.submit(send, item): item for item in batch}
+        try:
+            for future in as_completed(futures):
+                item, error = futures[future], future.result()
+                row = {"target_id": item.id, "locked_until": None, "sent_at": None, "last_error": None}
+                if error is None:
+                    stats.sent += 1
+                    results.append({**row, "status": "sent", "sent_at": now, "next_attempt_at": now})
+                elif error.permanent or item.attempts >= max_attempts:
+                    stats.failed += 1
+                    results.append({**row, "status": "failed", "last_error": str(error)[:255], "next_attempt_at": now})
+                else:
+                    stats.retried += 1
+                    delay = retry_delay(item.attempts, retry_base)
+                    if error.retry_after:
+                        delay = max(delay, timedelta(seconds=error.retry_after))
+                    results.append(
+                        {**row, "status": "pending", "last_error": str(error)[:255], "next_attempt_at": now + delay}
+                    )
+                if len(results) >= flush_size:
+                    db.execute(statement, results)
+                    db.commit()
+                    results = []
+        except BaseException:
+            # Ещё не начатые отправки не запускаем: их строки вернутся после конца аренды
+            for pending in futures:
+                pending.cancel()
+            if results:
+                db.execute(statement, results)
+                db.commit()
+            raise
+    if results:
+        db.execute(statement, results)
+        db.commit()
+    return stats
+
+
+def deliver_pending(
+    db: Session,
+    *,
+    now_fn: Callable[[], datetime],
+    transport: NotificationTransport | None = None,
+    bucket: TokenBucket | None = None,
+    max_batches: int | None = None,
+) -> DeliveryStats:
+    """Рассылать пачки, пока в outbox есть готовые строки (или max_batches пачек)."""
+    settings = get_settings()
+    transport = transport or get_notification_transport()
+    bucket = bucket or get_token_bucket()
+    total = DeliveryStats()
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batch = claim_batch(
+            db,
+            now_fn(),
+            batch_size=settings.notification_delivery_batch_size,
+            lease=timedelta(seconds=settings.notification_lease_seconds),
+        )
+        if not batch:
+            break
+        stats = deliver_batch(
+            db,
+            batch,
+            now_fn(),
+            transport=transport,
+            bucket=bucket,
+            concurrency=settings.notification_delivery_concurrency,
+            max_attempts=settings.notification_max_attempts,
+            retry_base=timedelta(seconds=settings.notification_retry_base_seconds),
+        )
+        total.sent += stats.sent
+        total.retried += stats.retried
+        total.failed += stats.failed
+        batches += 1
+    return total
+
+
+def purge_outbox(db: Session, before: datetime, *, batch_size: int = 1000) -> int:
+    """Удалить доставленные и окончательно неудачные строки, созданные раньше before."""
+    removed = 0
+    while True:
+        ids = db.execute(
+            select(NotificationOutbox.id)
+            .where(NotificationOutbox.status.in_(("sent", "failed")), NotificationOutbox.created_at < before)
+            .order_by(NotificationOutbox.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.execute(delete(NotificationOutbox).where(NotificationOutbox.id.in_(ids)))
+        db.commit()
+        removed += len(ids)
+    return removed
@@ -0,0 +1,322 @@
+"""Уведомления, которые пишет beat.
+
+Мягкие уведомления: игроки обходятся пачками по user_id (keyset), одна выборка
+pet_states JOIN notification_settings на пачку, пороги показателей проверяются в SQL,
+строки журнала вставляются многострочным INSERT. Повторы по одному условию гасятся
+через notification_states: состояния пачки читаются одним запросом, отправленные
+условия записываются одним upsert.
+
+Ежедневные отчёты на PostgreSQL целиком строит база: INSERT INTO event_logs ... SELECT
+по диапазонам user_id, сводка собирается json_build_object. На SQLite — пачками в Python
+через serialize_pet_state_for_event.
+"""
+
+from datetime import UTC, datetime, timedelta
+from itertools import chain
+from typing import Any
+
+from sqlalchemy import Float, Integer, Select, case, cast, delete, exists, func, insert, literal, literal_column, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement
+
+from app.database import dialect_insert
+from app.models import EventLog, NotificationOutbox, NotificationSettings, NotificationState, PetState
+from app.services.economy import DEFAULT_STAGE_TITLE, STAGE_TITLES
+from app.services.event_writer import write_events
+from app.services.game import serialize_pet_state_for_event
+from app.services.notification_delivery import enqueue_notifications
+from app.services.pet_ai import is_absent_more_than_24h
+from app.services.sweeps import SweepProgress
+
+
+SOFT_PUSH_ACTION = "мягкое_уведомление"
+DAILY_REPORT_ACTION = "ежедневный_отчёт"
+# Показатель, порог (строго меньше) и текст уведомления
+SOFT_PUSH_RULES = (
+    ("hunger", 30, "Единорог проголодался"),
+    ("energy", 20, "Единорог устал"),
+    ("hygiene", 30, "Единорогу нужна ванна"),
+    ("health", 40, "Единорогу нужно лечение"),
+)
+
+
+def soft_push_candidates(after_user_id: int, limit: int) -> Select:
+    """Питомцы с включёнными мягкими уведомлениями, у которых хотя бы один показатель ниже порога."""
+    return (
+        select(PetState.user_id, *(getattr(PetState, stat) for stat, _, _ in SOFT_PUSH_RULES))
+        .join(NotificationSettings, NotificationSettings.user_id == PetState.user_id)
+        .where(
+            NotificationSettings.soft_push_enabled.is_(True),
+            or_(*(getattr(PetState, stat) < threshold for stat, threshold, _ in SOFT_PUSH_RULES)),
+            PetState.user_id > after_user_id,
+        )
+        .order_by(PetState.user_id)
+        .limit(limit)
+    )
+
+
+def soft_push_messages(row: Any) -> list[str]:
+    return [message for stat, threshold, message in SOFT_PUSH_RULES if getattr(row, stat) < threshold]
+
+
+def clear_resolved_states(db: Session) -> int:
+    """Удалить состояния условий, которые уже не выполняются; следующее срабатывание уведомит сразу."""
+    cleared = 0
+    for stat, threshold, _ in SOFT_PUSH_RULES:
+        result = db.execute(
+            delete(NotificationState).where(
+                NotificationState.condition == stat,
+                ~exists().where(PetState.user_id == NotificationState.user_id, getattr(PetState, stat) < threshold),
+            )
+        )
+        cleared += max(0, result.rowcount or 0)
+    db.commit()
+    return cleared
+
+
+def _due_messages(
+    row: Any, states: dict[tuple[int, str], datetime], now: datetime, cooldown: timedelta
+) -> list[tuple[str, str]]:
+    due = []
+    for stat, threshold, message in SOFT_PUSH_RULES:
+        if getattr(row, stat) >= threshold:
+            continue
+        last_sent_at = states.get((row.user_id, stat))
+        if last_sent_at is not None and last_sent_at.tzinfo is None:
+            last_sent_at = last_sent_at.replace(tzinfo=UTC)
+        if last_sent_at is None or now - last_sent_at >= cooldown:
+            due.append((stat, message))
+    return due
+
+
+def send_soft_pushes(
+    db: Session,
+    now: datetime,
+    *,
+    chunk_size: int = 1000,
+    cooldown: timedelta = timedelta(hours=12),
+    enqueue: bool = False,
+    progress: SweepProgress | None = None,
+) -> int:
+    """Записать мягкие уведомления всем подходящим игрокам; возвращает число записанных событий.
+
+    Условие, о котором уже уведомили, молчит, пока не пройдёт cooldown или пока показатель
+    не вернётся выше порога (тогда состояние удаляется в clear_resolved_states).
+    С enqueue уведомления кладутся и в notification_outbox для доставки, с progress
+    обход продолжается с контрольной точки.
+    """
+    clear_resolved_states(db)
+    created = 0
+    last_user_id = progress.cursor if progress else 0
+    while True:
+        rows = db.execute(soft_push_candidates(last_user_id, chunk_size)).all()
+        if not rows:
+            break
+        last_user_id = rows[-1].user_id
+        states = {
+            (state.user_id, state.condition): state.last_sent_at
+            for state in db.execute(
+                select(NotificationState.user_id, NotificationState.condition, NotificationState.last_sent_at).where(
+                    NotificationState.user_id.in_([row.user_id for row in rows])
+                )
+            )
+        }
+        events = []
+        sent = []
+        for row in rows:
+            due = _due_messages(row, states, now, cooldown)
+            if not due:
+                continue
+            events.append(
+                {
+                    "user_id": row.user_id,
+                    "action": SOFT_PUSH_ACTION,
+                    "payload": {
+                        "messages": [message for _, message in due],
+                        "created_by": "beat",
+                        "time": now.isoformat(),
+                    },
+                    "created_at": now,
+                }
+            )
+            sent.extend(
+                {"user_id": row.user_id, "condition": stat, "message": message, "last_sent_at": now} for stat, message in due
+            )
+        if events:
+            write_events(db, events)
+            if enqueue:
+                enqueue_notifications(db, events, now)
+            stmt = dialect_insert(db, NotificationState.__table__).values(sent)
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["user_id", "condition"],
+                    set_={"message": stmt.excluded.message, "last_sent_at": stmt.excluded.last_sent_at},
+                )
+            )
+        if progress is not None:
+            progress.advance(db, last_user_id)
+        db.commit()
+        created += len(events)
+    return created
+
+
+def _json_object(fields: dict[str, Any]) -> ColumnElement:
+    # Ключи — константы модуля, их можно вставить в SQL литералами
+    return func.json_build_object(*chain.from_iterable((literal_column(f"'{key}'"), value) for key, value in fields.items()))
+
+
+def xp_to_next_level_sql(level: ColumnElement) -> ColumnElement:
+    """опыт_до_следующего_уровня в SQL: ceil(50 * level ** 1.4) на том же double, что и в Python."""
+    return cast(func.ceil(50 * func.power(cast(level, Float), 1.4)), Integer)
+
+
+def daily_summary_sql(now: datetime) -> ColumnElement:
+    """Та же сводка, что serialize_pet_state_for_event, но собранная в SQL."""
+    return _json_object(
+        {
+            "user_id": PetState.user_id,
+            "name": PetState.name,
+            "stage": PetState.stage,
+            "stage_title": case(STAGE_TITLES, value=PetState.stage, else_=DEFAULT_STAGE_TITLE),
+            "level": PetState.level,
+            "xp": PetState.xp,
+            "xp_to_next_level": xp_to_next_level_sql(PetState.level),
+            "coins": PetState.coins,
+            "intelligence": PetState.intelligence,
+            "crystals": PetState.crystals,
+            "hunger": PetState.hunger,
+            "hygiene": PetState.hygiene,
+            "happiness": PetState.happiness,
+            "health": PetState.health,
+            "energy": PetState.energy,
+            "behavior_state": PetState.behavior_state,
+            "is_lonely": func.coalesce(PetState.last_active_at <= now - timedelta(hours=24), False),
+            "last_tick_at": PetState.last_tick_at,
+            "character_courage": PetState.character_courage,
+            "character_friendliness": PetState.character_friendliness,
+            "character_energy": PetState.character_energy,
+            "character_curiosity": PetState.character_curiosity,
+            "character_tidiness": PetState.character_tidiness,
+        }
+    )
+
+
+def daily_report_insert(now: datetime, user_from: int, user_to: int):
+    """INSERT INTO event_logs ... SELECT отчётов для user_id из [user_from, user_to)."""
+    payload = _json_object({"summary": daily_summary_sql(now), "created_by": literal_column("'beat'")})
+    return insert(EventLog.__table__).from_select(
+        ["user_id", "action", "payload", "created_at"],
+        select(PetState.user_id, literal(DAILY_REPORT_ACTION), payload, literal(now, EventLog.created_at.type))
+        .join(NotificationSettings, NotificationSettings.user_id == PetState.user_id)
+        .where(
+            NotificationSettings.daily_report_enabled.is_(True),
+            PetState.user_id >= user_from,
+            PetState.user_id < user_to,
+        ),
+    )
+
+
+def daily_report_outbox_insert(now: datetime, user_from: int, user_to: int):
+    """Переложить в outbox отчёты, только что записанные daily_report_insert с тем же now."""
+    return insert(NotificationOutbox.__table__).from_select(
+        ["user_id", "kind", "payload", "status", "attempts", "next_attempt_at", "created_at"],
+        select(
+            EventLog.user_id,
+            EventLog.action,
+            EventLog.payload,
+            literal("pending"),
+            literal(0),
+            literal(now, NotificationOutbox.next_attempt_at.type),
+            literal(now, NotificationOutbox.created_at.type),
+        ).where(
+            EventLog.action == DAILY_REPORT_ACTION,
+            EventLog.created_at == now,
+            EventLog.user_id >= user_from,
+            EventLog.user_id < user_to,
+        ),
+    )
+
+
+def _write_daily_reports_sql(
+    db: Session, now: datetime, user_range: int, enqueue: bool, progress: SweepProgress | None
+) -> int:
+    low, high = db.execute(
+        select(func.min(PetState.user_id), func.max(PetState.user_id)).where(
+            PetState.user_id > (progress.cursor if progress else 0)
+        )
+    ).one()
+    if low is None:
+        return 0
+    created = 0
+    for user_from in range(low, high + 1, user_range):
+        # Отчёты вставляются INSERT ... SELECT в обход write_events: строки не проходят через
+        # Python, а outbox читает их из event_logs в той же транзакции. Если вставка не
+        # удалась, диапазон откатывается вместе с контрольной точкой и повторяется при
+        # следующем запуске, поэтому сброс в файл писателя здесь не нужен.
+        result = db.execute(daily_report_insert(now, user_from, user_from + user_range))
+        if enqueue:
+            db.execute(daily_report_outbox_insert(now, user_from, user_from + user_range))
+        if progress is not None:
+            progress.advance(db, user_from + user_range - 1)
+        db.commit()
+        created += max(0, result.rowcount or 0)
+    return created
+
+
+def _write_daily_reports_python(
+    db: Session, now: datetime, chunk_size: int, enqueue: bool, progress: SweepProgress | None
+) -> int:
+    created = 0
+    last_user_id = progress.cursor if progress else 0
+    while True:
+        pets = db.execute(
+            select(PetState)
+            .join(NotificationSettings, NotificationSettings.user_id == PetState.user_id)
+            .where(NotificationSettings.daily_report_enabled.is_(True), PetState.user_id > last_user_id)
+            .order_by(PetState.user_id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not pets:
+            break
+        events = []
+        for pet in pets:
+            summary = serialize_pet_state_for_event(pet)
+            # Считаем одиночество на момент отчёта, как и SQL-вариант
+            summary["is_lonely"] = is_absent_more_than_24h(pet.last_active_at, now)
+            events.append(
+                {
+                    "user_id": pet.user_id,
+                    "action": DAILY_REPORT_ACTION,
+                    "payload": {"summary": summary, "created_by": "beat"},
+                    "created_at": now,
+                }
+            )
+        write_events(db, events)
+        if enqueue:
+            enqueue_notifications(db, events, now)
+        last_user_id = pets[-1].user_id
+        if progress is not None:
+            progress.advance(db, last_user_id)
+        db.commit()
+        db.expunge_all()
+        created += len(events)
+    return created
+
+
+def write_daily_reports(
+    db: Session,
+    now: datetime,
+    *,
+    user_range: int = 50000,
+    chunk_size: int = 1000,
+    enqueue: bool = False,
+    progress: SweepProgress | None = None,
+) -> int:
+    """Записать ежедневные отчёты всем, у кого они включены; возвращает число записанных событий.
+
+    С enqueue отчёты кладутся и в notification_outbox для доставки, с progress обход
+    продолжается с контрольной точки.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return _write_daily_reports_sql(db, now, user_range, enqueue, progress)
+    return _write_daily_reports_python(db, now, chunk_size, enqueue, progress)
@@ -0,0 +1,181 @@
+"""Помесячные секции event_logs и rewards (PostgreSQL, декларативный RANGE по created_at).
+
+Секция месяца называется <таблица>_pYYYY_MM и покрывает [1-е число 00:00 UTC, 1-е число
+следующего месяца). Обслуживание (maintain_partitions, раз в сутки):
+- заранее создаёт секции на PARTITION_MONTHS_AHEAD месяцев вперёд — вставка в месяц без
+  секции завершится ошибкой;
+- секции event_logs, целиком старше EVENT_ARCHIVE_AFTER_DAYS, выгружает в архив и удаляет;
+- секции rewards, целиком старше RETENTION_REWARDS_DAYS, сворачивает в monthly_summaries
+  и удаляет.
+Свёртка или обновление индекса архива коммитятся вместе с DROP TABLE секции, поэтому
+строки не удаляются по одной и таблица не разрастается мёртвыми версиями. Секция
+выгружается в архив целиком, поэтому её счётчики в индексе заменяются, а не
+прибавляются: повтор после падения до DROP их не завышает.
+
+Секция <таблица>_default принимает строки, для которых нет месячной секции. Обычно она
+пуста; если нет, maintain_partitions пишет ошибку в лог — такие строки не архивируются
+и не сворачиваются, а секцию их месяца нельзя создать, пока они лежат в DEFAULT.
+
+На SQLite таблицы обычные, а старые строки по-прежнему удаляются пачками
+(archive_events, rollup_rewards).
+"""
+
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.services.event_archive import archive_range, upsert_segment_index
+from app.services.retention import rollup_rewards_range
+
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("event_logs", "rewards")
+
+
+def month_start(moment: datetime) -> datetime:
+    moment = moment.astimezone(UTC) if moment.tzinfo else moment.replace(tzinfo=UTC)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(start: datetime, months: int) -> datetime:
+    index = start.year * 12 + start.month - 1 + months
+    return start.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start.year:04d}_{start.month:02d}"
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    start: datetime
+    end: datetime
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = :table AND c.relnamespace = current_schema()::regnamespace"
+        ),
+        {"table": table},
+    ).first() is not None
+
+
+def list_partitions(db: Session, table: str) -> list[Partition]:
+    """Помесячные секции таблицы от старых к новым; секции с другими именами пропускаются."""
+    pattern = re.compile(rf"^{table}_p(\d{{4}})_(\d{{2}})$")
+    names = db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table AND p.relnamespace = current_schema()::regnamespace"
+        ),
+        {"table": table},
+    ).scalars()
+    partitions = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            start = datetime(int(match[1]), int(match[2]), 1, tzinfo=UTC)
+            partitions.append(Partition(name=name, start=start, end=add_months(start, 1)))
+    return sorted(partitions, key=lambda partition: partition.start)
+
+
+def default_partition_rows(db: Session, table: str) -> int:
+    """Число строк в секции DEFAULT таблицы; 0, если её нет."""
+    name = f"{table}_default"
+    if not db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+        return 0
+    return int(db.execute(text(f'SELECT count(*) FROM "{name}"')).scalar_one())
+
+
+def ensure_partitions(db: Session, table: str, now: datetime, months_ahead: int) -> list[str]:
+    """Создать недостающие секции с текущего месяца по now + months_ahead включительно."""
+    existing = {partition.name for partition in list_partitions(db, table)}
+    created = []
+    current = month_start(now)
+    for offset in range(months_ahead + 1):
+        start = add_months(current, offset)
+        name = partition_name(table, start)
+        if name in existing:
+            continue
+        db.execute(
+            text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{add_months(start, 1).isoformat()}')"
+            )
+        )
+        created.append(name)
+    db.commit()
+    return created
+
+
+def _drop_partition(db: Session, partition: Partition) -> None:
+    # DROP секции мгновенный и откатывается вместе с транзакцией, в отличие от DELETE строк
+    db.execute(text(f'DROP TABLE "{partition.name}"'))
+    db.commit()
+
+
+def expire_event_partitions(
+    db: Session, before: datetime, *, archive_dir: Path, user_range: int, batch_size: int
+) -> list[str]:
+    """Выгрузить в архив и удалить секции event_logs, целиком лежащие раньше before."""
+    dropped = []
+    for partition in list_partitions(db, "event_logs"):
+        if partition.end > before:
+            break
+        counts = archive_range(
+            db, partition.start, partition.end, archive_dir=archive_dir, user_range=user_range, batch_size=batch_size
+        )
+        upsert_segment_index(db, counts, replace=True)
+        _drop_partition(db, partition)
+        dropped.append(partition.name)
+    return dropped
+
+
+def expire_reward_partitions(db: Session, before: datetime) -> list[str]:
+    """Свернуть в monthly_summaries и удалить секции rewards, целиком лежащие раньше before."""
+    dropped = []
+    for partition in list_partitions(db, "rewards"):
+        if partition.end > before:
+            break
+        rollup_rewards_range(db, partition.start, partition.end)
+        _drop_partition(db, partition)
+        dropped.append(partition.name)
+    return dropped
+
+
+def maintain_partitions(db: Session, now: datetime | None = None) -> dict[str, dict[str, list[str]]]:
+    settings = get_settings()
+    now = now or datetime.now(UTC)
+    result: dict[str, dict[str, list[str]]] = {}
+    for table in PARTITIONED_TABLES:
+        if is_partitioned(db, table):
+            stray = default_partition_rows(db, table)
+            if stray:
+                logger.error("partition %s_default is not empty rows=%s", table, stray)
+            result[table] = {"created": ensure_partitions(db, table, now, settings.partition_months_ahead), "dropped": []}
+    if "event_logs" in result:
+        result["event_logs"]["dropped"] = expire_event_partitions(
+            db,
+            now - timedelta(days=settings.event_archive_after_days),
+            archive_dir=Path(settings.event_archive_dir),
+            user_range=settings.event_archive_user_range,
+            batch_size=settings.event_archive_batch_size,
+        )
+    if "rewards" in result:
+        result["rewards"]["dropped"] = expire_reward_partitions(
+            db, now - timedelta(days=settings.retention_rewards_days)
+        )
+    return result
@@ -0,0 +1,364 @@
+"""Восстановление PetState по журналу событий: известный хороший снимок плюс повтор дельт.
+
+Для каждого игрока:
+1. хорошее состояние — на последнее событие раньше good_before: ближайший снимок в
+   event_logs и сохранённые после него состояния (event_payloads.reconstruct_stats);
+2. события начиная с good_before повторяются по записанным дельтам через функции
+   симуляции и экономики: распад между событиями (apply_time_decay), уходовые действия
+   (apply_action), дельты показателей от предметов, восстановленная энергия, награды
+   (level_after_xp, stage_by_level, бонус за уровень), траты в магазине;
+3. после последнего события распад доводится до момента восстановления.
+Распад между событиями повторяется так же, как его применяет beat-задача decay_all_pets:
+шагами DECAY_INTERVAL_SECONDS от последнего тика, каждый шаг со своим ограничением
+decay_cap_seconds, остаток — в момент события. Одиночество считается от последнего
+действия игрока. Строки, записанные beat-задачами (payload.created_by == "beat":
+уведомления, ежедневные отчёты), не повторяются — это не действия игрока.
+Абсолютные состояния из событий после good_before не используются — их писал испорченный
+код. Изменения, не отражённые в журнале (случайные события, черты характера от
+предметов), при повторе теряются.
+
+Игроки обрабатываются пачками по chunk_size: два запроса на пачку (окно перед
+good_before и поток событий после него), результат пишется одним executemany UPDATE.
+Пачки раздаются процессам ProcessPoolExecutor. После записи таблицы лидеров
+перестраиваются, а event_seq сбрасывается, чтобы следующее событие стало снимком.
+
+    python -m app.services.pet_recovery --good-before 2026-10-18T12:00:00+00:00 --workers 8
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields as dataclass_fields
+from datetime import UTC, datetime, timedelta
+from itertools import groupby
+import argparse
+import os
+import sys
+from typing import Any, Iterable
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import SessionLocal, engine
+from app.models import EventLog, PetState, utcnow
+from app.services.economy import level_after_xp, stage_by_level
+from app.services.event_payloads import RARE_FIELDS, VOLATILE_FIELDS, is_snapshot, reconstruct_stats
+from app.services.leaderboard import rebuild_leaderboards
+from app.services.pet_ai import is_absent_more_than_24h, определить_состояние_питомца
+from app.services.simulation import ACTION_EFFECTS, apply_action, apply_time_decay, clamp
+
+
+STATE_FIELDS = VOLATILE_FIELDS + RARE_FIELDS
+STAT_FIELDS = ("hunger", "hygiene", "happiness", "health", "energy")
+STREAM_ROWS = 2000
+
+
+@dataclass
+class RecoveryStats:
+    recovered: int = 0
+    skipped: int = 0
+    replayed_events: int = 0
+
+    def merge(self, other: "RecoveryStats") -> "RecoveryStats":
+        return RecoveryStats(
+            **{item.name: getattr(self, item.name) + getattr(other, item.name) for item in dataclass_fields(self)}
+        )
+
+
+class _ReplayPet:
+    """Состояние питомца для функций симуляции (PetLike), без ORM."""
+
+    def __init__(self, state: dict[str, Any]) -> None:
+        for name in STATE_FIELDS:
+            setattr(self, name, state[name])
+        if isinstance(self.last_tick_at, str):
+            self.last_tick_at = datetime.fromisoformat(self.last_tick_at)
+
+    def as_row(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in STATE_FIELDS}
+
+
+def _good_state(prefix: list[Any]) -> dict[str, Any] | None:
+    """Состояние после последнего события prefix (от старых к новым) или None, если снимка нет."""
+    start = next((index for index in range(len(prefix) - 1, -1, -1) if is_snapshot(prefix[index].payload or {})), None)
+    if start is None:
+        return None
+    rows = prefix[start:]
+    state = reconstruct_stats(rows)[rows[-1].id]
+    if any(name not in state for name in STATE_FIELDS):
+        return None
+    return state
+
+
+def _replay_reward(pet: _ReplayPet, reward: dict[str, Any]) -> None:
+    level_before = pet.level
+    pet.level, pet.xp = level_after_xp(pet.level, max(0, pet.xp + reward.get("xp", 0)))
+    pet.coins += reward.get("coins", 0)
+    pet.intelligence += reward.get("intelligence", 0)
+    pet.crystals += reward.get("crystals", 0)
+    # Бонус за каждый полученный уровень, как в _apply_progress_for_pet
+    pet.coins += sum(12 + level * 2 for level in range(max(1, level_before) + 1, pet.level + 1))
+    pet.stage = stage_by_level(
+        pet.level,
+        current_stage=pet.stage,
+        courage=pet.character_courage,
+        friendliness=pet.character_friendliness,
+        energy=pet.character_energy,
+        tidiness=pet.character_tidiness,
+    )
+
+
+def _aware(moment: datetime) -> datetime:
+    return moment if moment.tzinfo else moment.replace(tzinfo=UTC)
+
+
+def _update_behavior_state(pet: _ReplayPet) -> None:
+    pet.behavior_state = определить_состояние_питомца(
+        hunger=pet.hunger, hygiene=pet.hygiene, happiness=pet.happiness, health=pet.health, energy=pet.energy
+    )
+
+
+def is_beat_row(row: Any) -> bool:
+    return (row.payload or {}).get("created_by") == "beat"
+
+
+def replay_beat_decay(
+    pet: _ReplayPet, until: datetime, active_at: datetime | None, *, step_seconds: int, cap_seconds: int
+) -> None:
+    """Тики decay_all_pets строго до until, каждые step_seconds от последнего тика питомца."""
+    step = timedelta(seconds=step_seconds)
+    tick = _aware(pet.last_tick_at) + step
+    while tick < until:
+        if not any(getattr(pet, stat) for stat in STAT_FIELDS):
+            # Все показатели на нуле: дальнейшие тики ничего не меняют
+            pet.last_tick_at = tick
+        else:
+            apply_time_decay(pet, now=tick, cap_seconds=cap_seconds, lonely=is_absent_more_than_24h(active_at, tick))
+        tick += step
+
+
+def replay_event(
+    pet: _ReplayPet, row: Any, previous_at: datetime | None, cap_seconds: int, step_seconds: int
+) -> None:
+    payload = row.payload or {}
+    created_at = _aware(row.created_at)
+    replay_beat_decay(pet, created_at, previous_at, step_seconds=step_seconds, cap_seconds=cap_seconds)
+    apply_time_decay(pet, now=created_at, cap_seconds=cap_seconds, lonely=is_absent_more_than_24h(previous_at, created_at))
+    if row.action in ACTION_EFFECTS:
+        # Детерминированные действия повторяются целиком, вместе с чертами характера
+        apply_action(pet, row.action)
+        if row.action == "clean":
+            pet.hunger = 50  # как в execute_action
+    else:
+        for stat, delta in (payload.get("deltas") or {}).items():
+            if stat in STAT_FIELDS:
+                setattr(pet, stat, clamp(getattr(pet, stat) + delta))
+    if payload.get("energy_recovered"):
+        pet.energy = clamp(pet.energy + payload["energy_recovered"])
+    if isinstance(payload.get("reward"), dict):
+        _replay_reward(pet, payload["reward"])
+    if payload.get("total_price"):
+        pet.coins = max(0, pet.coins - payload["total_price"])
+    _update_behavior_state(pet)
+
+
+def recover_state(
+    prefix: list[Any], tail: Iterable[Any], now: datetime, *, cap_seconds: int, step_seconds: int
+) -> tuple[dict[str, Any] | None, int]:
+    """Состояние игрока на now: хорошее по prefix (до good_before) плюс повтор дельт tail; и число повторённых событий."""
+    state = _good_state(prefix)
+    if state is None:
+        return None, 0
+    pet = _ReplayPet(state)
+    previous_at = next((row.created_at for row in reversed(prefix) if not is_beat_row(row)), None)
+    replayed = 0
+    for row in tail:
+        if is_beat_row(row):
+            continue
+        replay_event(pet, row, previous_at, cap_seconds, step_seconds)
+        previous_at = row.created_at
+        replayed += 1
+    # Тики, которые beat-задача успела применить после последнего события
+    replay_beat_decay(pet, now, previous_at, step_seconds=step_seconds, cap_seconds=cap_seconds)
+    _update_behavior_state(pet)
+    return pet.as_row(), replayed
+
+
+def _event_columns():
+    return (EventLog.id, EventLog.user_id, EventLog.action, EventLog.payload, EventLog.created_at)
+
+
+def _load_prefixes(db: Session, user_ids: list[int], good_before: datetime, lookback: int) -> dict[int, list[Any]]:
+    # Снимок пишется раз в lookback событий, поэтому хватает последних lookback строк до good_before
+    ranked = (
+        select(
+            *_event_columns(),
+            func.row_number()
+            .over(partition_by=EventLog.user_id, order_by=(EventLog.created_at.desc(), EventLog.id.desc()))
+            .label("position"),
+        )
+        .where(EventLog.user_id.in_(user_ids), EventLog.created_at < good_before)
+        .subquery()
+    )
+    rows = db.execute(
+        select(ranked).where(ranked.c.position <= lookback).order_by(ranked.c.user_id, ranked.c.created_at, ranked.c.id)
+    ).all()
+    return {user_id: list(group) for user_id, group in groupby(rows, key=lambda row: row.user_id)}
+
+
+def recover_chunk(
+    db: Session,
+    user_ids: list[int],
+    good_before: datetime,
+    *,
+    lookback: int,
+    cap_seconds: int,
+    step_seconds: int,
+    now: datetime,
+    dry_run: bool = False,
+) -> RecoveryStats:
+    stats = RecoveryStats()
+    prefixes = _load_prefixes(db, user_ids, good_before, lookback)
+    tails = db.execute(
+        select(*_event_columns())
+        .where(EventLog.user_id.in_(user_ids), EventLog.created_at >= good_before)
+        .order_by(EventLog.user_id, EventLog.created_at, EventLog.id)
+        .execution_options(yield_per=STREAM_ROWS)
+    )
+    tail_by_user = groupby(tails, key=lambda row: row.user_id)
+    pending = next(tail_by_user, None)
+
+    updates = []
+    for user_id in sorted(user_ids):
+        # Поток событий упорядочен по user_id, поэтому хвосты разбираются одним проходом
+        while pending is not None and pending[0] < user_id:
+            pending = next(tail_by_user, None)
+        tail: Iterable[Any] = pending[1] if pending is not None and pending[0] == user_id else ()
+        state, replayed = recover_state(
+            prefixes.get(user_id, []), tail, now, cap_seconds=cap_seconds, step_seconds=step_seconds
+        )
+        if state is None:
+            stats.skipped += 1
+            continue
+        stats.recovered += 1
+        stats.replayed_events += replayed
+        updates.append({**state, "event_seq": 0, "target_user_id": user_id})
+    tails.close()
+
+    if updates and not dry_run:
+        table = PetState.__table__
+        db.execute(update(table).where(table.c.user_id == bindparam("target_user_id")), updates)
+        db.commit()
+    return stats
+
+
+def _init_worker() -> None:
+    # Соединения родителя после fork не используются
+    engine.dispose(close=False)
+
+
+def _recover_chunk_in_worker(
+    user_ids: list[int],
+    good_before: datetime,
+    lookback: int,
+    cap_seconds: int,
+    step_seconds: int,
+    now: datetime,
+    dry_run: bool,
+) -> RecoveryStats:
+    with SessionLocal() as db:
+        return recover_chunk(
+            db,
+            user_ids,
+            good_before,
+            lookback=lookback,
+            cap_seconds=cap_seconds,
+            step_seconds=step_seconds,
+            now=now,
+            dry_run=dry_run,
+        )
+
+
+def _user_chunks(db: Session, user_ids: list[int] | None, chunk_size: int) -> list[list[int]]:
+    if user_ids is None:
+        user_ids = list(db.execute(select(PetState.user_id).order_by(PetState.user_id)).scalars())
+    ordered = sorted(set(user_ids))
+    return [ordered[start : start + chunk_size] for start in range(0, len(ordered), chunk_size)]
+
+
+def recover_pets(
+    db: Session,
+    good_before: datetime,
+    *,
+    user_ids: list[int] | None = None,
+    workers: int = 1,
+    chunk_size: int = 500,
+    now: datetime | None = None,
+    dry_run: bool = False,
+) -> RecoveryStats:
+    settings = get_settings()
+    lookback = settings.event_snapshot_interval
+    now = now or utcnow()
+    chunks = _user_chunks(db, user_ids, chunk_size)
+    if workers == 1 or len(chunks) <= 1:
+        results = [
+            recover_chunk(
+                db,
+                chunk,
+                good_before,
+                lookback=lookback,
+                cap_seconds=settings.decay_cap_seconds,
+                step_seconds=settings.decay_interval_seconds,
+                now=now,
+                dry_run=dry_run,
+            )
+            for chunk in chunks
+        ]
+    else:
+        db.close()
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker) as pool:
+            results = list(
+                pool.map(
+                    _recover_chunk_in_worker,
+                    chunks,
+                    [good_before] * len(chunks),
+                    [lookback] * len(chunks),
+                    [settings.decay_cap_seconds] * len(chunks),
+                    [settings.decay_interval_seconds] * len(chunks),
+                    [now] * len(chunks),
+                    [dry_run] * len(chunks),
+                )
+            )
+
+    total = RecoveryStats()
+    for result in results:
+        total = total.merge(result)
+    if not dry_run and total.recovered:
+        # Запись шла мимо ORM и хуков таблиц лидеров
+        rebuild_leaderboards(db)
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Восстановление состояния питомцев по журналу событий")
+    parser.add_argument("--good-before", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--users", type=lambda value: [int(item) for item in value.split(",")])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    good_before = args.good_before if args.good_before.tzinfo else args.good_before.replace(tzinfo=UTC)
+    with SessionLocal() as db:
+        stats = recover_pets(
+            db,
+            good_before,
+            user_ids=args.users,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run,
+        )
+    sys.stdout.write(f"recovered={stats.recovered} skipped={stats.skipped} replayed_events={stats.replayed_events}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.database import dialect_insert
+from app.models import DailyProgress, MonthlySummary, Reward, utcnow
+from app.services.daily_tasks import DailyTaskList
+
+
+DAILY_SUMMARY_FIELDS = ("days_recorded", "login_bonus_days", "chests_claimed", "tasks_completed")
+REWARD_SUMMARY_FIELDS = ("rewards_count", "xp_gained", "coins_gained", "intelligence_gained", "crystals_gained")
+
+
+def _upsert_summaries(db: Session, totals: dict[tuple[int, str], dict[str, int]], fields: tuple[str, ...]) -> None:
+    if not totals:
+        return
+    table = MonthlySummary.__table__
+    now = utcnow()
+    rows = []
+    for (user_id, month_key), values in totals.items():
+        row = {name: 0 for name in DAILY_SUMMARY_FIELDS + REWARD_SUMMARY_FIELDS}
+        row.update(values)
+        row.update(user_id=user_id, month_key=month_key, updated_at=now)
+        rows.append(row)
+
+    stmt = dialect_insert(db, table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "month_key"],
+        set_={
+            **{name: table.c[name] + stmt.excluded[name] for name in fields},
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.execute(stmt)
+
+
+def rollup_daily_progress(db: Session, before_date_key: str, *, batch_size: int = 1000) -> int:
+    """Сворачивает строки daily_progress старше before_date_key в месячные сводки и удаляет их.
+
+    Каждая пачка — отдельная транзакция: сводка и удаление коммитятся вместе,
+    поэтому прерванный запуск можно просто повторить.
+    """
+    removed = 0
+    while True:
+        rows = db.execute(
+            select(DailyProgress)
+            .where(DailyProgress.date_key < before_date_key)
+            .order_by(DailyProgress.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not rows:
+            break
+
+        totals: dict[tuple[int, str], dict[str, int]] = defaultdict(lambda: dict.fromkeys(DAILY_SUMMARY_FIELDS, 0))
+        for row in rows:
+            bucket = totals[(row.user_id, row.date_key[:7])]
+            bucket["days_recorded"] += 1
+            bucket["login_bonus_days"] += int(row.login_bonus_claimed)
+            bucket["chests_claimed"] += int(row.chest_claimed)
+            bucket["tasks_completed"] += len(DailyTaskList.from_raw(row.tasks).completed_keys())
+
+        _upsert_summaries(db, totals, DAILY_SUMMARY_FIELDS)
+        db.execute(delete(DailyProgress).where(DailyProgress.id.in_([row.id for row in rows])))
+        db.commit()
+        db.expunge_all()
+        removed += len(rows)
+    return removed
+
+
+def rollup_rewards(db: Session, before: datetime, *, batch_size: int = 1000) -> int:
+    """Сворачивает строки rewards старше before в месячные сводки и удаляет их пачками."""
+    removed = 0
+    while True:
+        rows = db.execute(
+            select(
+                Reward.id,
+                Reward.user_id,
+                Reward.created_at,
+                Reward.xp_gained,
+                Reward.coins_gained,
+                Reward.intelligence_gained,
+                Reward.crystals_gained,
+            )
+            .where(Reward.created_at < before)
+            .order_by(Reward.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        totals: dict[tuple[int, str], dict[str, int]] = defaultdict(lambda: dict.fromkeys(REWARD_SUMMARY_FIELDS, 0))
+        for row in rows:
+            bucket = totals[(row.user_id, row.created_at.strftime("%Y-%m"))]
+            bucket["rewards_count"] += 1
+            bucket["xp_gained"] += row.xp_gained
+            bucket["coins_gained"] += row.coins_gained
+            bucket["intelligence_gained"] += row.intelligence_gained
+            bucket["crystals_gained"] += row.crystals_gained
+
+        _upsert_summaries(db, totals, REWARD_SUMMARY_FIELDS)
+        db.execute(delete(Reward).where(Reward.id.in_([row.id for row in rows])))
+        db.commit()
+        removed += len(rows)
+    return removed
+
+
+def rollup_rewards_range(db: Session, start: datetime, end: datetime, *, batch_size: int = 1000) -> int:
+    """Сворачивает все rewards из [start, end) одним GROUP BY по игроку и месяцу, не удаляя строк.
+
+    Используется для целой секции rewards: свёртка и удаление секции коммитятся вместе.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        month_key = func.to_char(func.timezone("UTC", Reward.created_at), "YYYY-MM")
+    else:
+        month_key = func.strftime("%Y-%m", Reward.created_at)
+    rows = db.execute(
+        select(
+            Reward.user_id,
+            month_key.label("month_key"),
+            func.count().label("rewards_count"),
+            func.sum(Reward.xp_gained).label("xp_gained"),
+            func.sum(Reward.coins_gained).label("coins_gained"),
+            func.sum(Reward.intelligence_gained).label("intelligence_gained"),
+            func.sum(Reward.crystals_gained).label("crystals_gained"),
+        )
+        .where(Reward.created_at >= start, Reward.created_at < end)
+        .group_by(Reward.user_id, month_key)
+    ).all()
+    for offset in range(0, len(rows), batch_size):
+        totals = {
+            (row.user_id, row.month_key): {name: int(getattr(row, name)) for name in REWARD_SUMMARY_FIELDS}
+            for row in rows[offset : offset + batch_size]
+        }
+        _upsert_summaries(db, totals, REWARD_SUMMARY_FIELDS)
+    return sum(row.rewards_count for row in rows)
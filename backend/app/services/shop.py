@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from functools import lru_cache
+import json
 
 
 @dataclass
@@ -107,16 +109,80 @@ CATALOG: list[ShopItem] = [
 ]
 
 
+# Цены хранятся в Integer-колонках (int32 в Postgres), поэтому цена ограничена сверху.
+MAX_PRICE = 2**31 - 1
+# Уровень, после которого любая цена каталога гарантированно упирается в MAX_PRICE:
+# даже самый дешёвый товар (5 монет) переходит предел на ~34 уровне.
+MAX_PRICED_LEVEL = 64
+
+
 def price_for_level(base_price: int, level: int) -> int:
-    level_factor = 1.8 ** max(1, level)
-    return int(round(base_price * level_factor))
+    level_factor = 1.8 ** max(1, min(level, MAX_PRICED_LEVEL))
+    return min(MAX_PRICE, int(round(base_price * level_factor)))
+
+
+# Индексы каталога, собранные один раз при импорте
+CATALOG_BY_KEY: dict[str, ShopItem] = {item.item_key: item for item in CATALOG}
+
+# PRICE_TABLE[level][item_key] -> цена; индекс 0 совпадает с уровнем 1, как в price_for_level
+PRICE_TABLE: tuple[dict[str, int], ...] = tuple(
+    {item.item_key: price_for_level(item.base_price, level) for item in CATALOG}
+    for level in range(MAX_PRICED_LEVEL + 1)
+)
+
+
+def _price_level(level: int) -> int:
+    return max(1, min(level, MAX_PRICED_LEVEL))
+
+
+def item_price(item: ShopItem, level: int) -> int:
+    return PRICE_TABLE[_price_level(level)][item.item_key]
+
+
+@lru_cache(maxsize=MAX_PRICED_LEVEL + 1)
+def _catalog_payload_for(price_level: int) -> tuple[dict, ...]:
+    prices = PRICE_TABLE[price_level]
+    return tuple(
+        {
+            "item_key": item.item_key,
+            "title": item.title,
+            "section": item.section,
+            "base_price": item.base_price,
+            "price": prices[item.item_key],
+            "level_required": item.level_required,
+        }
+        for item in CATALOG
+    )
+
+
+def catalog_payload(level: int) -> tuple[dict, ...]:
+    """Готовый (общий для всех игроков) список товаров с ценами для уровня; не изменять."""
+    return _catalog_payload_for(_price_level(level))
+
+
+@lru_cache(maxsize=MAX_PRICED_LEVEL + 1)
+def _catalog_json_for(price_level: int) -> tuple[tuple[str, bytes], ...]:
+    # JSON товара без закрывающей скобки: остаётся дописать "owned" игрока
+    return tuple(
+        (
+            item["item_key"],
+            json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8")[:-1] + b',"owned":',
+        )
+        for item in _catalog_payload_for(price_level)
+    )
+
+
+def catalog_json(level: int, owned: set[str]) -> bytes:
+    """Тело ответа /shop/catalog ({"items": [...]}) из заранее закодированных товаров уровня."""
+    items = b",".join(
+        prefix + (b"true}" if item_key in owned else b"false}")
+        for item_key, prefix in _catalog_json_for(_price_level(level))
+    )
+    return b'{"items":[' + items + b"]}"
 
 
 def find_item(item_key: str) -> ShopItem | None:
-    for item in CATALOG:
-        if item.item_key == item_key:
-            return item
-    return None
+    return CATALOG_BY_KEY.get(item_key)
 
 
 
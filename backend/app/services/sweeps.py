@@ -0,0 +1,220 @@
+"""Защита beat-обходов от наложения и продолжение прерванного обхода.
+
+Аренда: пока обход идёт, второй запуск того же обхода сразу завершается.
+- SWEEP_LOCK_BACKEND=redis — ключ sweep:<имя> в REDIS_URL (SET NX PX). Аренда
+  продлевается после каждой пачки, а у упавшего воркера истекает через
+  SWEEP_LEASE_SECONDS. Если продлить не удалось (ключ истёк и, возможно, уже занят
+  другим запуском, или Redis недоступен), advance бросает LeaseLost до коммита пачки и
+  обход останавливается. Если Redis недоступен при взятии аренды, используется
+  блокировка базы;
+- database — pg_try_advisory_lock на отдельном соединении: снимается сама, если
+  соединение оборвалось. На SQLite — блокировка внутри процесса.
+
+Контрольная точка (sweep_checkpoints): последний user_id завершённой пачки. Она
+обновляется в той же транзакции, что и пачка, поэтому после падения следующий запуск
+продолжает со следующей пачки. Запуск с другим run_key (например, отчёты другого дня)
+начинает обход заново.
+"""
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import logging
+import threading
+from typing import Protocol, TypeVar
+import uuid
+import zlib
+
+import redis
+from sqlalchemy import Engine, select, text, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import SweepCheckpoint, utcnow
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Снять или продлить ключ, только если он всё ещё наш
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+_RENEW_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+)
+
+_local_locks: dict[str, threading.Lock] = {}
+_local_locks_guard = threading.Lock()
+
+
+class LeaseLost(Exception):
+    """Аренда обхода потеряна: продолжать нельзя, обход мог подхватить другой воркер."""
+
+
+class Lease(Protocol):
+    def renew(self) -> None: ...
+
+    def release(self) -> None: ...
+
+
+class RedisLease:
+    def __init__(self, client: redis.Redis, key: str, ttl_seconds: int) -> None:
+        self.client = client
+        self.key = key
+        self.ttl_ms = ttl_seconds * 1000
+        self.token = uuid.uuid4().hex
+
+    def acquire(self) -> bool:
+        return bool(self.client.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    def renew(self) -> None:
+        try:
+            renewed = self.client.eval(_RENEW_SCRIPT, 1, self.key, self.token, self.ttl_ms)
+        except redis.RedisError as exc:
+            raise LeaseLost(self.key) from exc
+        if not renewed:
+            raise LeaseLost(self.key)
+
+    def release(self) -> None:
+        self.client.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+
+
+class DatabaseLease:
+    """pg_try_advisory_lock на PostgreSQL, блокировка процесса на остальных базах."""
+
+    def __init__(self, engine: Engine, name: str) -> None:
+        self.engine = engine
+        self.name = name
+        self.key = zlib.crc32(f"sweep:{name}".encode("utf-8"))
+        self._connection = None
+        self._local: threading.Lock | None = None
+
+    def acquire(self) -> bool:
+        if self.engine.dialect.name == "postgresql":
+            connection = self.engine.connect()
+            if connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar():
+                connection.commit()
+                self._connection = connection
+                return True
+            connection.close()
+            return False
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(self.name, threading.Lock())
+        if lock.acquire(blocking=False):
+            self._local = lock
+            return True
+        return False
+
+    def renew(self) -> None:
+        pass
+
+    def release(self) -> None:
+        if self._connection is not None:
+            self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            self._connection.close()
+            self._connection = None
+        if self._local is not None:
+            self._local.release()
+            self._local = None
+
+
+def acquire_lease(engine: Engine, name: str, ttl_seconds: int) -> Lease | None:
+    """Взять аренду обхода name или None, если обход уже идёт."""
+    settings = get_settings()
+    if settings.sweep_lock_backend == "redis":
+        lease = RedisLease(redis.Redis.from_url(settings.redis_url), f"sweep:{name}", ttl_seconds)
+        try:
+            return lease if lease.acquire() else None
+        except redis.RedisError:
+            logger.warning("sweep lease falls back to database lock name=%s", name, exc_info=True)
+    database_lease = DatabaseLease(engine, name)
+    return database_lease if database_lease.acquire() else None
+
+
+@contextmanager
+def sweep_lease(engine: Engine, name: str, ttl_seconds: int) -> Iterator[Lease | None]:
+    lease = acquire_lease(engine, name, ttl_seconds)
+    try:
+        yield lease
+    finally:
+        if lease is not None:
+            try:
+                lease.release()
+            except redis.RedisError:
+                logger.warning("sweep lease release failed name=%s", name, exc_info=True)
+
+
+@dataclass
+class SweepProgress:
+    """Контрольная точка запущенного обхода; advance пишет её в текущую транзакцию.
+
+    advance продлевает аренду и бросает LeaseLost, если она потеряна, — до коммита пачки.
+    """
+
+    name: str
+    cursor: int = 0
+    resumed: bool = False
+    lease: Lease | None = field(default=None, repr=False)
+
+    def advance(self, db: Session, cursor: int) -> None:
+        db.execute(
+            update(SweepCheckpoint)
+            .where(SweepCheckpoint.name == self.name)
+            .values(cursor=cursor, updated_at=utcnow())
+        )
+        if self.lease is not None:
+            self.lease.renew()
+        self.cursor = cursor
+
+
+def start_checkpoint(db: Session, name: str, *, run_key: str = "", lease: Lease | None = None) -> SweepProgress:
+    """Продолжить незавершённый обход с тем же run_key или начать новый; коммитит."""
+    checkpoint = db.execute(select(SweepCheckpoint).where(SweepCheckpoint.name == name)).scalar_one_or_none()
+    now = utcnow()
+    if checkpoint is None:
+        checkpoint = SweepCheckpoint(name=name)
+        db.add(checkpoint)
+    elif checkpoint.finished_at is None and checkpoint.run_key == run_key:
+        logger.info("sweep resumed name=%s cursor=%s", name, checkpoint.cursor)
+        return SweepProgress(name=name, cursor=checkpoint.cursor, resumed=True, lease=lease)
+    checkpoint.run_key = run_key
+    checkpoint.cursor = 0
+    checkpoint.started_at = now
+    checkpoint.finished_at = None
+    db.commit()
+    return SweepProgress(name=name, lease=lease)
+
+
+def finish_checkpoint(db: Session, progress: SweepProgress) -> None:
+    db.execute(update(SweepCheckpoint).where(SweepCheckpoint.name == progress.name).values(finished_at=utcnow()))
+    db.commit()
+
+
+def run_sweep(
+    name: str,
+    body: Callable[[Session, SweepProgress], T],
+    *,
+    run_key: str = "",
+    ttl_seconds: int | None = None,
+    session_factory: sessionmaker = SessionLocal,
+) -> T | None:
+    """Выполнить body под арендой обхода name с контрольной точкой.
+
+    None — обход уже идёт или аренда потеряна по ходу (незакоммиченная пачка откатывается).
+    """
+    ttl_seconds = ttl_seconds or get_settings().sweep_lease_seconds
+    with session_factory() as db:
+        with sweep_lease(db.get_bind(), name, ttl_seconds) as lease:
+            if lease is None:
+                logger.info("sweep skipped, another run is active name=%s", name)
+                return None
+            progress = start_checkpoint(db, name, run_key=run_key, lease=lease)
+            try:
+                result = body(db, progress)
+            except LeaseLost:
+                db.rollback()
+                logger.warning("sweep stopped, lease lost name=%s cursor=%s", name, progress.cursor)
+                return None
+            finish_checkpoint(db, progress)
+            return result
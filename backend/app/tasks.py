@@ -1,87 +1,184 @@
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
 
 from celery.utils.log import get_task_logger
-from sqlalchemy import select
+from sqlalchemy.orm import Session
 
 from app.celery_app import celery_app
+from app.config import get_settings
 from app.database import SessionLocal
-from app.models import EventLog, NotificationSettings, PetState
-from app.services.game import run_decay, serialize_pet_state
+from app.services.daily_tasks import provision_daily_progress, today_key
+from app.services.event_archive import archive_events
+from app.services.game import decay_pets
+from app.services.leaderboard import BOARDS, refresh_snapshot
+from app.services.notification_delivery import deliver_pending, purge_outbox
+from app.services.notifications import send_soft_pushes, write_daily_reports
+from app.services.partitions import is_partitioned, maintain_partitions
+from app.services.retention import rollup_daily_progress, rollup_rewards
+from app.services.sweeps import SweepProgress, run_sweep
 
 
 logger = get_task_logger(__name__)
+settings = get_settings()
 
 
 @celery_app.task
 def decay_all_pets() -> int:
-    updated = 0
-    with SessionLocal() as db:
-        pets = db.execute(select(PetState)).scalars().all()
-        for pet in pets:
-            seconds = run_decay(db, pet)
-            if seconds > 0:
-                updated += 1
+    updated = run_sweep(
+        "decay_all_pets",
+        lambda db, progress: decay_pets(db, chunk_size=settings.decay_chunk_size, progress=progress),
+    )
+    if updated is None:
+        return 0
     logger.info("decay_all_pets updated=%s", updated)
     return updated
 
 
 @celery_app.task
 def soft_push_notifications() -> int:
-    created = 0
-    now_iso = datetime.now(UTC).isoformat()
-    with SessionLocal() as db:
-        pets = db.execute(select(PetState)).scalars().all()
-        for pet in pets:
-            settings = db.execute(
-                select(NotificationSettings).where(NotificationSettings.user_id == pet.user_id)
-            ).scalar_one_or_none()
-            if not settings or not settings.soft_push_enabled:
-                continue
-
-            messages: list[str] = []
-            if pet.hunger < 30:
-                messages.append("Единорог проголодался")
-            if pet.energy < 20:
-                messages.append("Единорог устал")
-            if pet.hygiene < 30:
-                messages.append("Единорогу нужна ванна")
-            if pet.health < 40:
-                messages.append("Единорогу нужно лечение")
-
-            if not messages:
-                continue
-            db.add(
-                EventLog(
-                    user_id=pet.user_id,
-                    action="мягкое_уведомление",
-                    payload={"messages": messages, "created_by": "beat", "time": now_iso},
-                )
-            )
-            created += 1
-        db.commit()
+    created = run_sweep(
+        "soft_push_notifications",
+        lambda db, progress: send_soft_pushes(
+            db,
+            datetime.now(UTC),
+            chunk_size=settings.notification_chunk_size,
+            cooldown=timedelta(hours=settings.notification_cooldown_hours),
+            enqueue=settings.notification_outbox_enabled,
+            progress=progress,
+        ),
+    )
+    if created is None:
+        return 0
     logger.info("soft_push_notifications created=%s", created)
     return created
 
 
 @celery_app.task
 def daily_report() -> int:
-    created = 0
-    with SessionLocal() as db:
-        pets = db.execute(select(PetState)).scalars().all()
-        for pet in pets:
-            settings = db.execute(
-                select(NotificationSettings).where(NotificationSettings.user_id == pet.user_id)
-            ).scalar_one_or_none()
-            if not settings or not settings.daily_report_enabled:
-                continue
-            db.add(
-                EventLog(
-                    user_id=pet.user_id,
-                    action="ежедневный_отчёт",
-                    payload={"summary": serialize_pet_state(pet), "created_by": "beat"},
-                )
-            )
-            created += 1
-        db.commit()
+    now = datetime.now(UTC)
+    # Прерванный отчёт продолжается только в тот же день, иначе начало списка осталось бы без отчёта
+    created = run_sweep(
+        "daily_report",
+        lambda db, progress: write_daily_reports(
+            db,
+            now,
+            user_range=settings.daily_report_user_range,
+            chunk_size=settings.notification_chunk_size,
+            enqueue=settings.notification_outbox_enabled,
+            progress=progress,
+        ),
+        run_key=today_key(now),
+    )
+    if created is None:
+        return 0
     logger.info("daily_report created=%s", created)
     return created
+
+
+@celery_app.task
+def deliver_notifications() -> dict[str, int]:
+    if not settings.notification_outbox_enabled:
+        return {"sent": 0, "retried": 0, "failed": 0}
+    with SessionLocal() as db:
+        stats = deliver_pending(db, now_fn=lambda: datetime.now(UTC))
+    logger.info("deliver_notifications sent=%s retried=%s failed=%s", stats.sent, stats.retried, stats.failed)
+    return {"sent": stats.sent, "retried": stats.retried, "failed": stats.failed}
+
+
+@celery_app.task
+def provision_next_day_progress() -> int:
+    now = datetime.now(UTC)
+    date_key = today_key(now + timedelta(days=1))
+    created = run_sweep(
+        "provision_next_day_progress",
+        lambda db, progress: provision_daily_progress(
+            db,
+            date_key,
+            active_since=now - timedelta(days=settings.daily_provision_active_days),
+            chunk_size=settings.daily_provision_chunk_size,
+        ),
+        ttl_seconds=settings.sweep_maintenance_lease_seconds,
+    )
+    if created is None:
+        return 0
+    logger.info("provision_next_day_progress date_key=%s created=%s", date_key, created)
+    return created
+
+
+@celery_app.task
+def rollup_old_history() -> dict[str, int]:
+    now = datetime.now(UTC)
+
+    def rollup(db: Session, progress: SweepProgress) -> dict[str, int]:
+        daily_removed = rollup_daily_progress(
+            db,
+            today_key(now - timedelta(days=settings.retention_daily_progress_days)),
+            batch_size=settings.retention_batch_size,
+        )
+        # Секционированные rewards сворачиваются целыми месяцами в maintain_table_partitions
+        rewards_removed = 0
+        if not is_partitioned(db, "rewards"):
+            rewards_removed = rollup_rewards(
+                db,
+                now - timedelta(days=settings.retention_rewards_days),
+                batch_size=settings.retention_batch_size,
+            )
+        outbox_removed = purge_outbox(
+            db,
+            now - timedelta(days=settings.notification_outbox_keep_days),
+            batch_size=settings.retention_batch_size,
+        )
+        return {"daily_progress": daily_removed, "rewards": rewards_removed, "notification_outbox": outbox_removed}
+
+    removed = run_sweep("rollup_old_history", rollup, ttl_seconds=settings.sweep_maintenance_lease_seconds)
+    if removed is None:
+        return {}
+    logger.info(
+        "rollup_old_history daily_progress=%s rewards=%s notification_outbox=%s",
+        removed["daily_progress"],
+        removed["rewards"],
+        removed["notification_outbox"],
+    )
+    return removed
+
+
+@celery_app.task
+def archive_old_events() -> int:
+    def archive(db: Session, progress: SweepProgress) -> int:
+        # Секционированный журнал архивируется целыми месяцами в maintain_table_partitions
+        if is_partitioned(db, "event_logs"):
+            return 0
+        return archive_events(
+            db,
+            datetime.now(UTC) - timedelta(days=settings.event_archive_after_days),
+            archive_dir=Path(settings.event_archive_dir),
+            user_range=settings.event_archive_user_range,
+            batch_size=settings.event_archive_batch_size,
+        )
+
+    archived = run_sweep("archive_old_events", archive, ttl_seconds=settings.sweep_maintenance_lease_seconds)
+    if archived is None:
+        return 0
+    logger.info("archive_old_events archived=%s", archived)
+    return archived
+
+
+@celery_app.task
+def maintain_table_partitions() -> dict[str, dict[str, list[str]]]:
+    result = run_sweep(
+        "maintain_table_partitions",
+        lambda db, progress: maintain_partitions(db),
+        ttl_seconds=settings.sweep_maintenance_lease_seconds,
+    )
+    if result is None:
+        return {}
+    logger.info("maintain_table_partitions result=%s", result)
+    return result
+
+
+@celery_app.task
+def refresh_leaderboard_snapshots() -> dict[str, str]:
+    with SessionLocal() as db:
+        generated = {board: refresh_snapshot(db, board).generated_at.isoformat() for board in BOARDS}
+    logger.info("refresh_leaderboard_snapshots generated_at=%s", generated)
+    return generated
@@ -0,0 +1,88 @@
+from datetime import UTC, datetime, timedelta
+import random
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import DailyProgress, PetState
+from app.services.daily_tasks import (
+    TASK_POOL,
+    default_tasks,
+    ensure_today_progress,
+    increment_task,
+    load_tasks,
+    provision_daily_progress,
+    tasks_for_day,
+)
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def test_tasks_are_parsed_once_and_written_back_on_change() -> None:
+    db = _make_db()
+    progress = ensure_today_progress(db, user_id=1)
+
+    tasks = load_tasks(progress)
+    assert load_tasks(progress) is tasks
+    assert tasks.dirty is False
+
+    raw_before = progress.tasks
+    assert increment_task(progress, "feed_count", 1) is True
+    assert progress.tasks is not raw_before
+    assert load_tasks(progress) is tasks
+    assert tasks.find("feed_count").progress == 1
+
+    db.commit()
+    db.refresh(progress)
+    reloaded = load_tasks(progress)
+    assert reloaded is not tasks
+    assert reloaded.find("feed_count").progress == 1
+
+
+def test_unknown_task_key_leaves_row_untouched() -> None:
+    db = _make_db()
+    progress = ensure_today_progress(db, user_id=1)
+    raw_before = progress.tasks
+
+    assert increment_task(progress, "no_such_task", 1) is False
+    assert progress.tasks is raw_before
+
+
+def test_day_selection_is_memoized_and_leaves_global_random_alone() -> None:
+    random.seed(42)
+    expected_next = random.random()
+    random.seed(42)
+
+    first = tasks_for_day("2026-03-01")
+    assert tasks_for_day("2026-03-01") is first
+    assert random.random() == expected_next
+
+    # Совпадает с прежним выбором через глобальный random.seed(date)
+    legacy = random.Random(20260301).sample(TASK_POOL, 3)
+    assert [task["task_key"] for task in first] == [task["task_key"] for task in legacy]
+
+    tasks = default_tasks("2026-03-01")
+    tasks[0]["progress"] = 5
+    assert tasks_for_day("2026-03-01")[0]["progress"] == 0
+
+
+def test_provisioning_inserts_rows_for_active_users_once() -> None:
+    db = _make_db()
+    now = datetime.now(UTC)
+    db.add(PetState(user_id=1, last_active_at=now))
+    db.add(PetState(user_id=2, last_active_at=now - timedelta(days=30)))
+    db.add(PetState(user_id=3, last_active_at=now))
+    db.commit()
+
+    created = provision_daily_progress(db, "2026-03-02", active_since=now - timedelta(days=7), chunk_size=1)
+    assert created == 2
+    assert provision_daily_progress(db, "2026-03-02", active_since=now - timedelta(days=7)) == 0
+
+    rows = db.execute(select(DailyProgress).order_by(DailyProgress.user_id)).scalars().all()
+    assert [row.user_id for row in rows] == [1, 3]
+    assert [task["task_key"] for task in rows[0].tasks] == [task["task_key"] for task in tasks_for_day("2026-03-02")]
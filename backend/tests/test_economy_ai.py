@@ -41,3 +41,23 @@ def test_pet_state_priority() -> None:
         определить_состояние_питомца(hunger=90, hygiene=90, happiness=88, health=90, energy=90)
         == "Радостный"
     )
+
+
+def _legacy_level_loop(level: int, xp: int) -> tuple[int, int, list[int]]:
+    next_level = max(1, level)
+    carry = xp
+    levels_gained: list[int] = []
+    while carry >= опыт_до_следующего_уровня(next_level):
+        carry -= опыт_до_следующего_уровня(next_level)
+        next_level += 1
+        levels_gained.append(next_level)
+    return next_level, carry, levels_gained
+
+
+def test_apply_progress_matches_legacy_level_loop() -> None:
+    cases = [(1, 0, 0), (1, 49, 1), (1, 0, 50), (3, 10, 400), (7, 0, 250_000), (40, 120, 3), (0, 0, 120)]
+    for level, xp, base_xp in cases:
+        carry, next_level, _, _, _, progress = apply_progress(
+            xp=xp, level=level, stage="baby", intelligence=0, base_xp=base_xp, base_coins=0
+        )
+        assert (next_level, carry, progress.levels_gained) == _legacy_level_loop(level, xp + base_xp)
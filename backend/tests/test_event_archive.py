@@ -0,0 +1,83 @@
+from datetime import UTC, datetime, timedelta
+import gzip
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import EventArchiveSegment, EventLog
+from app.services.event_archive import (
+    archive_events,
+    archive_range,
+    iter_archived_events,
+    segment_name,
+    upsert_segment_index,
+)
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def test_archive_moves_old_events_into_segments_and_reads_them_back(tmp_path) -> None:
+    db = _make_db()
+    start = datetime(2026, 1, 30, tzinfo=UTC)
+    for index in range(8):
+        for user_id in (7, 12, 150):
+            db.add(
+                EventLog(
+                    user_id=user_id,
+                    action=f"a{index}",
+                    payload={"n": index, "note": '"user_id":7,'},
+                    created_at=start + timedelta(days=index),
+                )
+            )
+    db.commit()
+
+    cutoff = start + timedelta(days=6)
+    archived = archive_events(db, cutoff, archive_dir=tmp_path, user_range=100, batch_size=5)
+
+    assert archived == 18
+    remaining = db.execute(select(EventLog.user_id, EventLog.action).order_by(EventLog.id)).all()
+    assert remaining == [(user_id, action) for action in ("a6", "a7") for user_id in (7, 12, 150)]
+
+    index = db.execute(
+        select(EventArchiveSegment.segment, EventArchiveSegment.events).where(EventArchiveSegment.user_id == 7)
+    ).all()
+    assert sorted(index) == [
+        (segment_name("2026-01", 7, 100), 2),
+        (segment_name("2026-02", 7, 100), 4),
+    ]
+    assert (tmp_path / "2026-02" / "users-0000000100-0000000199.jsonl.gz").exists()
+
+    # Повтор пачки после сбоя между записью файла и коммитом не даёт дублей при чтении
+    path = tmp_path / segment_name("2026-01", 7, 100)
+    with gzip.open(path, "rb") as handle:
+        duplicate = handle.read()
+    with open(path, "ab") as handle:
+        handle.write(gzip.compress(duplicate))
+
+    records = list(iter_archived_events(db, 7, archive_dir=tmp_path))
+    assert [record["action"] for record in records] == [f"a{index}" for index in range(6)]
+    assert all(record["user_id"] == 7 for record in records)
+    assert records[0]["payload"]["n"] == 0
+
+
+def test_rearchiving_a_month_after_a_crash_does_not_inflate_the_index(tmp_path) -> None:
+    db = _make_db()
+    start = datetime(2026, 3, 1, tzinfo=UTC)
+    for index in range(3):
+        db.add(EventLog(user_id=5, action=f"a{index}", payload={}, created_at=start + timedelta(days=index)))
+    db.commit()
+
+    end = datetime(2026, 4, 1, tzinfo=UTC)
+    # Первая выгрузка секции дошла до индекса, но DROP не случился; вторая — повтор
+    for _ in range(2):
+        counts = archive_range(db, start, end, archive_dir=tmp_path, user_range=100)
+        upsert_segment_index(db, counts, replace=True)
+        db.commit()
+
+    assert db.execute(select(EventArchiveSegment.events)).scalar_one() == 3
+    assert [event["action"] for event in iter_archived_events(db, 5, archive_dir=tmp_path)] == ["a0", "a1", "a2"]
@@ -0,0 +1,123 @@
+from datetime import UTC, datetime
+from itertools import count
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import EventLog, NotificationSettings, PetState
+from app.services.event_writer import BufferedEventWriter, replay_spilled_events, set_event_writer, write_event
+from app.services.game import ensure_pet_state, execute_action
+from app.services.notifications import SOFT_PUSH_ACTION, send_soft_pushes
+
+
+def _make_engine():
+    # Один общий коннект: фоновый поток писателя видит ту же in-memory базу
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:",
+        future=True,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def _session(engine) -> Session:
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def test_sync_mode_logs_action_in_the_same_commit() -> None:
+    set_event_writer(None)
+    db = _session(_make_engine())
+    pet = ensure_pet_state(db, 1)
+    # Первое действие дня ещё создаёт строку ежедневных заданий отдельным коммитом
+    execute_action(db, pet, "feed")
+    commits = []
+    event.listen(db, "after_commit", lambda session: commits.append(1))
+
+    result = execute_action(db, pet, "play")
+
+    assert len(commits) == 1
+    stored = db.execute(select(EventLog).order_by(EventLog.id.desc())).scalars().first()
+    assert (stored.id, stored.action) == (result.event.id, "play")
+    assert "stats" in result.event.payload
+
+
+def test_buffered_writer_flushes_after_commit_and_drops_rolled_back_events(tmp_path) -> None:
+    engine = _make_engine()
+    ids = count(1000)
+    writer = BufferedEventWriter(engine, lambda: next(ids), flush_interval=0.005, batch_size=3, spill_dir=tmp_path)
+    set_event_writer(writer)
+    try:
+        db = _session(engine)
+        pet = ensure_pet_state(db, 1)
+        first = execute_action(db, pet, "feed").event
+        second = execute_action(db, pet, "play").event
+        assert (first.id, second.id) == (1000, 1001)
+        assert first.created_at <= second.created_at
+
+        # Отменённая транзакция не должна попасть в журнал, хотя id уже выделен
+        write_event(db, 1, "отменено", {})
+        db.rollback()
+
+        writer.flush()
+        rows = db.execute(select(EventLog.id, EventLog.action).order_by(EventLog.id)).all()
+        assert rows == [(1000, "feed"), (1001, "play")]
+
+        for index in range(7):
+            write_event(db, 1, f"batch{index}", {})
+        db.commit()
+        writer.close()
+        assert len(db.execute(select(EventLog).where(EventLog.action.like("batch%"))).scalars().all()) == 7
+    finally:
+        set_event_writer(None)
+
+
+def test_beat_rows_go_through_the_buffered_writer(tmp_path) -> None:
+    engine = _make_engine()
+    ids = count(2000)
+    writer = BufferedEventWriter(engine, lambda: next(ids), flush_interval=0.005, batch_size=10, spill_dir=tmp_path)
+    set_event_writer(writer)
+    try:
+        db = _session(engine)
+        for user_id in (1, 2):
+            db.add(PetState(user_id=user_id, hunger=10))
+            db.add(NotificationSettings(user_id=user_id, soft_push_enabled=True))
+        db.commit()
+
+        assert send_soft_pushes(db, datetime(2026, 10, 19, 8, 0, tzinfo=UTC), chunk_size=1) == 2
+        writer.flush()
+        rows = db.execute(select(EventLog.id, EventLog.user_id, EventLog.action).order_by(EventLog.id)).all()
+        assert rows == [(2000, 1, SOFT_PUSH_ACTION), (2001, 2, SOFT_PUSH_ACTION)]
+    finally:
+        set_event_writer(None)
+
+
+def test_failed_batch_is_spilled_and_replayed(tmp_path) -> None:
+    # Таблиц ещё нет — вставка падает на всех попытках
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'events.db'}", future=True)
+    writer = BufferedEventWriter(engine, lambda: 0, flush_interval=0.001, batch_size=10, spill_dir=tmp_path / "spill")
+    created_at = datetime(2026, 10, 19, 8, 0, tzinfo=UTC)
+    writer.enqueue(
+        [
+            {"id": 7, "user_id": 1, "action": "feed", "payload": {"stats": {"hunger": 90}}, "created_at": created_at},
+            {"id": 8, "user_id": 1, "action": "play", "payload": {}, "created_at": created_at},
+        ]
+    )
+    writer.close()
+    assert len(list((tmp_path / "spill").glob("events-*.jsonl"))) == 1
+
+    Base.metadata.create_all(engine)
+    db = _session(engine)
+    db.add(PetState(user_id=1, event_seq=5))
+    db.commit()
+
+    assert replay_spilled_events(engine, tmp_path / "spill") == 2
+    # Повтор безопасен: файлы удалены, а уже записанные id пропускаются
+    assert replay_spilled_events(engine, tmp_path / "spill") == 0
+    rows = db.execute(select(EventLog.id, EventLog.action, EventLog.payload).order_by(EventLog.id)).all()
+    assert rows == [(7, "feed", {"stats": {"hunger": 90}}), (8, "play", {})]
+    db.expire_all()
+    assert db.execute(select(PetState.event_seq)).scalar_one() == 0
@@ -0,0 +1,113 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, delete, select, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import get_settings
+from app.database import Base
+from app.models import DailyProgress, EventLog, PetState, utcnow
+from app.services.game import ensure_pet_state, execute_action
+from app.services.cursors import encode_cursor
+from app.services.event_payloads import RARE_FIELDS, reconstruct_stats
+from app.services.history import history_page, history_query, stats_for_rows
+from app.services.partitions import month_start
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def test_before_cursor_walks_history_without_gaps() -> None:
+    db = _make_db()
+    start = datetime(2026, 3, 1, tzinfo=UTC)
+    for index in range(25):
+        # Пары событий с одинаковым временем проверяют разрешение равенства по id
+        db.add(EventLog(user_id=1, action=f"a{index}", payload={}, created_at=start + timedelta(minutes=index // 2)))
+        db.add(EventLog(user_id=2, action="other", payload={}, created_at=start))
+    db.commit()
+
+    seen, before = [], None
+    while True:
+        rows, before = history_page(db, 1, 4, before)
+        seen.extend(row.action for row in rows)
+        if before is None:
+            break
+    assert seen == [f"a{index}" for index in reversed(range(25))]
+
+    with pytest.raises(ValueError):
+        history_page(db, 1, 4, "bogus")
+
+
+def test_history_query_uses_composite_index_without_sort() -> None:
+    db = _make_db()
+    sql = str(
+        history_query(1, 30, encode_cursor(["2026-03-01T00:00:00+00:00", 10])).compile(
+            db.get_bind(), compile_kwargs={"literal_binds": True}
+        )
+    )
+    plan = " ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert "ix_event_logs_user_created" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_compact_payloads_reconstruct_full_stats(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(get_settings(), "event_snapshot_interval", 3)
+    db = _make_db()
+    pet = ensure_pet_state(db, user_id=1)
+
+    expected = {}
+    for action in ["feed", "play", "wash", "chat", "feed", "play", "heal", "wash"]:
+        event = execute_action(db, pet, action).event
+        assert "stats" in event.payload and "daily" in event.payload
+        expected[event.id] = {key: value for key, value in event.payload["stats"].items() if key != "is_lonely"}
+
+    stored = db.execute(select(EventLog.payload).order_by(EventLog.id)).scalars().all()
+    assert all("stats" not in payload and "daily" not in payload for payload in stored)
+    assert ["snapshot" in payload for payload in stored] == [True, False, False] * 2 + [True, False]
+
+    # Страница из середины: снимок подтягивается из более старых строк
+    db.expire_all()
+    first, before = history_page(db, 1, 3)
+    middle, _ = history_page(db, 1, 3, before)
+    assert all("stats" not in row.payload for row in first + middle)
+    for rows in (first, middle):
+        for row_id, stats in stats_for_rows(db, 1, rows).items():
+            assert {key: stats[key] for key in expected[row_id]} == expected[row_id]
+
+
+def test_first_event_of_the_day_keeps_rare_fields_changed_before_a_mid_request_commit() -> None:
+    db = _make_db()
+    factory = sessionmaker(bind=db.get_bind(), autoflush=False, autocommit=False, expire_on_commit=False)
+    execute_action(db, ensure_pet_state(db, user_id=1), "chat")
+    # Новый UTC-день: строки прогресса на сегодня ещё нет, ensure_today_progress её создаст и закоммитит
+    db.execute(delete(DailyProgress))
+    db.commit()
+    db.close()
+
+    with factory() as request_db:
+        execute_action(request_db, request_db.get(PetState, 1), "feed")
+
+    with factory() as reader:
+        pet = reader.get(PetState, 1)
+        rows = reader.execute(select(EventLog).order_by(EventLog.id)).scalars().all()
+        assert "snapshot" not in rows[-1].payload
+        state = reconstruct_stats(rows)[rows[-1].id]
+        assert {name: state[name] for name in RARE_FIELDS} == {name: getattr(pet, name) for name in RARE_FIELDS}
+
+
+def test_history_page_continues_from_current_month_into_older_months() -> None:
+    db = _make_db()
+    current_month = month_start(utcnow())
+    for index in range(3):
+        db.add(EventLog(user_id=1, action=f"old{index}", payload={}, created_at=current_month - timedelta(days=3 - index)))
+        db.add(EventLog(user_id=1, action=f"new{index}", payload={}, created_at=current_month + timedelta(seconds=index)))
+    db.commit()
+
+    rows, before = history_page(db, 1, 4)
+    assert [row.action for row in rows] == ["new2", "new1", "new0", "old2"]
+    rows, before = history_page(db, 1, 4, before)
+    assert [row.action for row in rows] == ["old1", "old0"]
+    assert before is None
@@ -0,0 +1,314 @@
+import pytest
+import redis
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import PetState
+from app.services import leaderboard
+from app.services.leaderboard import (
+    InMemoryLeaderboardStore,
+    LeaderboardUnavailable,
+    MemberChange,
+    get_snapshot,
+    member_for,
+    neighbourhood,
+    page_entries,
+    rank_of,
+    rebuild_leaderboards,
+    refresh_snapshot,
+    set_leaderboard_store,
+    top_entries,
+    top_entries_from_db,
+    top_query,
+)
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+@pytest.fixture
+def store():
+    store = InMemoryLeaderboardStore()
+    set_leaderboard_store(store)
+    yield store
+    set_leaderboard_store(None)
+
+
+def _add_pets(db: Session, rows: list[tuple[int, int, int, int]]) -> None:
+    for user_id, coins, level, xp in rows:
+        db.add(PetState(user_id=user_id, name=f"pet{user_id}", coins=coins, level=level, xp=xp))
+    db.commit()
+
+
+def test_commits_keep_boards_current(store: InMemoryLeaderboardStore) -> None:
+    db = _make_db()
+    _add_pets(db, [(1, 100, 3, 10), (2, 500, 3, 40), (3, 300, 5, 0)])
+
+    assert [entry["user_id"] for entry in top_entries(db, "wealth", 10)] == [2, 3, 1]
+    assert [entry["user_id"] for entry in top_entries(db, "level", 10)] == [3, 2, 1]
+
+    pet = db.get(PetState, 1)
+    pet.coins = 1000
+    pet.level = 6
+    db.commit()
+
+    wealth = top_entries(db, "wealth", 2)
+    assert [(entry["user_id"], entry["rank"], entry["coins"]) for entry in wealth] == [(1, 1, 1000), (2, 2, 500)]
+    assert rank_of(db, "level", 1) == 1
+    assert rank_of(db, "level", 2) == 3
+    assert rank_of(db, "wealth", 42) is None
+
+
+def test_rollback_does_not_publish(store: InMemoryLeaderboardStore) -> None:
+    db = _make_db()
+    _add_pets(db, [(1, 100, 1, 0), (2, 200, 1, 0)])
+    assert rank_of(db, "wealth", 1) == 2
+
+    pet = db.get(PetState, 1)
+    pet.coins = 999
+    db.flush()
+    db.rollback()
+
+    assert rank_of(db, "wealth", 1) == 2
+
+
+def test_rebuild_repairs_drift(store: InMemoryLeaderboardStore) -> None:
+    db = _make_db()
+    _add_pets(db, [(1, 100, 1, 0), (2, 200, 1, 0)])
+    rebuild_leaderboards(db)
+    store.update({member_for(1): MemberChange(scores={"wealth": 10_000.0})})
+    assert rank_of(db, "wealth", 1) == 1
+
+    assert rebuild_leaderboards(db) == 2
+    assert rank_of(db, "wealth", 1) == 2
+
+
+def test_neighbourhood_returns_rank_and_window(store: InMemoryLeaderboardStore) -> None:
+    db = _make_db()
+    _add_pets(db, [(user_id, user_id * 10, 1 + user_id % 3, user_id) for user_id in range(1, 21)])
+
+    payload = neighbourhood(db, "wealth", 15, 2)
+    assert payload["rank"] == 6
+    assert payload["total"] == 20
+    assert [(entry["user_id"], entry["rank"]) for entry in payload["entries"]] == [
+        (17, 4), (16, 5), (15, 6), (14, 7), (13, 8)
+    ]
+
+    top = neighbourhood(db, "level", 20, 3)
+    assert [entry["rank"] for entry in top["entries"]][0] == 1
+    assert top["entries"][top["rank"] - 1]["user_id"] == 20
+
+    # Игрок, чья публикация не дошла, досчитывается по базе
+    store.update({member_for(15): MemberChange(removed={"wealth"})})
+    assert neighbourhood(db, "wealth", 15, 0)["rank"] == 6
+    assert neighbourhood(db, "wealth", 99, 1) is None
+
+
+@pytest.mark.parametrize(
+    ("board", "index_name"),
+    [("wealth", "ix_pet_states_leaderboard_wealth"), ("level", "ix_pet_states_leaderboard_level")],
+)
+def test_top_query_reads_covering_index_without_sort(board: str, index_name: str) -> None:
+    db = _make_db()
+    _add_pets(db, [(user_id, user_id * 7 % 50, 1 + user_id % 4, user_id) for user_id in range(1, 200)])
+    db.execute(text("ANALYZE"))
+
+    sql = str(top_query(board, 10).compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    plan = " ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert f"USING COVERING INDEX {index_name}" in plan
+    assert "TEMP B-TREE" not in plan
+
+    entries = top_entries_from_db(db, board, 10)
+    expected = sorted(
+        db.execute(select(PetState)).scalars(),
+        key=lambda pet: (-pet.coins, -pet.user_id) if board == "wealth" else (-pet.level, -pet.xp, -pet.user_id),
+    )[:10]
+    assert [entry["user_id"] for entry in entries] == [pet.user_id for pet in expected]
+
+
+def test_snapshot_is_reused_until_stale(store: InMemoryLeaderboardStore) -> None:
+    db = _make_db()
+    _add_pets(db, [(1, 100, 1, 0), (2, 200, 1, 0)])
+
+    first = get_snapshot(db, "wealth")
+    assert [entry["user_id"] for entry in first.entries(10)] == [2, 1]
+
+    pet = db.get(PetState, 1)
+    pet.coins = 500
+    db.commit()
+    cached = get_snapshot(db, "wealth")
+    assert cached.generated_at == first.generated_at
+    assert cached.body == first.body
+
+    refreshed = refresh_snapshot(db, "wealth")
+    assert [entry["user_id"] for entry in refreshed.entries(1)] == [1]
+    assert get_snapshot(db, "wealth").generated_at == refreshed.generated_at
+
+
+def test_stale_snapshot_is_served_while_another_request_refreshes_it(
+    store: InMemoryLeaderboardStore, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db = _make_db()
+    _add_pets(db, [(1, 100, 1, 0), (2, 200, 1, 0)])
+    monkeypatch.setattr(leaderboard, "SNAPSHOT_WAIT_SECONDS", 0.1)
+
+    # Снимка нет, а блокировку держит другой запрос: считать на месте нельзя
+    assert store.try_lock_snapshot("wealth")
+    with pytest.raises(LeaderboardUnavailable):
+        get_snapshot(db, "wealth")
+    store.unlock_snapshot("wealth")
+    first = get_snapshot(db, "wealth")
+
+    stale_at = first.generated_at.timestamp() - 3600
+    store.save_snapshot("wealth", stale_at, first.body, leaderboard.SNAPSHOT_KEEP_SECONDS)
+    pet = db.get(PetState, 1)
+    pet.coins = 500
+    db.commit()
+
+    # Устаревший снимок отдаётся как есть, пока его обновляет владелец блокировки
+    assert store.try_lock_snapshot("wealth")
+    stale = get_snapshot(db, "wealth")
+    assert stale.generated_at.timestamp() == stale_at
+    assert stale.body == first.body
+    store.unlock_snapshot("wealth")
+
+    refreshed = get_snapshot(db, "wealth")
+    assert [entry["user_id"] for entry in refreshed.entries(1)] == [1]
+    assert store.try_lock_snapshot("wealth")
+
+
+def test_keyset_pages_cover_board_without_gaps(store: InMemoryLeaderboardStore) -> None:
+    db = _make_db()
+    # Равные счета: порядок внутри равенства — user_id по убыванию
+    _add_pets(db, [(user_id, (user_id // 3) * 10, 1, 0) for user_id in range(1, 31)])
+
+    seen, cursor = [], None
+    while True:
+        page = page_entries(db, "wealth", 7, cursor=cursor)
+        seen.extend((entry["user_id"], entry["rank"]) for entry in page["entries"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    expected = sorted(range(1, 31), key=lambda user_id: ((user_id // 3) * 10, user_id), reverse=True)
+    assert seen == [(user_id, rank) for rank, user_id in enumerate(expected, start=1)]
+
+    # Курсор остаётся валидным, даже если игрок на границе страницы сменил счёт
+    first = page_entries(db, "wealth", 5)
+    boundary = db.get(PetState, first["entries"][-1]["user_id"])
+    boundary.coins = 0
+    db.commit()
+    second = page_entries(db, "wealth", 5, cursor=first["next_cursor"])
+    assert second["entries"][0]["user_id"] == expected[5]
+
+
+def test_brackets_follow_stage_and_level_changes(store: InMemoryLeaderboardStore) -> None:
+    db = _make_db()
+    _add_pets(db, [(1, 100, 3, 0), (2, 200, 8, 0), (3, 300, 4, 0)])
+    pets = {pet.user_id: pet for pet in db.execute(select(PetState)).scalars()}
+    pets[2].stage = "child"
+    db.commit()
+
+    assert [entry["user_id"] for entry in page_entries(db, "wealth", 10, bracket="band:1-5")["entries"]] == [3, 1]
+    assert [entry["user_id"] for entry in page_entries(db, "wealth", 10, bracket="stage:baby")["entries"]] == [3, 1]
+
+    pets[3].level = 6
+    pets[3].stage = "child"
+    db.commit()
+
+    assert [entry["user_id"] for entry in page_entries(db, "wealth", 10, bracket="band:1-5")["entries"]] == [1]
+    assert [entry["user_id"] for entry in page_entries(db, "level", 10, bracket="stage:child")["entries"]] == [2, 3]
+    assert neighbourhood(db, "wealth", 3, 1, bracket="band:6-10")["rank"] == 1
+
+    with pytest.raises(ValueError):
+        page_entries(db, "wealth", 10, cursor="not-a-cursor")
+
+
+def test_requests_do_not_rebuild_while_another_rebuild_runs(store: InMemoryLeaderboardStore) -> None:
+    db = _make_db()
+    _add_pets(db, [(1, 100, 1, 0), (2, 200, 1, 0)])
+    assert store.try_lock_rebuild()
+    try:
+        assert [entry["user_id"] for entry in top_entries(db, "wealth", 10)] == [2, 1]
+        # Пока идёт чужая пересборка, страницы читаются из базы
+        assert [entry["user_id"] for entry in page_entries(db, "wealth", 10)["entries"]] == [2, 1]
+        assert neighbourhood(db, "wealth", 1, 1)["rank"] == 2
+        assert not store.is_built()
+    finally:
+        store.unlock_rebuild()
+    assert rank_of(db, "wealth", 1) == 2
+    assert store.is_built()
+
+
+@pytest.mark.parametrize("board", ["wealth", "level"])
+def test_store_and_database_agree_on_tied_scores(store: InMemoryLeaderboardStore, board: str) -> None:
+    db = _make_db()
+    _add_pets(db, [(user_id, 100 if user_id % 2 else 50, 2, 10) for user_id in range(1, 12)])
+
+    from_store = [(entry["user_id"], entry["rank"]) for entry in top_entries(db, board, 11)]
+    from_db = [(entry["user_id"], entry["rank"]) for entry in top_entries_from_db(db, board, 11)]
+    assert from_store == from_db
+
+
+class UnavailableStore(InMemoryLeaderboardStore):
+    def is_built(self) -> bool:
+        raise redis.ConnectionError("redis недоступен")
+
+
+@pytest.mark.parametrize("board", ["wealth", "level"])
+@pytest.mark.parametrize("bracket", [None, "band:1-5", "stage:child"])
+def test_database_fallback_matches_store_when_redis_fails(
+    store: InMemoryLeaderboardStore, board: str, bracket: str | None
+) -> None:
+    db = _make_db()
+    _add_pets(db, [(user_id, (user_id // 3) * 10, 1 + user_id % 7, user_id % 4) for user_id in range(1, 26)])
+    for pet in db.execute(select(PetState).where(PetState.user_id % 3 == 0)).scalars():
+        pet.stage = "child"
+    db.commit()
+
+    def walk() -> list[tuple[int, int]]:
+        seen, cursor = [], None
+        while True:
+            page = page_entries(db, board, 4, bracket=bracket, cursor=cursor)
+            seen.extend((entry["user_id"], entry["rank"]) for entry in page["entries"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    def around(user_id: int) -> tuple[int | None, dict | None]:
+        return rank_of(db, board, user_id, bracket), neighbourhood(db, board, user_id, 2, bracket)
+
+    expected_pages = walk()
+    expected_around = [around(user_id) for user_id in (1, 3, 12, 25)]
+    set_leaderboard_store(UnavailableStore())
+    assert walk() == expected_pages
+    assert [around(user_id) for user_id in (1, 3, 12, 25)] == expected_around
+
+
+class CommitDuringRebuildStore(InMemoryLeaderboardStore):
+    """Во время пересборки, уже после чтения базы, коммитит изменение питомца."""
+
+    def __init__(self, db: Session) -> None:
+        super().__init__()
+        self.db = db
+
+    def replace_all(self, scores: dict[str, dict[str, float]]) -> None:
+        pet = self.db.get(PetState, 1)
+        pet.coins = 999
+        self.db.commit()
+        super().replace_all(scores)
+
+
+def test_changes_published_during_a_rebuild_survive_the_swap() -> None:
+    db = _make_db()
+    _add_pets(db, [(1, 100, 1, 0), (2, 200, 1, 0)])
+    store = CommitDuringRebuildStore(sessionmaker(bind=db.get_bind(), expire_on_commit=False)())
+    set_leaderboard_store(store)
+    try:
+        assert rebuild_leaderboards(db) == 2
+        assert store.range("wealth", 0, 1) == [(member_for(1), 999.0), (member_for(2), 200.0)]
+    finally:
+        set_leaderboard_store(None)
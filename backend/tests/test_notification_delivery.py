@@ -0,0 +1,137 @@
+from datetime import UTC, datetime, timedelta
+import threading
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import NotificationOutbox, NotificationSettings, PetState
+from app.services.notification_delivery import (
+    DeliveryError,
+    TokenBucket,
+    claim_batch,
+    deliver_batch,
+    deliver_pending,
+    purge_outbox,
+)
+from app.services.notifications import send_soft_pushes
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+class FakeTransport:
+    def __init__(self, failures: dict[int, DeliveryError] | None = None, crash_on: set[int] | None = None) -> None:
+        self.failures = failures or {}
+        self.crash_on = crash_on or set()
+        self.sent: list[tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    def send(self, chat_id: int, text: str) -> None:
+        if chat_id in self.failures:
+            raise self.failures[chat_id]
+        if chat_id in self.crash_on:
+            raise RuntimeError("воркер упал")
+        with self._lock:
+            self.sent.append((chat_id, text))
+
+    def close(self) -> None:
+        pass
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def test_token_bucket_limits_rate() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(10, capacity=5, clock=clock, sleep=clock.sleep)
+    for _ in range(25):
+        bucket.acquire()
+    # 5 сообщений из запаса, остальные 20 — по 10 в секунду
+    assert round(clock.now, 6) == 2.0
+
+
+def test_outbox_delivery_retries_with_backoff_and_fails_permanent_errors() -> None:
+    db = _make_db()
+    for user_id in (1, 2, 3):
+        db.add(PetState(user_id=user_id, hunger=10))
+        db.add(NotificationSettings(user_id=user_id))
+    db.commit()
+    now = datetime(2026, 10, 19, 8, 0, tzinfo=UTC)
+    assert send_soft_pushes(db, now, enqueue=True) == 3
+
+    transport = FakeTransport(
+        {2: DeliveryError("502: Bad Gateway"), 3: DeliveryError("403: bot was blocked by the user", permanent=True)}
+    )
+    bucket = TokenBucket(1000)
+    stats = deliver_pending(db, now_fn=lambda: now, transport=transport, bucket=bucket)
+    assert (stats.sent, stats.retried, stats.failed) == (1, 1, 1)
+    assert transport.sent == [(1, "Единорог проголодался")]
+
+    rows = {row.user_id: row for row in db.execute(select(NotificationOutbox)).scalars()}
+    assert [rows[user_id].status for user_id in (1, 2, 3)] == ["sent", "pending", "failed"]
+    assert rows[2].next_attempt_at.replace(tzinfo=UTC) == now + timedelta(seconds=30)
+
+    # До конца задержки повтора забирать нечего, после — вторая попытка с удвоенной задержкой
+    assert deliver_pending(db, now_fn=lambda: now + timedelta(seconds=10), transport=transport, bucket=bucket).retried == 0
+    later = now + timedelta(seconds=30)
+    assert deliver_pending(db, now_fn=lambda: later, transport=transport, bucket=bucket).retried == 1
+    db.expire_all()
+    retried = db.get(NotificationOutbox, rows[2].id)
+    assert retried.attempts == 2
+    assert retried.next_attempt_at.replace(tzinfo=UTC) == later + timedelta(seconds=60)
+
+    # Ожидающая повтора строка остаётся, доставленная и неудачная удаляются
+    assert purge_outbox(db, now + timedelta(days=1)) == 2
+    assert db.execute(select(NotificationOutbox.id)).scalars().all() == [retried.id]
+
+
+def test_claimed_rows_are_leased() -> None:
+    db = _make_db()
+    now = datetime(2026, 10, 19, 8, 0, tzinfo=UTC)
+    db.add(NotificationOutbox(user_id=1, kind="мягкое_уведомление", payload={"messages": ["привет"]}, next_attempt_at=now))
+    db.commit()
+
+    lease = timedelta(minutes=2)
+    assert len(claim_batch(db, now, batch_size=10, lease=lease)) == 1
+    # Строку забрал другой воркер: до конца аренды она недоступна, затем возвращается
+    assert claim_batch(db, now + timedelta(minutes=1), batch_size=10, lease=lease) == []
+    assert [item.attempts for item in claim_batch(db, now + timedelta(minutes=3), batch_size=10, lease=lease)] == [2]
+
+
+def test_results_are_recorded_before_a_crash_in_the_middle_of_a_batch() -> None:
+    db = _make_db()
+    now = datetime(2026, 10, 19, 8, 0, tzinfo=UTC)
+    for user_id in (1, 2, 3, 4):
+        db.add(NotificationOutbox(user_id=user_id, kind="мягкое_уведомление", payload={"messages": ["привет"]}, next_attempt_at=now))
+    db.commit()
+
+    batch = claim_batch(db, now, batch_size=10, lease=timedelta(minutes=2))
+    try:
+        deliver_batch(
+            db,
+            batch,
+            now,
+            transport=FakeTransport(crash_on={3}),
+            bucket=TokenBucket(1000),
+            concurrency=1,
+            max_attempts=5,
+            retry_base=timedelta(seconds=30),
+        )
+    except RuntimeError:
+        pass
+
+    # Отправленные до падения уже отмечены и повторно не уйдут
+    statuses = dict(db.execute(select(NotificationOutbox.user_id, NotificationOutbox.status)).all())
+    assert (statuses[1], statuses[2], statuses[3]) == ("sent", "sent", "pending")
@@ -0,0 +1,130 @@
+from datetime import UTC, datetime, timedelta
+import re
+
+from sqlalchemy import create_engine, literal, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import EventLog, NotificationSettings, PetState
+from app.services.economy import опыт_до_следующего_уровня
+from app.services.game import serialize_pet_state_for_event
+from app.services.notifications import (
+    DAILY_REPORT_ACTION,
+    SOFT_PUSH_ACTION,
+    daily_report_insert,
+    daily_summary_sql,
+    send_soft_pushes,
+    write_daily_reports,
+    xp_to_next_level_sql,
+)
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def _add_pet(db: Session, user_id: int, soft_push: bool | None, **stats: int) -> None:
+    db.add(PetState(user_id=user_id, **stats))
+    if soft_push is not None:
+        db.add(NotificationSettings(user_id=user_id, soft_push_enabled=soft_push))
+
+
+def test_soft_pushes_follow_settings_and_thresholds_across_chunks() -> None:
+    db = _make_db()
+    _add_pet(db, 1, True, hunger=10, energy=10)
+    _add_pet(db, 2, True)  # всё в норме
+    _add_pet(db, 3, False, hunger=5)  # уведомления выключены
+    _add_pet(db, 4, None, hunger=5)  # настроек нет
+    _add_pet(db, 5, True, health=39)
+    _add_pet(db, 6, True, hygiene=29)
+    db.commit()
+
+    now = datetime(2026, 10, 19, 8, 0, tzinfo=UTC)
+    assert send_soft_pushes(db, now, chunk_size=2) == 3
+
+    events = db.execute(select(EventLog).order_by(EventLog.user_id)).scalars().all()
+    assert [(event.user_id, event.action) for event in events] == [(1, SOFT_PUSH_ACTION), (5, SOFT_PUSH_ACTION), (6, SOFT_PUSH_ACTION)]
+    assert events[0].payload == {
+        "messages": ["Единорог проголодался", "Единорог устал"],
+        "created_by": "beat",
+        "time": now.isoformat(),
+    }
+    assert events[1].payload["messages"] == ["Единорогу нужно лечение"]
+
+
+def test_daily_reports_are_json_safe_and_follow_settings() -> None:
+    db = _make_db()
+    now = datetime(2026, 10, 19, 9, 0, tzinfo=UTC)
+    for user_id in (1, 2, 3):
+        db.add(PetState(user_id=user_id, level=2, last_active_at=now - timedelta(hours=30 if user_id == 1 else 1)))
+    db.add(NotificationSettings(user_id=1, daily_report_enabled=True))
+    db.add(NotificationSettings(user_id=2, daily_report_enabled=False))
+    db.add(NotificationSettings(user_id=3, daily_report_enabled=True))
+    db.commit()
+
+    assert write_daily_reports(db, now, chunk_size=1) == 2
+
+    events = db.execute(select(EventLog).order_by(EventLog.user_id)).scalars().all()
+    assert [(event.user_id, event.action) for event in events] == [(1, DAILY_REPORT_ACTION), (3, DAILY_REPORT_ACTION)]
+    summary = events[0].payload["summary"]
+    assert events[0].payload["created_by"] == "beat"
+    assert summary["is_lonely"] is True and events[1].payload["summary"]["is_lonely"] is False
+    assert summary["xp_to_next_level"] == 132 and summary["stage_title"] == "Малыш"
+    assert isinstance(summary["last_tick_at"], str)
+
+
+def test_daily_report_insert_is_single_insert_select() -> None:
+    sql = str(daily_report_insert(datetime(2026, 10, 19, tzinfo=UTC), 0, 50000).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("INSERT INTO event_logs (user_id, action, payload, created_at) SELECT")
+    assert "json_build_object" in sql and "JOIN notification_settings" in sql
+
+
+def test_sql_summary_has_the_same_keys_as_python_summary() -> None:
+    sql = str(daily_summary_sql(datetime(2026, 10, 19, tzinfo=UTC)).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("json_build_object(")
+    keys = re.findall(r"'(\w+)', ", sql)
+    db = _make_db()
+    pet = PetState(user_id=1)
+    db.add(pet)
+    db.commit()
+    assert keys == list(serialize_pet_state_for_event(pet))
+
+
+def test_sql_xp_to_next_level_rounds_like_python() -> None:
+    db = _make_db()
+    levels = range(1, 501)
+    computed = db.execute(select(*(xp_to_next_level_sql(literal(level)) for level in levels))).one()
+    assert list(computed) == [опыт_до_следующего_уровня(level) for level in levels]
+
+
+def test_soft_pushes_are_suppressed_until_cleared_or_cooldown() -> None:
+    db = _make_db()
+    _add_pet(db, 1, True, hunger=10)
+    _add_pet(db, 2, True, hunger=10)
+    db.commit()
+    now = datetime(2026, 10, 19, 8, 0, tzinfo=UTC)
+    cooldown = timedelta(hours=12)
+
+    assert send_soft_pushes(db, now, cooldown=cooldown) == 2
+    assert send_soft_pushes(db, now + timedelta(minutes=20), cooldown=cooldown) == 0
+
+    # Питомец 1 накормлен и снова голоден — уведомление сразу, питомец 2 молчит до конца cooldown
+    db.get(PetState, 1).hunger = 80
+    db.commit()
+    send_soft_pushes(db, now + timedelta(minutes=40), cooldown=cooldown)
+    db.get(PetState, 1).hunger = 10
+    db.commit()
+    assert send_soft_pushes(db, now + timedelta(hours=1), cooldown=cooldown) == 1
+    assert send_soft_pushes(db, now + timedelta(hours=12), cooldown=cooldown) == 1
+
+    events = db.execute(select(EventLog.user_id).order_by(EventLog.id)).scalars().all()
+    assert events == [1, 2, 1, 2]
+    # Новое условие у того же игрока не ждёт cooldown другого
+    db.get(PetState, 2).energy = 5
+    db.commit()
+    send_soft_pushes(db, now + timedelta(hours=13), cooldown=cooldown)
+    last = db.execute(select(EventLog).order_by(EventLog.id.desc()).limit(1)).scalar_one()
+    assert (last.user_id, last.payload["messages"]) == (2, ["Единорог устал"])
@@ -0,0 +1,45 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import MonthlySummary, Reward
+from app.services.partitions import add_months, maintain_partitions, month_start, partition_name
+from app.services.retention import rollup_rewards_range
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def test_month_bounds_and_partition_names() -> None:
+    start = month_start(datetime(2026, 11, 17, 23, 59, tzinfo=UTC))
+    assert start == datetime(2026, 11, 1, tzinfo=UTC)
+    assert add_months(start, 2) == datetime(2027, 1, 1, tzinfo=UTC)
+    assert add_months(start, -11) == datetime(2025, 12, 1, tzinfo=UTC)
+    assert partition_name("event_logs", add_months(start, 2)) == "event_logs_p2027_01"
+
+
+def test_sqlite_keeps_plain_tables_and_range_rollup_keeps_rows() -> None:
+    db = _make_db()
+    assert maintain_partitions(db) == {}
+
+    for created_at, coins in (
+        (datetime(2026, 1, 5, tzinfo=UTC), 10),
+        (datetime(2026, 1, 31, 23, 59, tzinfo=UTC), 5),
+        (datetime(2026, 2, 1, tzinfo=UTC), 7),
+    ):
+        db.add(Reward(user_id=3, source="test", coins_gained=coins, xp_gained=1, created_at=created_at))
+    db.commit()
+
+    counted = rollup_rewards_range(db, datetime(2026, 1, 1, tzinfo=UTC), datetime(2026, 2, 1, tzinfo=UTC))
+    db.commit()
+
+    assert counted == 2
+    summary = db.execute(select(MonthlySummary)).scalars().one()
+    assert (summary.month_key, summary.rewards_count, summary.coins_gained, summary.xp_gained) == ("2026-01", 2, 15, 2)
+    # Строки удаляет DROP секции, а не свёртка
+    assert db.execute(select(func.count()).select_from(Reward)).scalar_one() == 3
@@ -0,0 +1,78 @@
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import EventLog
+from app.services import event_writer, game, random_events
+from app.services.game import decay_pets, ensure_pet_state, execute_action
+from app.services.notifications import send_soft_pushes
+from app.services.pet_recovery import STATE_FIELDS, recover_pets
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def test_recovery_rebuilds_corrupted_pets_from_snapshot_and_replay(monkeypatch) -> None:
+    # Случайные события не журналируются дельтами; в тесте их отключаем
+    monkeypatch.setattr(random_events.random, "random", lambda: 1.0)
+    db = _make_db()
+    pet = ensure_pet_state(db, 1)
+    for action in ("feed", "play", "clean", "play", "wash"):
+        execute_action(db, pet, action)
+    ensure_pet_state(db, 2)
+    expected = {name: getattr(pet, name) for name in STATE_FIELDS if name != "last_tick_at"}
+
+    third = db.execute(select(EventLog).where(EventLog.user_id == 1).order_by(EventLog.id).offset(2)).scalars().first()
+    # «Плохой деплой»: после третьего события состояние испорчено
+    pet.coins, pet.level, pet.hunger, pet.character_energy = -500, 99, 0, 0
+    db.commit()
+
+    stats = recover_pets(db, third.created_at, chunk_size=1)
+
+    assert (stats.recovered, stats.skipped, stats.replayed_events) == (1, 1, 3)
+    db.refresh(pet)
+    assert {name: getattr(pet, name) for name in expected} == expected
+    assert pet.event_seq == 0
+
+
+def test_recovery_matches_live_pet_with_beat_decay_and_beat_rows(monkeypatch) -> None:
+    monkeypatch.setattr(random_events.random, "random", lambda: 1.0)
+    start = datetime(2026, 10, 19, 8, 0, tzinfo=UTC)
+    clock = {"now": start}
+    monkeypatch.setattr(game, "_now", lambda: clock["now"])
+    monkeypatch.setattr(event_writer, "utcnow", lambda: clock["now"])
+    db = _make_db()
+    pet = ensure_pet_state(db, 1)
+    pet.last_tick_at = start
+    db.commit()
+
+    def beat_until(moment: datetime) -> None:
+        # decay_all_pets раз в 10 минут; soft push пишет в журнал строку beat-задачи
+        while clock["now"] + timedelta(minutes=10) <= moment:
+            clock["now"] += timedelta(minutes=10)
+            decay_pets(db)
+            send_soft_pushes(db, clock["now"])
+        clock["now"] = moment
+
+    execute_action(db, pet, "feed")
+    good_before = start + timedelta(seconds=1)
+    beat_until(start + timedelta(hours=5, minutes=3))
+    execute_action(db, db.get(game.PetState, 1), "play")
+    beat_until(start + timedelta(hours=9, minutes=30))
+    assert db.execute(select(EventLog).where(EventLog.action != "feed", EventLog.action != "play")).first()
+
+    pet = db.get(game.PetState, 1)
+    expected = {name: getattr(pet, name) for name in STATE_FIELDS if name != "last_tick_at"}
+    pet.hunger, pet.health, pet.coins = 100, 100, -1
+    db.commit()
+
+    stats = recover_pets(db, good_before, now=clock["now"])
+
+    assert (stats.recovered, stats.replayed_events) == (1, 1)
+    db.refresh(pet)
+    assert {name: getattr(pet, name) for name in expected} == expected
@@ -0,0 +1,52 @@
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import DailyProgress, MonthlySummary, Reward
+from app.services.retention import rollup_daily_progress, rollup_rewards
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def _summary(db: Session, user_id: int, month_key: str) -> MonthlySummary:
+    return db.execute(
+        select(MonthlySummary).where(MonthlySummary.user_id == user_id, MonthlySummary.month_key == month_key)
+    ).scalar_one()
+
+
+def test_daily_progress_rollup_aggregates_and_deletes_old_rows() -> None:
+    db = _make_db()
+    done = {"task_key": "feed_count", "title": "", "target": 1, "progress": 1, "completed": True}
+    for day, bonus in (("2026-01-05", True), ("2026-01-06", False), ("2026-02-01", True)):
+        db.add(DailyProgress(user_id=1, date_key=day, tasks=[done], login_bonus_claimed=bonus, chest_claimed=False))
+    db.add(DailyProgress(user_id=1, date_key="2026-03-10", tasks=[], login_bonus_claimed=True, chest_claimed=False))
+    db.commit()
+
+    assert rollup_daily_progress(db, "2026-03-01", batch_size=2) == 3
+
+    january = _summary(db, 1, "2026-01")
+    assert (january.days_recorded, january.login_bonus_days, january.tasks_completed) == (2, 1, 2)
+    assert _summary(db, 1, "2026-02").days_recorded == 1
+    remaining = db.execute(select(DailyProgress.date_key)).scalars().all()
+    assert remaining == ["2026-03-10"]
+
+
+def test_rewards_rollup_is_additive_across_runs() -> None:
+    db = _make_db()
+    old = datetime(2026, 1, 15, tzinfo=UTC)
+    for offset in range(3):
+        db.add(Reward(user_id=7, source="мини_игра", xp_gained=10, coins_gained=5, created_at=old + timedelta(hours=offset)))
+    db.commit()
+
+    assert rollup_rewards(db, old + timedelta(hours=1), batch_size=10) == 1
+    assert rollup_rewards(db, old + timedelta(days=1), batch_size=10) == 2
+
+    summary = _summary(db, 7, "2026-01")
+    assert (summary.rewards_count, summary.xp_gained, summary.coins_gained) == (3, 30, 15)
+    assert db.execute(select(Reward)).first() is None
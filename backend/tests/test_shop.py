@@ -0,0 +1,182 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import EventLog, Inventory
+from app.schemas import ShopCatalogOut
+from app.services.game import (
+    _apply_progress_for_pet,
+    buy_shop_item,
+    buy_shop_items,
+    ensure_pet_state,
+    get_shop_catalog,
+    get_shop_catalog_json,
+    use_items,
+)
+from app.services.inventory import STARTER_PACK, apply_inventory_deltas, consume_items
+from app.services.shop import CATALOG, MAX_PRICE, catalog_payload, find_item, item_price
+
+
+def _make_db() -> Session:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)()
+
+
+def test_price_table_matches_formula_and_is_capped() -> None:
+    for level in (1, 2, 7, 20):
+        for item in CATALOG:
+            assert item_price(item, level) == int(round(item.base_price * 1.8**level))
+
+    assert all(item_price(item, 500) == MAX_PRICE for item in CATALOG)
+
+
+def test_catalog_indexes() -> None:
+    assert find_item("food_apple").title == "🍎 Яблоко"
+    assert find_item("missing") is None
+    assert len({item.item_key for item in CATALOG}) == len(CATALOG)
+
+
+def test_shop_catalog_marks_owned_items_without_mutating_shared_payload() -> None:
+    db = _make_db()
+    pet = ensure_pet_state(db, user_id=1)
+
+    items = {item["item_key"]: item for item in get_shop_catalog(db, pet)}
+    assert items["food_apple"]["owned"] is True
+    assert items["food_pizza"]["owned"] is False
+    assert items["food_apple"]["price"] == item_price(find_item("food_apple"), pet.level)
+
+    assert all("owned" not in item for item in catalog_payload(pet.level))
+    # Готовое JSON-тело совпадает со списком словарей и проходит схему ответа
+    body = json.loads(get_shop_catalog_json(db, pet))
+    assert body == {"items": list(items.values())}
+    assert ShopCatalogOut.model_validate(body).items[0].item_key == CATALOG[0].item_key
+
+
+def _quantity(db: Session, user_id: int, item_key: str) -> int:
+    row = db.execute(
+        select(Inventory).where(Inventory.user_id == user_id, Inventory.item_key == item_key)
+    ).scalar_one_or_none()
+    return row.quantity if row else 0
+
+
+def test_buy_with_quantity_charges_once_and_logs_single_event() -> None:
+    db = _make_db()
+    pet = ensure_pet_state(db, user_id=1)
+    before_coins = pet.coins
+    before_apples = _quantity(db, 1, "food_apple")
+
+    result = buy_shop_item(db, pet, "food_apple", quantity=3)
+
+    assert result.quantity == 3
+    assert result.total_price == result.price * 3
+    assert pet.coins == before_coins - result.total_price
+    assert _quantity(db, 1, "food_apple") == before_apples + 3
+    assert len(db.execute(select(EventLog)).scalars().all()) == 1
+
+
+def test_bulk_buy_writes_inventory_with_one_multi_row_upsert() -> None:
+    db = _make_db()
+    pet = ensure_pet_state(db, user_id=1)
+    statements: list[str] = []
+    event.listen(
+        db.get_bind(),
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    buy_shop_items(db, pet, [("food_apple", 2), ("food_carrot", 1), ("wash_soap", 4), ("food_apple", 1)])
+
+    inventory_writes = [sql for sql in statements if sql.startswith(("INSERT INTO inventories", "UPDATE inventories"))]
+    assert len(inventory_writes) == 1 and "ON CONFLICT" in inventory_writes[0]
+    assert (_quantity(db, 1, "food_apple"), _quantity(db, 1, "wash_soap")) == (11, 9)
+
+
+def test_bulk_buy_rejects_whole_order_when_coins_are_short() -> None:
+    db = _make_db()
+    pet = ensure_pet_state(db, user_id=1)
+    pet.coins = 5
+    db.commit()
+
+    with pytest.raises(ValueError):
+        buy_shop_items(db, pet, [("food_apple", 1), ("food_carrot", 1)])
+    assert pet.coins == 5
+
+
+def test_bulk_use_consumes_stock_and_aggregates_effects() -> None:
+    db = _make_db()
+    pet = ensure_pet_state(db, user_id=1)
+    pet.hunger = 10
+    db.commit()
+
+    result = use_items(db, pet, [("food_apple", 2), ("wash_soap", 1), ("food_apple", 1)])
+
+    assert _quantity(db, 1, "food_apple") == 5
+    assert _quantity(db, 1, "wash_soap") == 4
+    assert result.event.action == "use_items"
+    assert result.event.payload["deltas"]["hunger"] == 45
+    assert result.notifications[0] == "Использован: 🍎 Яблоко ×3"
+
+    with pytest.raises(ValueError):
+        use_items(db, pet, [("toy_ball", 4)])
+
+
+def _quantities(db: Session, user_id: int) -> dict[str, int]:
+    return dict(db.execute(select(Inventory.item_key, Inventory.quantity).where(Inventory.user_id == user_id)).all())
+
+
+def test_inventory_deltas_upsert_and_drop_empty_rows() -> None:
+    db = _make_db()
+    ensure_pet_state(db, user_id=1)
+    assert _quantities(db, 1) == STARTER_PACK
+
+    apply_inventory_deltas(db, 1, {"food_apple": 2, "toy_ball": -3, "food_pizza": 1})
+    quantities = _quantities(db, 1)
+    assert quantities["food_apple"] == STARTER_PACK["food_apple"] + 2
+    assert quantities["food_pizza"] == 1
+    assert "toy_ball" not in quantities
+
+
+def test_consume_refuses_to_go_below_zero() -> None:
+    db = _make_db()
+    ensure_pet_state(db, user_id=1)
+
+    with pytest.raises(ValueError):
+        consume_items(db, 1, {"toy_ball": STARTER_PACK["toy_ball"] + 1})
+    assert _quantities(db, 1)["toy_ball"] == STARTER_PACK["toy_ball"]
+
+
+def test_bulk_consume_costs_one_update_and_one_delete() -> None:
+    db = _make_db()
+    ensure_pet_state(db, user_id=1)
+    statements: list[str] = []
+    event.listen(
+        db.get_bind(),
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    consume_items(db, 1, {"food_apple": 2, "food_carrot": 5, "wash_soap": 1})
+
+    inventory_writes = [sql for sql in statements if sql.startswith(("UPDATE inventories", "DELETE FROM inventories"))]
+    assert len(inventory_writes) == 2
+    quantities = _quantities(db, 1)
+    assert (quantities["food_apple"], quantities["wash_soap"]) == (6, 4)
+    assert "food_carrot" not in quantities
+
+    # Одного предмета не хватает — весь заказ отклоняется
+    with pytest.raises(ValueError):
+        consume_items(db, 1, {"food_apple": 1, "toy_ball": STARTER_PACK["toy_ball"] + 1})
+
+
+def test_multi_level_grant_adds_all_decor_items() -> None:
+    db = _make_db()
+    pet = ensure_pet_state(db, user_id=1)
+
+    reward = _apply_progress_for_pet(db, pet, base_xp=5000, base_coins=0)
+    assert len(reward.levels) > 1
+    quantities = _quantities(db, 1)
+    assert all(quantities[f"украшение_уровень_{level}"] == 1 for level in reward.levels)
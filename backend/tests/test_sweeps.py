@@ -0,0 +1,104 @@
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import PetState, SweepCheckpoint
+from app.services import sweeps
+from app.services.sweeps import RedisLease, SweepProgress, acquire_lease, run_sweep
+
+
+def _make_session_factory() -> sessionmaker:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+
+
+def _chunked_sweep(seen: list[int], *, fail_after: int | None = None):
+    def body(db: Session, progress: SweepProgress) -> int:
+        while True:
+            chunk = db.execute(
+                select(PetState.user_id).where(PetState.user_id > progress.cursor).order_by(PetState.user_id).limit(2)
+            ).scalars().all()
+            if not chunk:
+                return len(seen)
+            if fail_after is not None and len(seen) >= fail_after:
+                raise RuntimeError("воркер упал")
+            seen.extend(chunk)
+            progress.advance(db, chunk[-1])
+            db.commit()
+
+    return body
+
+
+def test_crashed_sweep_resumes_from_last_completed_chunk() -> None:
+    factory = _make_session_factory()
+    with factory() as db:
+        db.add_all(PetState(user_id=user_id) for user_id in range(1, 8))
+        db.commit()
+
+    seen: list[int] = []
+    try:
+        run_sweep("decay_all_pets", _chunked_sweep(seen, fail_after=4), session_factory=factory)
+    except RuntimeError:
+        pass
+    assert seen == [1, 2, 3, 4]
+
+    resumed: list[int] = []
+    assert run_sweep("decay_all_pets", _chunked_sweep(resumed), session_factory=factory) == 3
+    assert resumed == [5, 6, 7]
+
+    # Завершённый обход начинается сначала
+    again: list[int] = []
+    run_sweep("decay_all_pets", _chunked_sweep(again), session_factory=factory)
+    assert again == list(range(1, 8))
+    with factory() as db:
+        checkpoint = db.execute(select(SweepCheckpoint)).scalar_one()
+        assert checkpoint.cursor == 7 and checkpoint.finished_at is not None
+
+
+def test_sweep_is_skipped_while_another_run_holds_the_lease() -> None:
+    factory = _make_session_factory()
+    with factory() as db:
+        lease = acquire_lease(db.get_bind(), "soft_push_notifications", 300)
+    assert lease is not None
+    try:
+        assert run_sweep("soft_push_notifications", lambda db, progress: 1, session_factory=factory) is None
+        # Другие обходы аренда не блокирует
+        assert run_sweep("daily_report", lambda db, progress: 1, session_factory=factory) == 1
+    finally:
+        lease.release()
+    assert run_sweep("soft_push_notifications", lambda db, progress: 1, session_factory=factory) == 1
+
+
+class ExpiringRedis:
+    """Ключ аренды «истекает» после renewals продлений."""
+
+    def __init__(self, renewals: int) -> None:
+        self.renewals = renewals
+
+    def set(self, *args, **kwargs) -> bool:
+        return True
+
+    def eval(self, script: str, *args) -> int:
+        if "pexpire" not in script:
+            return 1
+        self.renewals -= 1
+        return int(self.renewals >= 0)
+
+
+def test_sweep_stops_when_the_lease_is_lost(monkeypatch) -> None:
+    factory = _make_session_factory()
+    with factory() as db:
+        db.add_all(PetState(user_id=user_id) for user_id in range(1, 8))
+        db.commit()
+    monkeypatch.setattr(
+        sweeps, "acquire_lease", lambda engine, name, ttl: RedisLease(ExpiringRedis(renewals=1), f"sweep:{name}", ttl)
+    )
+
+    seen: list[int] = []
+    assert run_sweep("decay_all_pets", _chunked_sweep(seen), session_factory=factory) is None
+    # Вторая пачка не закоммичена: её обработает следующий владелец аренды
+    assert seen == [1, 2, 3, 4]
+    with factory() as db:
+        checkpoint = db.execute(select(SweepCheckpoint)).scalar_one()
+        assert checkpoint.cursor == 2 and checkpoint.finished_at is None